@@ -0,0 +1,207 @@
+"""
+Hastighetsbegränsning och tillträdeskontroll för anrop mot OpenAI.
+
+Varje modell har två token-hinkar, en för anrop per minut och en för
+uppskattade tokens per minut, samt ett tak för samtidiga anrop. Ett anrop
+som inte ryms direkt får vänta i en begränsad kö. Blir kön full, eller skulle
+väntan bli längre än tidsgränsen, avvisas förfrågan direkt med 429 eller 503
+och Retry-After i stället för att misslyckas långsamt hos OpenAI.
+"""
+
+import os
+import re
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException
+
+from prompts import count_tokens
+
+# Standardgränser för modeller utan egna inställningar (0 stänger av gränsen)
+DEFAULT_RPM = float(os.getenv("OPENAI_RPM", 500))
+DEFAULT_TPM = float(os.getenv("OPENAI_TPM", 30000))
+DEFAULT_MAX_CONCURRENT = int(os.getenv("OPENAI_MAX_CONCURRENT", 16))
+# Antal anrop som får vänta per modell och hur länge de får vänta
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 100))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+
+
+def _model_env(name: str, model: str, default: float) -> float:
+    """Läser t.ex. OPENAI_RPM_GPT_4O för modellen gpt-4o, annars standardvärdet."""
+    suffix = re.sub(r"\W", "_", model).upper()
+    return float(os.getenv(f"{name}_{suffix}", default))
+
+
+def _reject(status_code: int, retry_after: float, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class TokenBucket:
+    """
+    Token-hink som fylls på med `per_minute` per minut upp till en minuts förbrukning.
+
+    Reservationer får driva saldot under noll; underskottet anger hur länge
+    den som reserverade måste vänta innan anropet görs.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Reserverar `amount` och returnerar väntetiden i sekunder."""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+    def pause(self, seconds: float) -> None:
+        """Tömmer hinken så att nästa anrop tidigast kan göras om `seconds` sekunder."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class ModelLimiter:
+    """Gränser och väntekö för en modell."""
+
+    def __init__(
+        self,
+        model: str,
+        rpm: float,
+        tpm: float,
+        max_concurrent: int,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrent = max_concurrent
+        self._semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        return wait
+
+    def _refund(self, estimated_tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.refund(1)
+        if self.tokens is not None:
+            self.tokens.refund(estimated_tokens)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int) -> AsyncIterator[None]:
+        """
+        Väntar på plats för ett anrop och håller den tills blocket lämnas.
+
+        Kastar HTTPException 503 om kön är full eller om ingen plats blir ledig
+        inom tidsgränsen, och 429 om hastighetsgränserna inte medger anropet
+        inom tidsgränsen.
+        """
+        if self.waiting >= self.queue_size:
+            self.rejected += 1
+            raise _reject(503, self.queue_timeout / 2, "Servern är överbelastad, försök igen om en stund")
+
+        wait = self._reserve(estimated_tokens)
+        if wait > self.queue_timeout:
+            self._refund(estimated_tokens)
+            self.rejected += 1
+            raise _reject(429, wait, "För många förfrågningar just nu, försök igen om en stund")
+
+        deadline = time.monotonic() + self.queue_timeout
+        self.waiting += 1
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if self._semaphore is not None:
+                if self._semaphore.locked():
+                    timeout = max(0.0, deadline - time.monotonic())
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=timeout)
+                else:
+                    await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self._refund(estimated_tokens)
+            self.rejected += 1
+            raise _reject(503, self.queue_timeout / 2, "Servern är överbelastad, försök igen om en stund")
+        except asyncio.CancelledError:
+            self._refund(estimated_tokens)
+            raise
+        finally:
+            self.waiting -= 1
+
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def rate_limited(self, retry_after: Optional[float]) -> HTTPException:
+        """
+        Hanterar 429 från OpenAI: pausar modellens hinkar och returnerar felet till klienten.
+
+        Nya anrop väntar tills pausen är över, eller avvisas direkt om den
+        varar längre än köns tidsgräns.
+        """
+        retry_after = retry_after if retry_after and retry_after > 0 else 5.0
+        if self.requests is not None:
+            self.requests.pause(retry_after)
+        if self.tokens is not None:
+            self.tokens.pause(retry_after)
+        return _reject(429, retry_after, "OpenAI begränsar antalet anrop just nu, försök igen om en stund")
+
+
+_limiters: Dict[str, ModelLimiter] = {}
+
+
+def limiter_for(model: str) -> ModelLimiter:
+    """Delad begränsare för modellen, med inställningar från miljön."""
+    limiter = _limiters.get(model)
+    if limiter is None:
+        limiter = ModelLimiter(
+            model,
+            rpm=_model_env("OPENAI_RPM", model, DEFAULT_RPM),
+            tpm=_model_env("OPENAI_TPM", model, DEFAULT_TPM),
+            max_concurrent=int(_model_env("OPENAI_MAX_CONCURRENT", model, DEFAULT_MAX_CONCURRENT)),
+        )
+        _limiters[model] = limiter
+    return limiter
+
+
+def limiters() -> Dict[str, ModelLimiter]:
+    """Alla begränsare som skapats hittills, per modell."""
+    return dict(_limiters)
+
+
+def estimate_tokens(text: str, completion_tokens: int) -> int:
+    """Tokens för ett anrop: promptens tokens plus uppskattat antal svarstokens."""
+    return count_tokens(text) + completion_tokens
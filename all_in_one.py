@@ -65,12 +65,14 @@ def start_api_server():
     """Starta FastAPI-servern för backend"""
     try:
         # Importera nödvändiga bibliotek för API-servern
-        import base64
         from fastapi import FastAPI, File, Form, UploadFile, HTTPException
         from fastapi.middleware.cors import CORSMiddleware
-        from fastapi.responses import FileResponse
+        from fastapi.responses import FileResponse, Response
         import uvicorn
-        from openai import OpenAI
+        import upstream
+        from images import encode_data_url
+        from prompts import build_recipe_prompt
+        from library import LibraryIndex
     except ImportError:
         print("❌ Nödvändiga bibliotek saknas för API-servern. Kör 'pip install -r requirements.txt'")
         sys.exit(1)
@@ -87,8 +89,10 @@ def start_api_server():
         allow_headers=["*"],
     )
     
-    # Konfigurera OpenAI API-klient
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # Stäng den delade OpenAI-klientens anslutningspool vid nedstängning
+    @app.on_event("shutdown")
+    async def shutdown_upstream():
+        await upstream.close_client()
     
     # Hemstartsida
     @app.get("/")
@@ -102,35 +106,22 @@ def start_api_server():
         recipes_dir.mkdir(exist_ok=True)
 
     print(f"📁 Använder receptbiblioteksmapp: {recipes_dir}")
-    # Lista innehållet i mappen för att kontrollera att den hittas
-    print(f"📚 Biblioteksinnehåll: {list(recipes_dir.glob('*.txt'))}")
+    library_index = LibraryIndex(str(recipes_dir))
+    
+    @app.on_event("startup")
+    async def start_library_index():
+        await library_index.start()
+    
+    @app.on_event("shutdown")
+    async def stop_library_index():
+        await library_index.stop()
     
     # API-slutpunkt för att lista alla recept i biblioteket
     @app.get("/api/library/recipes")
     async def list_library_recipes() -> List[dict]:
-        """Listar alla recept i biblioteksmappen."""
+        """Listar alla recept i biblioteksmappen från indexet i minnet."""
         try:
-            recipes = []
-            for file in recipes_dir.glob("*.txt"):
-                # Läs första raden som titel
-                try:
-                    with open(file, "r", encoding="utf-8") as f:
-                        first_line = f.readline().strip()
-                        title = first_line if first_line else file.stem.replace("_", " ").title()
-                except:
-                    title = file.stem.replace("_", " ").title()
-                    
-                recipes.append({
-                    "id": file.stem,
-                    "filename": file.name,
-                    "title": title,
-                    "size": file.stat().st_size,
-                    "date": file.stat().st_mtime
-                })
-                
-            # Sortera efter senast ändrad
-            recipes.sort(key=lambda x: x["date"], reverse=True)
-            return recipes
+            return Response(content=library_index.list_json(), media_type="application/json")
         except Exception as e:
             print(f"Fel vid listning av biblioteksrecept: {str(e)}")
             traceback.print_exc()
@@ -187,90 +178,25 @@ def start_api_server():
                 if not os.getenv("OPENAI_API_KEY"):
                     raise HTTPException(status_code=500, detail="OpenAI API-nyckel saknas")
                 
-                # Konvertera bilddata till base64
-                base64_image = base64.b64encode(file_content).decode('utf-8')
+                # Konvertera bilddata till en base64-kodad data-URL
+                image_url = encode_data_url(file_content, file.content_type or "image/jpeg")
                 
                 # Analysera bild med OpenAI
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": "Detta är en bild av mitt kylskåp. Lista alla ingredienser och råvaror du kan identifiera i bilden. Var specifik och detaljerad. Lista råvarorna på svenska."
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{base64_image}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=500
-                )
-                
-                # Extrahera listan med råvaror från svaret
-                varulista = response.choices[0].message.content
+                varulista = await upstream.analyze_fridge_image(image_url)
             
             else:
                 raise HTTPException(status_code=400, detail="Ogiltigt val")
 
             # Skapa prompt med användarinmatning
-            prompt = f"""
-Nedan finns en lista över tillgängliga varor. Skriv ett recept med fokus på "Longevity" (långt liv) som är:
-- Svårighetsgrad: {difficulty}
-- Måltid: {meal_type}
-- Antal personer: {num_people}
-- Föredraget kök/stilriktning: {cuisine_pref}
-- Kostpreferenser: {dietary_pref}
-
-Receptet ska innehålla ingredienser som är kända för att främja ett långt och hälsosamt liv, som till exempel:
-- Baljväxter (bönor, linser)
-- Fullkorn
-- Nötter och frön
-- Bär och färska frukter
-- Gröna bladgrönsaker
-- Fisk rik på omega-3 (om inte vegetariskt/veganskt)
-- Fermenterade livsmedel
-- Olivolja och andra hälsosamma fetter
-
-Struktur för svaret:
-1) Förslag på rätt:
-   - En kort kommentar om vad rätten heter, vilket land/ursprung den har, och varför den är bra för ett långt liv.
-
-2) Gör såhär:
-   - En mycket kortfattad beskrivning av hur man tillagar rätten.
-
-3) Ingredienser du har:
-   - Ange vilka av de tillgängliga varorna som används och hur mycket.
-
-4) Har du?:
-   - Lista eventuella småingredienser (salt, peppar, tomatpuré etc.) som inte är avgörande för rätten.
-
-5) Longevity-fördelar:
-   - En kort förklaring om hur ingredienserna i rätten bidrar till ett långt och hälsosamt liv.
-
-Ditt svar ska vara på svenska.
-
-Lista över tillgängliga varor:
-{varulista}
-"""
+            prompt = build_recipe_prompt(varulista, difficulty, meal_type, num_people, cuisine_pref, dietary_pref)
 
             # Skicka frågan till modellen
-            response = client.chat.completions.create(
-                model="gpt-4-turbo",
-                messages=[{"role": "user", "content": prompt}]
-            )
-
-            # Hämta och returnera svaret
-            recipe = response.choices[0].message.content
+            recipe = await upstream.generate_recipe_text(prompt)
             
             return {"recipe": recipe}
             
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
     
@@ -1,19 +1,42 @@
 import os
-import base64
-import traceback
-from typing import Optional, List
-from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request
+import json
+import asyncio
+import logging
+from typing import Optional, List, AsyncIterator, Tuple, Callable, Union
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
-from openai import OpenAI
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 import uvicorn
 from dotenv import load_dotenv
-import pathlib
 
 # Ladda miljövariabler från .env-fil
 load_dotenv()
 
+# Loggning via en kö till en bakgrundstråd, innan modulerna börjar logga
+from logs import RequestIdMiddleware, request_id, setup_logging
+setup_logging()
+logger = logging.getLogger("api")
+
+# Lokala moduler läser sin konfiguration från miljön vid import
+import upstream
+from cache import make_key, recipe_cache, vision_cache
+from images import prepare_image, encode_data_url
+from uploads import UploadLimitMiddleware, UPLOAD_LIMITS, read_upload
+from library import library_index, content_digest, parse_fields, project
+from search import SearchIndex, snippet
+from recipe_store import RecipeStore
+from http_cache import make_etag, cached_response, not_modified_response, content_disposition
+from static_assets import static_assets
+from singleflight import SingleFlight
+from matching import IngredientMatcher
+from jobs import JobQueue, JobStore, FINISHED
+from prompts import build_recipe_prompt, prepare_inventory
+from recipe_schema import OUTPUT_FORMATS
+from admission import limiters
+from resilience import CLOSED, breakers
+from hedging import recipe_hedger
+import metrics
+
 app = FastAPI(title="Longevity Recept API")
 
 # Konfigurera CORS för att tillåta förfrågningar från frontend
@@ -25,36 +48,434 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Montera statiska filer
-app.mount("/static", StaticFiles(directory="."), name="static")
+# Avvisa för stora uppladdningar med 413 innan de buffras
+app.add_middleware(UploadLimitMiddleware, paths=("/generate", "/jobs", "/api/library/match"))
+
+# Tid och antal pågående förfrågningar per route för /metrics; ligger utanför
+# uppladdningsgränsen så att även avvisade uppladdningar mäts
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Ytterst: ger varje förfrågan ett id (X-Request-ID) som följer med i loggarna
+app.add_middleware(RequestIdMiddleware)
 
-# Konfigurera OpenAI API-klient
+
+# Konfigurera OpenAI API-klient (den delade asynkrona klienten skapas i upstream.py)
 api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
 if not api_key:
-    print("Varning: OPENAI_API_KEY miljövariabel är inte inställd")
+    logger.warning("OPENAI_API_KEY miljövariabel är inte inställd")
 else:
-    print(f"API-nyckel hittad: {api_key[:5]}...{api_key[-4:]}")
+    # Inga delar av nyckeln loggas
+    logger.info("API-nyckel hittad")
+
+# Tolkade recept som sparas mellan omstarter; registreras först så att posterna
+# är uppdaterade innan övriga lyssnare körs
+recipe_store = RecipeStore(library_index.path)
+library_index.add_listener(recipe_store.update)
+
+# Fulltextindex som uppdateras när biblioteksindexet ser ändrade filer
+search_index = SearchIndex(library_index.path)
+library_index.add_listener(search_index.update)
 
+# Ingrediensindex för att hitta färdiga recept som täcks av en varulista
+ingredient_matcher = IngredientMatcher(library_index.path)
+library_index.add_listener(ingredient_matcher.update)
+# Lägsta täckning för att ett biblioteksrecept ska ersätta ett nytt (library_first)
+LIBRARY_MATCH_MIN_COVERAGE = float(os.getenv("LIBRARY_MATCH_MIN_COVERAGE", 0.8))
+
+# Samtidiga identiska anrop slås ihop, separat för bildanalys och receptgenerering
+vision_flight = SingleFlight("bildanalys")
+recipe_flight = SingleFlight("receptgenerering")
+
+@app.on_event("startup")
+async def start_library_index():
+    # Läs in statiska filer och indexera receptbiblioteket och börja bevaka ändringar
+    await asyncio.to_thread(static_assets.load)
+    await library_index.start()
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_upstream():
+    # Avsluta jobben, stäng anslutningspoolen mot OpenAI och sluta bevaka biblioteket
+    await job_queue.stop()
+    await upstream.close_client()
+    await library_index.stop()
+    recipe_store.close()
+
+# Sidor och skript serveras ur minnet (static_assets.py)
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    try:
-        with open("index.html", "r", encoding="utf-8") as f:
-            html_content = f.read()
-        return HTMLResponse(content=html_content)
-    except Exception as e:
-        return {"message": f"Kunde inte läsa index.html: {str(e)}"}
+async def root(request: Request):
+    return static_assets.response(request, "index.html")
+
+@app.get("/index.html", response_class=HTMLResponse)
+async def get_index_page(request: Request):
+    return static_assets.response(request, "index.html")
 
 @app.get("/styles.css")
-async def get_css():
-    return FileResponse("styles.css", media_type="text/css")
+async def get_css(request: Request):
+    return static_assets.response(request, "styles.css")
 
 @app.get("/script.js")
-async def get_js():
-    return FileResponse("script.js", media_type="application/javascript")
+async def get_js(request: Request):
+    return static_assets.response(request, "script.js")
+
+@app.get("/recipe_render.js")
+async def get_recipe_render_js(request: Request):
+    return static_assets.response(request, "recipe_render.js")
+
+@app.get("/assets/{filename}")
+async def get_fingerprinted_asset(request: Request, filename: str):
+    # Adresser med innehållshash, cachas som immutable
+    return static_assets.fingerprinted_response(request, filename)
+
+@app.get("/static/{filename}")
+async def get_static_file(request: Request, filename: str):
+    # Tidigare monterades hela projektmappen här; nu bara frontendfilerna
+    return static_assets.response(request, filename)
+
+def _decode_inventory(file_content: bytes) -> str:
+    """Avkodar en uppladdad inventarielista (choice=1)."""
+    try:
+        varulista = file_content.decode("utf-8")
+        logger.debug("Textfil avkodad, längd: %d tecken", len(varulista))
+        return varulista
+    except UnicodeDecodeError:
+        logger.info("Fel vid avkodning av textfil")
+        raise HTTPException(status_code=400, detail="Filen är inte en giltig textfil")
+
+async def _analyze_image(file_content: bytes, content_type: Optional[str]) -> str:
+    """Låter OpenAI lista råvarorna i en uppladdad kylskåpsbild (choice=2)."""
+    # Samma bild har kanske redan analyserats, t.ex. med andra receptparametrar
+    fingerprint = await vision_cache.fingerprint(file_content)
+    cached = vision_cache.get(fingerprint)
+    if cached is not None:
+        logger.info("Bildanalys hämtad från cache", extra={"cache": "HIT"})
+        return cached
+    
+    # Samma bild som redan analyseras delar på samma anrop, oavsett receptparametrar
+    return await vision_flight.do(fingerprint, lambda: _run_vision(file_content, content_type, fingerprint))
+
+async def _run_vision(file_content: bytes, content_type: Optional[str], fingerprint: str) -> str:
+    """Förbehandlar bilden, anropar vision-modellen och sparar svaret i cachen."""
+    # Rotera, skala ner och koda om bilden innan den skickas till OpenAI
+    try:
+        with metrics.stage("image_prepare"):
+            image = await prepare_image(file_content)
+    except ValueError as e:
+        logger.info("Ogiltig bild: %s", e)
+        raise HTTPException(status_code=400, detail="Filen är inte en giltig bild")
+    logger.debug(
+        "Bild förbehandlad: %d -> %d bytes, %dx%d, %s, detail=%s",
+        len(file_content), len(image.data), image.width, image.height, image.mime_type, image.detail,
+    )
+    
+    try:
+        # Koda bilden till en data-URL i ett enda steg
+        with metrics.stage("image_encode"):
+            image_url = encode_data_url(image.data, image.mime_type)
+        logger.debug("Bild kodad till data-URL, längd: %d tecken", len(image_url))
+        
+        # Verifiera att API-nyckeln är inställd
+        if not api_key:
+            logger.error("Saknar API-nyckel")
+            raise HTTPException(status_code=500, detail="OpenAI API-nyckel saknas")
+        
+        # Skriv ut information om bilden
+        logger.debug("Skickar bild till OpenAI, filtyp: %s -> %s, bildstorlek: %d", content_type, image.mime_type, len(image.data))
+        
+        # Analysera bild med OpenAI
+        try:
+            with metrics.stage("vision"):
+                varulista = await upstream.analyze_fridge_image(image_url, image.detail)
+            logger.info("Bilden analyserad framgångsrikt, svarslängd: %d tecken", len(varulista))
+            vision_cache.set(fingerprint, varulista)
+            return varulista
+            
+        except HTTPException:
+            # Avvisad av tillträdeskontrollen (429/503) eller av OpenAI med 429
+            raise
+        except Exception as api_error:
+            logger.exception("OpenAI API-fel: %s", api_error)
+            error_details = str(api_error)
+            raise HTTPException(status_code=500, detail=f"Fel vid bildanalys: {error_details}")
+    
+    except HTTPException:
+        raise
+    except Exception as img_error:
+        logger.exception("Bildhanteringsfel: %s", img_error)
+        raise HTTPException(status_code=500, detail=f"Fel vid bildhantering: {str(img_error)}")
+
+def _output_format(output: Optional[str]) -> str:
+    """Tolkar formulärfältet output: text (standard) eller json."""
+    value = (output or "text").strip().lower()
+    if value not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"output måste vara {' eller '.join(OUTPUT_FORMATS)}")
+    return value
+
+def _is_json(prompt_params: dict) -> bool:
+    return prompt_params.get("output") == "json"
+
+def _recipe_cache_key(varulista: str, prompt_params: dict) -> str:
+    """Skapar cachenyckeln för ett recept av normaliserade promptindata."""
+    model = upstream.RECIPE_JSON_MODEL if _is_json(prompt_params) else upstream.RECIPE_MODEL
+    # Varulistan som den skickas i prompten; radernas ordning och skiftläge påverkar inte nyckeln
+    inventory = sorted({line.lower() for line in prepare_inventory(varulista).splitlines()})
+    payload = {"model": model, "inventory": inventory}
+    payload.update({name: str(value or "").strip().lower() for name, value in prompt_params.items()})
+    return make_key("recipe", payload)
+
+def _cache_policy(request: Request) -> tuple:
+    """
+    Tolkar Cache-Control och Pragma från klienten.
+    
+    Returnerar (läs från cache, skriv till cache). `no-cache` ger ett nytt recept
+    som sedan sparas, `no-store` varken läser eller skriver cachen.
+    """
+    directives = f"{request.headers.get('cache-control', '')},{request.headers.get('pragma', '')}".lower()
+    no_store = "no-store" in directives
+    no_cache = no_store or "no-cache" in directives
+    return not no_cache, not no_store
+
+async def _resolve_recipe(
+    varulista: str, prompt_params: dict, cache_policy: tuple = (True, True)
+) -> Tuple[Union[str, dict], str]:
+    """
+    Hämtar ett recept från cachen, en identisk pågående generering eller modellen.
+    
+    Returnerar (recept, värde för X-Cache). Med output=json är receptet ett
+    objekt enligt RECIPE_SCHEMA, annars text.
+    """
+    read_cache, write_cache = cache_policy
+    # Använd ett tidigare genererat recept för samma indata om det finns
+    cache_key = _recipe_cache_key(varulista, prompt_params)
+    if read_cache:
+        recipe = await recipe_cache.get(cache_key)
+        if recipe is not None:
+            logger.info("Recept hämtat från cache", extra={"cache": "HIT"})
+            # Strukturerade recept sparas som JSON-text i cachen
+            return (json.loads(recipe) if _is_json(prompt_params) else recipe), "HIT"
+    
+    # Skapa prompt med användarinmatning
+    with metrics.stage("prompt_build"):
+        prompt = build_recipe_prompt(varulista, **prompt_params)
+    
+    # Skicka frågan till modellen, eller vänta på en identisk som redan pågår
+    coalesced = cache_key in recipe_flight
+    recipe = await recipe_flight.do(
+        cache_key, lambda: _generate_recipe(prompt, cache_key, write_cache, _is_json(prompt_params))
+    )
+    if coalesced:
+        return recipe, "COALESCED"
+    return recipe, "MISS" if read_cache else "BYPASS"
+
+async def _generate_recipe(prompt: str, cache_key: str, write_cache: bool, structured: bool = False) -> Union[str, dict]:
+    """Genererar ett recept och sparar det i cachen."""
+    if structured:
+        logger.debug("Skickar prompt för strukturerat recept")
+        with metrics.stage("recipe"):
+            recipe = await upstream.generate_recipe_json(prompt)
+        logger.info("Strukturerat recept genererat: %s", recipe["name"])
+        if write_cache:
+            await recipe_cache.set(cache_key, json.dumps(recipe, ensure_ascii=False))
+        return recipe
+    logger.debug("Skickar prompt till %s", upstream.RECIPE_MODEL)
+    with metrics.stage("recipe"):
+        recipe = await upstream.generate_recipe_text(prompt)
+    logger.info("Recept genererat framgångsrikt, längd: %d tecken", len(recipe))
+    if write_cache:
+        await recipe_cache.set(cache_key, recipe)
+    return recipe
+
+async def _library_match(varulista: str) -> Optional[dict]:
+    """
+    Letar efter ett recept i biblioteket som varulistan täcker tillräckligt väl.
+    
+    Returnerar svaret som ska skickas i stället för ett nytt recept, eller None.
+    """
+    matches = ingredient_matcher.match(varulista, limit=1, min_coverage=LIBRARY_MATCH_MIN_COVERAGE)
+    if not matches:
+        return None
+    match = matches[0]
+    try:
+        recipe = await asyncio.to_thread(library_index.path(match["id"]).read_text, encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return None
+    logger.info(
+        "Recept hämtat från biblioteket: %s (täckning %s)", match["id"], match["coverage"], extra={"cache": "LIBRARY"}
+    )
+    return {
+        "recipe": recipe,
+        "source": "library",
+        "library_id": match["id"],
+        "coverage": match["coverage"],
+    }
+
+def _wants_library(library_first: Optional[str]) -> bool:
+    return (library_first or "").strip().lower() in ("1", "true", "on", "yes")
+
+# Server-Sent Events för strömmande generering
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Stäng av buffring i nginx-liknande proxyer
+}
+
+def _sse(event: str, data: dict) -> str:
+    """Formaterar en händelse enligt text/event-stream."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _error_event(e: HTTPException) -> dict:
+    """Felet som SSE-data; retry_after följer med när servern eller OpenAI är överbelastade."""
+    data = {"status": e.status_code, "detail": e.detail}
+    retry_after = (e.headers or {}).get("Retry-After")
+    if retry_after is not None:
+        data["retry_after"] = int(retry_after)
+    return data
+
+async def _heartbeats(task: asyncio.Future) -> AsyncIterator[str]:
+    """Skickar kommentarer tills uppgiften är klar, så att proxyer håller anslutningen vid liv."""
+    while not task.done():
+        await asyncio.wait({task}, timeout=SSE_HEARTBEAT_SECONDS)
+        if not task.done():
+            yield ": keep-alive\n\n"
+
+async def _recipe_events(
+    varulista: Optional[str],
+    file_content: bytes,
+    content_type: Optional[str],
+    prompt_params: dict,
+    cache_policy: tuple = (True, True),
+    library_first: bool = False,
+) -> AsyncIterator[str]:
+    """
+    Kör genereringen och strömmar steg och tokens som SSE-händelser.
+    
+    Händelser: stage (received, image_analysed, library_match, cache_hit,
+    coalesced, recipe_generating), token, done och error. Med output=json
+    skickas inga tokens, eftersom ett halvt JSON-objekt inte går att visa;
+    done innehåller då receptet som objekt.
+    """
+    read_cache, write_cache = cache_policy
+    image_task = None
+    recipe_task = None
+    try:
+        yield _sse("stage", {"stage": "received"})
+        
+        if varulista is None:  # Bild på kylskåp
+            yield _sse("stage", {"stage": "analysing_image"})
+            image_task = asyncio.ensure_future(_analyze_image(file_content, content_type))
+            async for comment in _heartbeats(image_task):
+                yield comment
+            varulista = image_task.result()
+            yield _sse("stage", {"stage": "image_analysed", "ingredients": varulista})
+        
+        if library_first:
+            found = await _library_match(varulista)
+            if found is not None:
+                yield _sse("stage", {"stage": "library_match", "library_id": found["library_id"], "coverage": found["coverage"]})
+                yield _sse("token", {"text": found["recipe"]})
+                yield _sse("done", found)
+                return
+        
+        if _is_json(prompt_params):
+            yield _sse("stage", {"stage": "recipe_generating"})
+            recipe_task = asyncio.ensure_future(_resolve_recipe(varulista, prompt_params, cache_policy))
+            async for comment in _heartbeats(recipe_task):
+                yield comment
+            recipe, cache = recipe_task.result()
+            yield _sse("done", {"recipe": recipe, "cache": cache})
+            return
+        
+        cache_key = _recipe_cache_key(varulista, prompt_params)
+        if read_cache:
+            cached = await recipe_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Recept hämtat från cache", extra={"cache": "HIT"})
+                yield _sse("stage", {"stage": "cache_hit"})
+                yield _sse("token", {"text": cached})
+                yield _sse("done", {"recipe": cached})
+                return
+        
+        # Ett identiskt recept genereras redan: vänta på det och skicka det i ett stycke
+        flight = recipe_flight.join(cache_key)
+        if flight is not None:
+            yield _sse("stage", {"stage": "coalesced"})
+            recipe = await flight.result()
+            yield _sse("token", {"text": recipe})
+            yield _sse("done", {"recipe": recipe})
+            return
+        
+        with metrics.stage("prompt_build"):
+            prompt = build_recipe_prompt(varulista, **prompt_params)
+        
+        logger.debug("Strömmar prompt till %s", upstream.RECIPE_MODEL)
+        yield _sse("stage", {"stage": "recipe_generating"})
+        # Genereringen körs som ett eget arbete så att andra identiska förfrågningar
+        # kan vänta på samma resultat; tokens skickas hit via en kö
+        tokens: asyncio.Queue = asyncio.Queue()
+        
+        async def produce() -> str:
+            parts = []
+            try:
+                with metrics.stage("recipe"):
+                    async for delta in upstream.stream_recipe_text(prompt):
+                        parts.append(delta)
+                        tokens.put_nowait(delta)
+            finally:
+                tokens.put_nowait(None)
+            recipe = "".join(parts)
+            logger.info("Recept strömmat framgångsrikt, längd: %d tecken", len(recipe))
+            if write_cache:
+                await recipe_cache.set(cache_key, recipe)
+            return recipe
+        
+        recipe_task = asyncio.ensure_future(recipe_flight.start(cache_key, produce).result())
+        while True:
+            delta = await tokens.get()
+            if delta is None:
+                break
+            yield _sse("token", {"text": delta})
+        recipe = await recipe_task
+        yield _sse("done", {"recipe": recipe})
+        
+    except HTTPException as e:
+        yield _sse("error", _error_event(e))
+    except Exception as e:
+        logger.exception("Oväntat fel vid strömning: %s", e)
+        yield _sse("error", {"status": 500, "detail": str(e)})
+    finally:
+        # Avbryt bildanalysen och genereringen om klienten kopplat ner innan de blev klara;
+        # arbeten som andra förfrågningar väntar på fortsätter
+        if image_task is not None and not image_task.done():
+            image_task.cancel()
+        if recipe_task is not None and not recipe_task.done():
+            recipe_task.cancel()
+
+def _stream_recipe(
+    choice: str,
+    file_content: bytes,
+    content_type: Optional[str],
+    prompt_params: dict,
+    cache_policy: tuple = (True, True),
+    library_first: bool = False,
+) -> StreamingResponse:
+    """Validerar indata och returnerar ett strömmande SSE-svar."""
+    if choice == "1":
+        varulista = _decode_inventory(file_content)
+    elif choice == "2":
+        varulista = None
+    else:
+        raise HTTPException(status_code=400, detail="Ogiltigt val")
+    
+    return StreamingResponse(
+        _recipe_events(varulista, file_content, content_type, prompt_params, cache_policy, library_first),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 @app.post("/generate")
 async def generate_recipe(
+    request: Request,
+    response: Response,
     choice: str = Form(...),
     file: UploadFile = File(...),
     difficulty: str = Form(...),
@@ -62,6 +483,8 @@ async def generate_recipe(
     num_people: str = Form(...),
     cuisine_pref: Optional[str] = Form(""),
     dietary_pref: Optional[str] = Form(""),
+    library_first: Optional[str] = Form(""),
+    output: Optional[str] = Form(""),
 ):
     """
     Generera ett longevity-recept baserat på användarinmatning och en fil med råvaror.
@@ -73,226 +496,648 @@ async def generate_recipe(
     - num_people: Antal personer
     - cuisine_pref: Föredraget kök (valfritt)
     - dietary_pref: Kostpreferenser (valfritt)
+    - library_first: "1" för att först leta efter ett färdigt recept i biblioteket
+      som varulistan täcker; träffen returneras då med source="library"
+    - output: "json" för ett strukturerat recept enligt RECIPE_SCHEMA i stället
+      för text (valfritt)
+    
+    Med `Accept: text/event-stream` strömmas svaret som i /generate/stream.
+    Identiska förfrågningar besvaras från cachen (se X-Cache); skicka
+    `Cache-Control: no-cache` för att få ett nytt recept.
     """
     try:
-        print(f"Begäran mottagen: choice={choice}, filnamn={file.filename}, filstorlek={file.size if hasattr(file, 'size') else 'okänd'}")
+        logger.info("Begäran mottagen", extra={"choice": choice, "upload": file.filename, "size": file.size})
+        
+        if choice not in UPLOAD_LIMITS:
+            raise HTTPException(status_code=400, detail="Ogiltigt val")
+        
+        # Läs filinnehåll i bitar med en storleksgräns per filtyp
+        file_content = await read_upload(file, UPLOAD_LIMITS[choice])
+        logger.debug("Fil läst, storlek: %d bytes", len(file_content))
         
-        # Läs filinnehåll
-        varulista = ""
-        file_content = await file.read()
-        print(f"Fil läst, storlek: {len(file_content)} bytes")
+        prompt_params = dict(
+            difficulty=difficulty,
+            meal_type=meal_type,
+            num_people=num_people,
+            cuisine_pref=cuisine_pref,
+            dietary_pref=dietary_pref,
+            output=_output_format(output),
+        )
+        
+        cache_policy = _cache_policy(request)
+        
+        if "text/event-stream" in request.headers.get("accept", ""):
+            return _stream_recipe(
+                choice, file_content, file.content_type, prompt_params, cache_policy, _wants_library(library_first)
+            )
         
         # Behandla baserat på val
         if choice == "1":  # Textfil med inventarielista
-            try:
-                varulista = file_content.decode("utf-8")
-                print(f"Textfil avkodad, längd: {len(varulista)} tecken")
-            except UnicodeDecodeError:
-                print("Fel vid avkodning av textfil")
-                raise HTTPException(status_code=400, detail="Filen är inte en giltig textfil")
-                
+            varulista = _decode_inventory(file_content)
         elif choice == "2":  # Bild på kylskåp
-            try:
-                # Konvertera bilddata till base64
-                base64_image = base64.b64encode(file_content).decode('utf-8')
-                print(f"Bild kodad till base64, längd: {len(base64_image)} tecken")
-                
-                # Verifiera att API-nyckeln är inställd
-                if not api_key:
-                    print("Saknar API-nyckel")
-                    raise HTTPException(status_code=500, detail="OpenAI API-nyckel saknas")
-                
-                # Skriv ut information om bilden
-                print(f"Skickar bild till OpenAI, filtyp: {file.content_type}, bildstorlek: {len(file_content)}")
-                
-                # Analysera bild med OpenAI
-                try:
-                    response = client.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "text", 
-                                        "text": "Detta är en bild av mitt kylskåp. Lista alla ingredienser och råvaror du kan identifiera i bilden. Var specifik och detaljerad. Lista råvarorna på svenska."
-                                    },
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {
-                                            "url": f"data:image/jpeg;base64,{base64_image}"
-                                        }
-                                    }
-                                ]
-                            }
-                        ],
-                        max_tokens=500
-                    )
-                    
-                    # Extrahera listan med råvaror från svaret
-                    varulista = response.choices[0].message.content
-                    print(f"Bilden analyserad framgångsrikt, svarslängd: {len(varulista)} tecken")
-                    
-                except Exception as api_error:
-                    print(f"OpenAI API-fel: {str(api_error)}")
-                    error_details = str(api_error)
-                    traceback.print_exc()
-                    raise HTTPException(status_code=500, detail=f"Fel vid bildanalys: {error_details}")
-            
-            except Exception as img_error:
-                print(f"Bildhanteringsfel: {str(img_error)}")
-                traceback.print_exc()
-                raise HTTPException(status_code=500, detail=f"Fel vid bildhantering: {str(img_error)}")
+            varulista = await _analyze_image(file_content, file.content_type)
         else:
             raise HTTPException(status_code=400, detail="Ogiltigt val")
 
-        # Skapa prompt med användarinmatning
-        prompt = f"""
-Nedan finns en lista över tillgängliga varor. Skriv ett recept med fokus på "Longevity" (långt liv) som är:
-- Svårighetsgrad: {difficulty}
-- Måltid: {meal_type}
-- Antal personer: {num_people}
-- Föredraget kök/stilriktning: {cuisine_pref}
-- Kostpreferenser: {dietary_pref}
-
-Receptet ska innehålla ingredienser som är kända för att främja ett långt och hälsosamt liv, som till exempel:
-- Baljväxter (bönor, linser)
-- Fullkorn
-- Nötter och frön
-- Bär och färska frukter
-- Gröna bladgrönsaker
-- Fisk rik på omega-3 (om inte vegetariskt/veganskt)
-- Fermenterade livsmedel
-- Olivolja och andra hälsosamma fetter
-
-Struktur för svaret:
-1) Förslag på rätt:
-   - En kort kommentar om vad rätten heter, vilket land/ursprung den har, och varför den är bra för ett långt liv.
-
-2) Gör såhär:
-   - En mycket kortfattad beskrivning av hur man tillagar rätten.
-
-3) Ingredienser du har:
-   - Ange vilka av de tillgängliga varorna som används och hur mycket.
-
-4) Har du?:
-   - Lista eventuella småingredienser (salt, peppar, tomatpuré etc.) som inte är avgörande för rätten.
-
-5) Longevity-fördelar:
-   - En kort förklaring om hur ingredienserna i rätten bidrar till ett långt och hälsosamt liv.
-
-Ditt svar ska vara på svenska.
-
-Lista över tillgängliga varor:
-{varulista}
-"""
-
-        # Skicka frågan till modellen
-        print("Skickar prompt till GPT-4...")
-        response = client.chat.completions.create(
-            model="gpt-4-turbo",  # använder GPT-4 för bättre resultat
-            messages=[{"role": "user", "content": prompt}]
-        )
+        # Ett befintligt recept i biblioteket slipper anropet till modellen helt
+        if _wants_library(library_first):
+            found = await _library_match(varulista)
+            if found is not None:
+                response.headers["X-Cache"] = "LIBRARY"
+                return found
 
-        # Hämta och returnera svaret
-        recipe = response.choices[0].message.content
-        print(f"Recept genererat framgångsrikt, längd: {len(recipe)} tecken")
-        
+        recipe, response.headers["X-Cache"] = await _resolve_recipe(varulista, prompt_params, cache_policy)
         return {"recipe": recipe}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Oväntat fel: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Oväntat fel: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/recipes.html")
-async def get_recipes_page():
+@app.post("/generate/stream")
+async def generate_recipe_stream(
+    request: Request,
+    choice: str = Form(...),
+    file: UploadFile = File(...),
+    difficulty: str = Form(...),
+    meal_type: str = Form(...),
+    num_people: str = Form(...),
+    cuisine_pref: Optional[str] = Form(""),
+    dietary_pref: Optional[str] = Form(""),
+    library_first: Optional[str] = Form(""),
+    output: Optional[str] = Form(""),
+):
+    """
+    Som /generate, men strömmar receptet token för token via Server-Sent Events.
+    
+    Händelser:
+    - stage: received, analysing_image, image_analysed, library_match, cache_hit, coalesced, recipe_generating
+    - token: {"text": ...} för varje ny textbit från modellen
+    - done: {"recipe": ...} med hela receptet
+    - error: {"status": ..., "detail": ...}
+    
+    Med output=json skickas inga token-händelser, bara done med receptet som objekt.
+    """
+    logger.info("Strömmande begäran mottagen", extra={"choice": choice, "upload": file.filename})
+    if choice not in UPLOAD_LIMITS:
+        raise HTTPException(status_code=400, detail="Ogiltigt val")
+    output = _output_format(output)
+    file_content = await read_upload(file, UPLOAD_LIMITS[choice])
+    return _stream_recipe(
+        choice,
+        file_content,
+        file.content_type,
+        dict(
+            difficulty=difficulty,
+            meal_type=meal_type,
+            num_people=num_people,
+            cuisine_pref=cuisine_pref,
+            dietary_pref=dietary_pref,
+            output=output,
+        ),
+        _cache_policy(request),
+        _wants_library(library_first),
+    )
+
+# Batchgenerering av flera måltider från samma inventarielista
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_MAX_MEALS = int(os.getenv("BATCH_MAX_MEALS", 14))
+_MEAL_FIELDS = ("difficulty", "meal_type", "num_people", "cuisine_pref", "dietary_pref", "output")
+
+def _parse_meals(meals: str, defaults: dict) -> List[dict]:
+    """Tolkar måltidslistan (JSON) och fyller i saknade fält från formulärets standardvärden."""
     try:
-        with open("recipes.html", "r", encoding="utf-8") as f:
-            html_content = f.read()
-        return HTMLResponse(content=html_content)
-    except Exception as e:
-        return {"message": f"Kunde inte läsa recipes.html: {str(e)}"}
+        parsed = json.loads(meals)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="meals måste vara en JSON-lista")
+    if not isinstance(parsed, list) or not parsed:
+        raise HTTPException(status_code=400, detail="meals måste vara en icke-tom JSON-lista")
+    if len(parsed) > BATCH_MAX_MEALS:
+        raise HTTPException(status_code=400, detail=f"Högst {BATCH_MAX_MEALS} måltider per förfrågan")
+    
+    result = []
+    for index, meal in enumerate(parsed):
+        if not isinstance(meal, dict):
+            raise HTTPException(status_code=400, detail=f"Måltid {index} måste vara ett objekt")
+        params = {name: str(meal.get(name) or defaults.get(name) or "") for name in _MEAL_FIELDS}
+        missing = [name for name in ("difficulty", "meal_type", "num_people") if not params[name]]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Måltid {index} saknar {', '.join(missing)}")
+        params["output"] = _output_format(params["output"])
+        result.append(params)
+    return result
 
-@app.get("/recipes.js")
-async def get_recipes_js():
-    return FileResponse("recipes.js", media_type="application/javascript")
+def _start_batch(varulista: str, meals: List[dict], cache_policy: tuple) -> List[asyncio.Task]:
+    """Startar en generering per måltid, högst BATCH_CONCURRENCY åt gången."""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run(index: int, params: dict) -> dict:
+        async with semaphore:
+            try:
+                recipe, cache = await _resolve_recipe(varulista, params, cache_policy)
+                return {"index": index, "meal": params, "recipe": recipe, "cache": cache}
+            except HTTPException as e:
+                return {"index": index, "meal": params, "error": _error_event(e)}
+            except Exception as e:
+                logger.exception("Fel vid generering av måltid %d: %s", index, e)
+                return {"index": index, "meal": params, "error": {"status": 500, "detail": str(e)}}
+    
+    return [asyncio.ensure_future(run(index, params)) for index, params in enumerate(meals)]
 
-@app.get("/library_browse.html")
-async def get_library_page():
+async def _batch_events(
+    varulista: Optional[str],
+    file_content: bytes,
+    content_type: Optional[str],
+    meals: List[dict],
+    cache_policy: tuple,
+) -> AsyncIterator[str]:
+    """
+    Strömmar batchens resultat som SSE-händelser i den ordning de blir klara.
+    
+    Händelser: stage (received, analysing_image, image_analysed, recipes_generating),
+    result ({"index", "meal", "recipe", "cache"} eller {"index", "meal", "error"}),
+    done ({"count": ...}) och error.
+    """
+    image_task = None
+    pending = set()
     try:
-        with open("library_browse.html", "r", encoding="utf-8") as f:
-            html_content = f.read()
-        return HTMLResponse(content=html_content)
+        yield _sse("stage", {"stage": "received"})
+        if varulista is None:
+            yield _sse("stage", {"stage": "analysing_image"})
+            image_task = asyncio.ensure_future(_analyze_image(file_content, content_type))
+            async for comment in _heartbeats(image_task):
+                yield comment
+            varulista = image_task.result()
+            yield _sse("stage", {"stage": "image_analysed", "ingredients": varulista})
+        
+        yield _sse("stage", {"stage": "recipes_generating", "count": len(meals)})
+        pending = set(_start_batch(varulista, meals, cache_policy))
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=SSE_HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                yield ": keep-alive\n\n"
+            for task in done:
+                yield _sse("result", task.result())
+        yield _sse("done", {"count": len(meals)})
+    
+    except HTTPException as e:
+        yield _sse("error", _error_event(e))
     except Exception as e:
-        return {"message": f"Kunde inte läsa library_browse.html: {str(e)}"}
+        logger.exception("Oväntat fel vid batchgenerering: %s", e)
+        yield _sse("error", {"status": 500, "detail": str(e)})
+    finally:
+        # Klienten har kopplat ner: avbryt det som återstår
+        if image_task is not None and not image_task.done():
+            image_task.cancel()
+        for task in pending:
+            task.cancel()
+
+@app.post("/generate/batch")
+async def generate_batch(
+    request: Request,
+    choice: str = Form(...),
+    file: UploadFile = File(...),
+    meals: str = Form(...),
+    difficulty: Optional[str] = Form(""),
+    meal_type: Optional[str] = Form(""),
+    num_people: Optional[str] = Form(""),
+    cuisine_pref: Optional[str] = Form(""),
+    dietary_pref: Optional[str] = Form(""),
+    output: Optional[str] = Form(""),
+):
+    """
+    Genererar flera recept, t.ex. en veckomeny, från en och samma inventarielista.
+    
+    - choice: 1 för textfil med inventarielista, 2 för bild på kylskåp
+    - file: Uppladdad fil (txt eller bild); en bild analyseras bara en gång
+    - meals: JSON-lista med måltider, t.ex. [{"meal_type": "lunch", "difficulty": "enkel", "num_people": 2}]
+    - difficulty, meal_type, num_people, cuisine_pref, dietary_pref, output:
+      Standardvärden för måltider som saknar fältet
+    
+    Recepten genereras parallellt, högst BATCH_CONCURRENCY åt gången. Svaret är
+    {"results": [...]} i måltidernas ordning; med `Accept: text/event-stream`
+    strömmas varje resultat så snart det är klart.
+    """
+    try:
+        logger.info("Batchbegäran mottagen", extra={"choice": choice, "upload": file.filename})
+        if choice not in UPLOAD_LIMITS:
+            raise HTTPException(status_code=400, detail="Ogiltigt val")
+        
+        meal_list = _parse_meals(meals, dict(
+            difficulty=difficulty,
+            meal_type=meal_type,
+            num_people=num_people,
+            cuisine_pref=cuisine_pref,
+            dietary_pref=dietary_pref,
+            output=output,
+        ))
+        file_content = await read_upload(file, UPLOAD_LIMITS[choice])
+        varulista = _decode_inventory(file_content) if choice == "1" else None
+        cache_policy = _cache_policy(request)
+        
+        if "text/event-stream" in request.headers.get("accept", ""):
+            return StreamingResponse(
+                _batch_events(varulista, file_content, file.content_type, meal_list, cache_policy),
+                media_type="text/event-stream",
+                headers=SSE_HEADERS,
+            )
+        
+        if varulista is None:
+            varulista = await _analyze_image(file_content, file.content_type)
+        tasks = _start_batch(varulista, meal_list, cache_policy)
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return {"results": results}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Oväntat fel vid batchgenerering: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Asynkrona jobb: genereringen körs av en arbetarpool och hämtas med GET /jobs/{id}
+async def _run_job(job_input: dict, report: Callable[..., None]) -> dict:
+    """Kör ett jobb från POST /jobs och returnerar det som /generate skulle ha svarat."""
+    # Jobbets loggposter får samma id som förfrågan som skapade det
+    request_id.set(job_input["request_id"])
+    varulista = job_input["varulista"]
+    if varulista is None:
+        report("analysing_image")
+        varulista = await _analyze_image(job_input["file_content"], job_input["content_type"])
+        report("image_analysed", ingredients=varulista)
+    
+    if job_input["library_first"]:
+        found = await _library_match(varulista)
+        if found is not None:
+            return dict(found, cache="LIBRARY")
+    
+    report("recipe_generating")
+    recipe, cache = await _resolve_recipe(varulista, job_input["prompt_params"], job_input["cache_policy"])
+    return {"recipe": recipe, "cache": cache}
+
+job_queue = JobQueue(_run_job, JobStore())
+
+async def _job_events(job_id: str) -> AsyncIterator[str]:
+    """
+    Strömmar jobbets status som SSE tills det är klart.
+    
+    Händelser: job (jobbet vid varje ändring, sist med status done eller failed).
+    """
+    while True:
+        # Hämta händelsen före jobbet så att ingen ändring däremellan missas;
+        # för jobb som är klara eller inte finns skapas ingen
+        changed = job_queue.changed(job_id)
+        try:
+            job = await job_queue.get(job_id)
+            if job is None:
+                yield _sse("error", {"status": 404, "detail": "Jobbet finns inte"})
+                return
+            yield _sse("job", job)
+            if changed is None or job["status"] in FINISHED:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+        finally:
+            # Även när klienten kopplar ner mitt i strömmen
+            job_queue.forget(job_id, changed)
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    request: Request,
+    response: Response,
+    choice: str = Form(...),
+    file: UploadFile = File(...),
+    difficulty: str = Form(...),
+    meal_type: str = Form(...),
+    num_people: str = Form(...),
+    cuisine_pref: Optional[str] = Form(""),
+    dietary_pref: Optional[str] = Form(""),
+    library_first: Optional[str] = Form(""),
+    output: Optional[str] = Form(""),
+):
+    """
+    Lägger en generering i kön och svarar direkt med jobbet (202).
+    
+    Tar samma formulär som /generate. Resultatet hämtas med GET /jobs/{id},
+    som svarar med status queued, running, done (med result) eller failed
+    (med error). Jobbet finns kvar JOB_TTL_SECONDS efter att det blivit klart.
+    """
+    logger.info("Jobb mottaget", extra={"choice": choice, "upload": file.filename})
+    if choice not in UPLOAD_LIMITS:
+        raise HTTPException(status_code=400, detail="Ogiltigt val")
+    output = _output_format(output)
+    file_content = await read_upload(file, UPLOAD_LIMITS[choice])
+    # Textfilen avkodas direkt så att ett ogiltigt innehåll ger 400 i stället för ett misslyckat jobb
+    varulista = _decode_inventory(file_content) if choice == "1" else None
+    job = await job_queue.submit(dict(
+        varulista=varulista,
+        file_content=file_content if varulista is None else b"",
+        content_type=file.content_type,
+        prompt_params=dict(
+            difficulty=difficulty,
+            meal_type=meal_type,
+            num_people=num_people,
+            cuisine_pref=cuisine_pref,
+            dietary_pref=dietary_pref,
+            output=output,
+        ),
+        cache_policy=_cache_policy(request),
+        library_first=_wants_library(library_first),
+        request_id=request_id.get(),
+    ))
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    """
+    Jobbets status och, när det är klart, resultat eller fel.
+    
+    Med `Accept: text/event-stream` skickas jobbet som en job-händelse vid
+    varje ändring tills det är klart, i stället för att klienten pollar.
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Jobbet finns inte")
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(_job_events(job_id), media_type="text/event-stream", headers=SSE_HEADERS)
+    headers = {"Cache-Control": "no-store"}
+    if job["status"] not in FINISHED:
+        headers["Retry-After"] = "2"
+    return JSONResponse(job, headers=headers)
+
+# Mätvärden: räknare som redan finns i cacher, köer och begränsare läses först vid hämtning
+def _component_metrics() -> List[metrics.Family]:
+    """Mätvärden från cacherna, sammanslagningen, OpenAI-skydden, jobbkön och biblioteket."""
+    family = metrics.family
+    caches = {"recipe": recipe_cache.memory, "vision": vision_cache.memory}
+    flights = (vision_flight, recipe_flight)
+    model_limiters = limiters()
+    model_breakers = breakers()
+    hedge = recipe_hedger.stats()
+    
+    def per_cache(value: Callable) -> list:
+        return [({"cache": name}, value(cache)) for name, cache in caches.items()]
+    
+    def per_flight(value: Callable) -> list:
+        return [({"flight": flight.name}, value(flight)) for flight in flights]
+    
+    def per_model(items: dict, value: Callable) -> list:
+        return [({"model": model}, value(item)) for model, item in items.items()]
+    
+    return [
+        family("cache_hits_total", "counter", "Träffar i minnescachen", per_cache(lambda c: c.hits)),
+        family("cache_misses_total", "counter", "Missar i minnescachen", per_cache(lambda c: c.misses)),
+        family("cache_entries", "gauge", "Poster i minnescachen", per_cache(len)),
+        family("cache_bytes", "gauge", "Minnescachens storlek i byte", per_cache(lambda c: c.total_bytes)),
+        family("singleflight_started_total", "counter", "Startade arbeten", per_flight(lambda f: f.started)),
+        family("singleflight_joined_total", "counter", "Förfrågningar som väntade på ett pågående arbete", per_flight(lambda f: f.joined)),
+        family("singleflight_in_flight", "gauge", "Pågående arbeten", per_flight(len)),
+        family("openai_requests_in_flight", "gauge", "Pågående anrop mot OpenAI", per_model(model_limiters, lambda l: l.active)),
+        family("openai_admission_waiting", "gauge", "Anrop som väntar på tillträde", per_model(model_limiters, lambda l: l.waiting)),
+        family("openai_admission_admitted_total", "counter", "Anrop som släppts igenom", per_model(model_limiters, lambda l: l.admitted)),
+        family("openai_admission_rejected_total", "counter", "Anrop som avvisats med 429 eller 503", per_model(model_limiters, lambda l: l.rejected)),
+        family("openai_breaker_open", "gauge", "1 om kretsbrytaren är öppen eller halvöppen", per_model(model_breakers, lambda b: int(b.state != CLOSED))),
+        family("openai_breaker_opened_total", "counter", "Gånger kretsbrytaren öppnats", per_model(model_breakers, lambda b: b.opened)),
+        family("openai_breaker_rejected_total", "counter", "Anrop som avvisats av en öppen kretsbrytare", per_model(model_breakers, lambda b: b.rejected)),
+        family("hedge_requests_total", "counter", "Receptanrop med säkring påslagen", [({}, hedge["requests"])]),
+        family("hedge_fired_total", "counter", "Startade säkrande anrop", [({}, hedge["fired"])]),
+        family("hedge_won_total", "counter", "Säkrande anrop som vann", [({}, hedge["won"])]),
+        family("hedge_skipped_total", "counter", "Säkrande anrop som hoppats över när budgeten var slut", [({}, hedge["skipped"])]),
+        family("jobs_total", "counter", "Jobb per utfall", [
+            ({"outcome": "submitted"}, job_queue.submitted),
+            ({"outcome": "completed"}, job_queue.completed),
+            ({"outcome": "failed"}, job_queue.failed),
+            ({"outcome": "rejected"}, job_queue.rejected),
+        ]),
+        family("jobs_active", "gauge", "Jobb som väntar eller körs", [
+            ({"status": "running"}, job_queue.running),
+            ({"status": "queued"}, len(job_queue) - job_queue.running),
+        ]),
+        family("library_recipes", "gauge", "Recept i biblioteksindexet", [({}, len(library_index))]),
+    ]
+
+metrics.add_collector(_component_metrics)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Mätvärden i Prometheus textformat: tider per steg, tokens, cacher, köer och fel."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE, headers={"Cache-Control": "no-store"})
+
+@app.get("/recipes.html", response_class=HTMLResponse)
+async def get_recipes_page(request: Request):
+    return static_assets.response(request, "recipes.html")
+
+@app.get("/recipes.js")
+async def get_recipes_js(request: Request):
+    return static_assets.response(request, "recipes.js")
+
+@app.get("/library_browse.html", response_class=HTMLResponse)
+async def get_library_page(request: Request):
+    return static_assets.response(request, "library_browse.html")
 
 @app.get("/library_browse.js")
-async def get_library_js():
-    return FileResponse("library_browse.js", media_type="application/javascript")
+async def get_library_js(request: Request):
+    return static_assets.response(request, "library_browse.js")
 
 @app.get("/api/library/recipes")
-async def list_library_recipes() -> List[dict]:
+async def list_library_recipes(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: str = "date",
+    order: Optional[str] = Query(None, pattern="^(asc|desc)$"),
+    fields: Optional[str] = None,
+):
     """
     Listar alla recept i biblioteksmappen.
+    
+    Svaret kommer från det färdigsorterade indexet i minnet, som hålls
+    aktuellt när filer läggs till, ändras eller tas bort.
+    
+    - limit: Antal recept per sida; ger svaret {"items", "next_cursor", "total"}
+    - cursor: next_cursor från föregående sida
+    - sort: date, title eller size (standard date)
+    - order: asc eller desc (standard nyast, A-Ö respektive störst först)
+    - fields: Kommaseparerade fält att ta med, t.ex. id,title
+    
+    Utan limit returneras hela listan som en array, som tidigare. Svaren har
+    ETag och Last-Modified; en oförändrad lista ger 304.
     """
     try:
-        recipes_dir = pathlib.Path("recipes_library")
-        if not recipes_dir.exists():
-            return []
+        if limit is None and cursor is None and sort == "date" and order is None and fields is None:
+            return cached_response(
+                request,
+                library_index.list_json(),
+                "application/json",
+                make_etag(library_index.list_hash()),
+                library_index.last_modified,
+            )
         
-        recipes = []
-        for file in recipes_dir.glob("*.txt"):
-            # Läs första raden som titel
-            try:
-                with open(file, "r", encoding="utf-8") as f:
-                    first_line = f.readline().strip()
-                    title = first_line if first_line else file.stem.replace("_", " ").title()
-            except:
-                title = file.stem.replace("_", " ").title()
-                
-            recipes.append({
-                "id": file.stem,
-                "filename": file.name,
-                "title": title,
-                "size": file.stat().st_size,
-                "date": file.stat().st_mtime
-            })
-            
-        # Sortera efter senast ändrad
-        recipes.sort(key=lambda x: x["date"], reverse=True)
-        return recipes
+        # Samma index och samma parametrar ger alltid samma svar
+        etag = make_etag(library_index.list_hash(), request.url.query)
+        not_modified = not_modified_response(request, etag, library_index.last_modified)
+        if not_modified is not None:
+            return not_modified
+        
+        try:
+            selected_fields = parse_fields(fields)
+            descending = None if order is None else order == "desc"
+            items, next_cursor = library_index.page(sort, descending, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        items = project(items, selected_fields)
+        if limit is not None:
+            items = {"items": items, "next_cursor": next_cursor, "total": len(library_index)}
+        return cached_response(
+            request,
+            json.dumps(items, ensure_ascii=False).encode("utf-8"),
+            "application/json",
+            etag,
+            library_index.last_modified,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Fel vid listning av biblioteksrecept: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/library/search")
+async def search_library(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Söker i receptbiblioteket på titel, ingredienser och instruktioner.
+    
+    - q: Sökord, t.ex. "linser morot"
+    - limit: Max antal träffar (standard 20)
+    
+    Returnerar rankade träffar med id, filename, title, score och ett utdrag.
+    """
+    try:
+        # Sökindexet uppdateras i samma svep som listan, så listans hash gäller även här
+        etag = make_etag(library_index.list_hash(), "search", request.url.query)
+        not_modified = not_modified_response(request, etag, library_index.last_modified)
+        if not_modified is not None:
+            return not_modified
+        
+        results, total = search_index.search(q, limit)
+        # Utdragen tas ur de förtolkade posterna i stället för att läsa filerna
+        for result in results:
+            result["filename"] = f"{result['id']}.txt"
+            result["snippet"] = snippet(recipe_store.lines(result["id"]), q)
+        body = {"query": q, "total": total, "results": results}
+        return cached_response(
+            request,
+            json.dumps(body, ensure_ascii=False).encode("utf-8"),
+            "application/json",
+            etag,
+            library_index.last_modified,
+        )
+    except Exception as e:
+        logger.exception("Fel vid sökning i biblioteket: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/library/match")
+async def match_library(
+    file: UploadFile = File(...),
+    limit: int = Form(5, ge=1, le=50),
+    min_coverage: float = Form(0.0, ge=0.0, le=1.0),
+):
+    """
+    Matchar en uppladdad inventarielista mot ingredienserna i biblioteket.
+    
+    - file: Textfil med inventarielista, som för choice=1 i /generate
+    - limit: Max antal träffar (standard 5)
+    - min_coverage: Lägsta andel av receptets ingredienser som ska finnas i listan
+    
+    Returnerar recept med coverage, overlap samt matchade och saknade ingredienser,
+    bäst täckta först. Inget anrop görs till OpenAI.
+    """
+    try:
+        varulista = _decode_inventory(await read_upload(file, UPLOAD_LIMITS["1"]))
+        matches = ingredient_matcher.match(varulista, limit, min_coverage)
+        for match in matches:
+            match["filename"] = f"{match['id']}.txt"
+        return {"matches": matches}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Fel vid listning av biblioteksrecept: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Fel vid matchning mot biblioteket: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/library/recipes/{recipe_id}")
-async def get_library_recipe(recipe_id: str):
+async def get_library_recipe(
+    request: Request,
+    recipe_id: str,
+    format: str = Query("text", pattern="^(text|json)$"),
+):
     """
     Hämtar ett specifikt recept från biblioteket.
+    
+    - format: text för receptfilen som den är (standard), json för den tolkade
+      posten med title, description, portions, ingredients, steps och tips
+    
+    Svaren har ETag (innehållets hash) och Last-Modified och besvaras med 304
+    när klientens kopia gäller. Textformatet stöder Range.
     """
     try:
-        filename = f"{recipe_id}.txt"
-        file_path = pathlib.Path("recipes_library") / filename
+        entry = library_index.get(recipe_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Receptet hittades inte")
+        content_hash = library_index.content_hash(recipe_id) or ""
+        
+        if format == "json":
+            etag = make_etag(content_hash, "json")
+            not_modified = not_modified_response(request, etag, entry["date"])
+            if not_modified is not None:
+                return not_modified
+            record = recipe_store.get(recipe_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail="Receptet hittades inte")
+            body = {**record, "filename": entry["filename"], "size": entry["size"], "date": entry["date"]}
+            return cached_response(
+                request,
+                json.dumps(body, ensure_ascii=False).encode("utf-8"),
+                "application/json",
+                etag,
+                entry["date"],
+            )
         
-        if not file_path.exists():
+        not_modified = not_modified_response(request, make_etag(content_hash), entry["date"], ranges=True)
+        if not_modified is not None:
+            return not_modified
+        try:
+            content = await asyncio.to_thread(library_index.path(recipe_id).read_bytes)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Receptet hittades inte")
-            
-        return FileResponse(
-            path=str(file_path), 
-            filename=filename,
-            media_type="text/plain; charset=utf-8"
+        # ETag av det som faktiskt lästs, ifall filen ändrats sedan indexeringen
+        return cached_response(
+            request,
+            content,
+            "text/plain",
+            make_etag(content_digest(content)),
+            entry["date"],
+            ranges=True,
+            headers={"Content-Disposition": content_disposition(entry["filename"])},
         )
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Fel vid hämtning av biblioteksrecept: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Fel vid hämtning av biblioteksrecept: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     # Starta API-servern
     port = int(os.getenv("PORT", 8000))
-    print(f"Startar server på port {port}...")
+    logger.info("Startar server på port %d", port)
     uvicorn.run("api:app", host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""
+Cacheskikt för Longevity Receptgenerator.
+
+Innehåller en LRU-cache i minnet med TTL och storleksgränser, en valfri
+diskcache som överlever omstarter och en kombination av de två. Nycklar
+skapas som en SHA-256 över en kanonisk JSON-representation av indata.
+"""
+
+import os
+import json
+import logging
+import time
+import hashlib
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow behövs bara för perceptuell hashning
+    Image = None
+
+from uploads import BufferReader
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(namespace: str, payload: dict) -> str:
+    """Skapar en stabil cachenyckel av en namnrymd och en dict med indata."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class LRUCache:
+    """
+    LRU-cache i minnet med TTL, max antal poster och max total storlek.
+
+    Storleken för varje värde beräknas med `sizeof` (standard: len).
+    Cachen är inte trådsäker och är tänkt att användas från event-loopen.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 24 * 3600,
+        sizeof: Callable[[Any], int] = len,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, size, expires_at = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl_seconds)
+        self.total_bytes += size
+        # Kasta de äldst använda posterna tills gränserna uppfylls
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+
+class DiskCache:
+    """
+    Enkel diskcache med en JSON-fil per nyckel.
+
+    Filerna skrivs atomiskt och poster äldre än TTL ignoreras och tas bort
+    när de läses. Metoderna är blockerande och körs via TieredCache i en tråd.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float = 7 * 24 * 3600):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+
+    def _path(self, key: str) -> Path:
+        namespace, _, digest = key.rpartition(":")
+        return self.directory / f"{namespace or 'default'}-{digest}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("created", 0) + self.ttl_seconds < time.time():
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        return entry.get("value")
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "value": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class TieredCache:
+    """Minnescache framför en valfri diskcache. Diskanrop körs utanför event-loopen."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        value = await asyncio.to_thread(self.disk.get, key)
+        if value is not None:
+            # Värm upp minnescachen med posten från disk
+            self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value)
+            except OSError as e:
+                logger.warning("Kunde inte skriva till diskcachen: %s", e)
+
+
+def perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """
+    Beräknar en 64-bitars dHash av en bild, eller None om bilden inte kan läsas.
+
+    Hashen är i stort sett densamma för omkodade eller lätt skalade kopior av
+    samma bild, till skillnad från en kryptografisk hash av filens byte.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(BufferReader(image_bytes)) as img:
+            img.draft("L", (64, 64))  # Snabb nedskalad avkodning av JPEG
+            pixels = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+class VisionCache:
+    """
+    Cache för bildanalyser (varulistor) nycklad på bildens innehåll.
+
+    Exakta kopior hittas via SHA-256 av bildens byte. Med `perceptual=True`
+    jämförs även en dHash, så att nästan identiska omkodningar av samma foto
+    återanvänder analysen om Hamming-avståndet är högst `max_distance`.
+    """
+
+    def __init__(self, memory: LRUCache, perceptual: bool = False, max_distance: int = 4):
+        self.memory = memory
+        self.perceptual = perceptual and Image is not None
+        self.max_distance = max_distance
+        self._phashes: "OrderedDict[str, int]" = OrderedDict()
+
+    async def fingerprint(self, image_bytes: bytes) -> Tuple[str, Optional[int]]:
+        """Returnerar (cachenyckel, perceptuell hash). Beräknas utanför event-loopen."""
+        return await asyncio.to_thread(self._fingerprint, image_bytes)
+
+    def _fingerprint(self, image_bytes: bytes) -> Tuple[str, Optional[int]]:
+        key = f"vision:{hashlib.sha256(image_bytes).hexdigest()}"
+        phash = perceptual_hash(image_bytes) if self.perceptual else None
+        return key, phash
+
+    def get(self, fingerprint: Tuple[str, Optional[int]]) -> Optional[str]:
+        key, phash = fingerprint
+        value = self.memory.get(key)
+        if value is not None or phash is None:
+            return value
+        for other_key, other_phash in list(self._phashes.items()):
+            if other_key not in self.memory:
+                # Posten har kastats ur minnescachen
+                del self._phashes[other_key]
+                continue
+            if bin(phash ^ other_phash).count("1") <= self.max_distance:
+                value = self.memory.get(other_key)
+                if value is not None:
+                    return value
+        return None
+
+    def set(self, fingerprint: Tuple[str, Optional[int]], value: str) -> None:
+        key, phash = fingerprint
+        self.memory.set(key, value)
+        if phash is not None:
+            self._phashes[key] = phash
+            # Håll hashregistret lika stort som minnescachen
+            while len(self._phashes) > self.memory.max_entries:
+                self._phashes.popitem(last=False)
+
+
+def _recipe_cache_from_env() -> TieredCache:
+    """Skapar receptcachen utifrån miljövariabler."""
+    memory = LRUCache(
+        max_entries=int(os.getenv("RECIPE_CACHE_MAX_ENTRIES", 1000)),
+        max_bytes=int(os.getenv("RECIPE_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+        ttl_seconds=float(os.getenv("RECIPE_CACHE_TTL_SECONDS", 24 * 3600)),
+        sizeof=lambda value: len(value.encode("utf-8")),
+    )
+    disk_dir = os.getenv("RECIPE_CACHE_DIR", "")
+    disk = None
+    if disk_dir:
+        disk = DiskCache(disk_dir, ttl_seconds=float(os.getenv("RECIPE_CACHE_DISK_TTL_SECONDS", 7 * 24 * 3600)))
+    return TieredCache(memory, disk)
+
+
+def _vision_cache_from_env() -> VisionCache:
+    """Skapar cachen för bildanalyser utifrån miljövariabler."""
+    memory = LRUCache(
+        max_entries=int(os.getenv("VISION_CACHE_MAX_ENTRIES", 500)),
+        max_bytes=int(os.getenv("VISION_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+        ttl_seconds=float(os.getenv("VISION_CACHE_TTL_SECONDS", 24 * 3600)),
+        sizeof=lambda value: len(value.encode("utf-8")),
+    )
+    return VisionCache(
+        memory,
+        perceptual=os.getenv("VISION_CACHE_PERCEPTUAL", "0").lower() in ("1", "true", "yes"),
+        max_distance=int(os.getenv("VISION_CACHE_MAX_DISTANCE", 4)),
+    )
+
+
+# Delad cache för genererade recept
+recipe_cache = _recipe_cache_from_env()
+
+# Delad cache för analyserade kylskåpsbilder
+vision_cache = _vision_cache_from_env()
@@ -0,0 +1,178 @@
+"""
+Säkrade (hedged) anrop för receptgenereringen.
+
+Har modellen inte skickat sin första token inom HEDGE_DELAY sekunder startas
+ett andra anrop, mot samma modell eller en snabbare reservmodell, och det
+anrop som vinner används medan det andra avbryts. Hur många extra anrop som
+får göras begränsas av en budget: varje anrop tjänar in HEDGE_BUDGET extra
+anrop (t.ex. 0.1 = högst vart tionde), så att en allmänt långsam tjänst inte
+får dubbelt så många anrop.
+"""
+
+import os
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+# Av som standard; varje säkrat anrop kostar ett extra modellanrop
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0").lower() in ("1", "true", "yes")
+# Sekunder utan första token innan ett andra anrop startas
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", 8))
+# Andel extra anrop som får göras, och hur många som får sparas ihop
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", 0.1))
+HEDGE_BURST = float(os.getenv("HEDGE_BURST", 5))
+
+logger = logging.getLogger(__name__)
+
+
+async def _next(stream: AsyncIterator[str]) -> Optional[str]:
+    """Nästa textbit, eller None när strömmen är slut."""
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _discard(task: asyncio.Future, stream: Optional[AsyncIterator[str]] = None) -> None:
+    """Avbryter det förlorande anropet och stänger dess ström."""
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    if stream is not None:
+        await stream.aclose()
+
+
+async def _settle(tasks: List[asyncio.Future]) -> asyncio.Future:
+    """
+    Väntar tills ett av anropen lyckas och returnerar det.
+
+    Misslyckas alla kastas det första anropets fel, eftersom det är det
+    klienten skulle ha fått utan säkring.
+    """
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            if task in done and not task.cancelled() and task.exception() is None:
+                return task
+    return tasks[0].result()
+
+
+class Hedger:
+    """Startar säkrande anrop inom budgeten och räknar hur ofta de startas och vinner."""
+
+    def __init__(
+        self,
+        enabled: bool = HEDGE_ENABLED,
+        delay: float = HEDGE_DELAY,
+        budget: float = HEDGE_BUDGET,
+        burst: float = HEDGE_BURST,
+    ):
+        self.enabled = enabled
+        self.delay = delay
+        self.budget = budget
+        self.burst = burst
+        self._credit = min(1.0, burst)
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self.skipped = 0
+
+    def _begin(self) -> None:
+        self.requests += 1
+        self._credit = min(self.burst, self._credit + self.budget)
+
+    def _allow(self) -> bool:
+        if self._credit < 1:
+            self.skipped += 1
+            logger.info("Säkrande anrop hoppas över, budgeten är slut")
+            return False
+        self._credit -= 1
+        self.fired += 1
+        logger.info("Ingen första token efter %.1f s, startar säkrande anrop", self.delay)
+        return True
+
+    def _finish(self, index: int) -> None:
+        if index > 0:
+            self.won += 1
+            logger.info("Det säkrande anropet vann")
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "fired": self.fired,
+            "won": self.won,
+            "skipped": self.skipped,
+        }
+
+    async def first_finished(
+        self,
+        primary: Callable[[asyncio.Event], Awaitable[str]],
+        hedge: Callable[[asyncio.Event], Awaitable[str]],
+    ) -> str:
+        """
+        Kör `primary` och, om den inte skickat någon token i tid, även `hedge`.
+
+        Båda får en händelse som de sätter vid första token. Det anrop som blir
+        klart först vinner.
+        """
+        self._begin()
+        first = asyncio.Event()
+        tasks = [asyncio.ensure_future(primary(first))]
+        try:
+            waiter = asyncio.ensure_future(first.wait())
+            try:
+                await asyncio.wait({tasks[0], waiter}, timeout=self.delay, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            if not tasks[0].done() and not first.is_set() and self._allow():
+                tasks.append(asyncio.ensure_future(hedge(asyncio.Event())))
+            winner = await _settle(tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        self._finish(tasks.index(winner))
+        return winner.result()
+
+    async def first_token(
+        self,
+        primary: AsyncIterator[str],
+        hedge: Callable[[], AsyncIterator[str]],
+    ) -> AsyncIterator[str]:
+        """
+        Strömmar från `primary` eller, om den inte skickat någon token i tid,
+        från den av `primary` och `hedge()` som skickar sin första token först.
+        """
+        self._begin()
+        streams = [primary]
+        tasks = [asyncio.ensure_future(_next(primary))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay)
+            if not done and self._allow():
+                streams.append(hedge())
+                tasks.append(asyncio.ensure_future(_next(streams[1])))
+            winner = await _settle(tasks)
+        finally:
+            # Förloraren, eller båda om klienten kopplat ner, avbryts i bakgrunden
+            for task, stream in zip(tasks, streams):
+                if task is not winner:
+                    asyncio.ensure_future(_discard(task, stream))
+
+        index = tasks.index(winner)
+        self._finish(index)
+        stream = streams[index]
+        try:
+            delta = winner.result()
+            while delta is not None:
+                yield delta
+                delta = await _next(stream)
+        finally:
+            await stream.aclose()
+
+
+# Delad för receptmodellen
+recipe_hedger = Hedger()
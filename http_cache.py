@@ -0,0 +1,272 @@
+"""
+HTTP-cachning och komprimering för API:et och de statiska filerna.
+
+Svar får en stark ETag och Last-Modified så att klienter kan fråga om med
+If-None-Match/If-Modified-Since och få 304 utan kropp. Kroppar komprimeras
+med brotli eller gzip efter klientens Accept-Encoding, och receptfiler kan
+hämtas i delar med Range. Komprimerade varianter sparas per ETag så att
+samma innehåll bara komprimeras en gång.
+"""
+
+import os
+import gzip
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # Bara gzip utan paketet brotli
+    brotli = None
+
+# Mindre kroppar än så här skickas okomprimerade
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 512))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Svaren får cachas men ska alltid valideras mot servern
+REVALIDATE = "no-cache"
+
+_variants = LRUCache(
+    max_entries=int(os.getenv("HTTP_VARIANT_CACHE_MAX_ENTRIES", 512)),
+    max_bytes=int(os.getenv("HTTP_VARIANT_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+)
+
+
+def make_etag(*parts: str) -> str:
+    """Stark ETag av en eller flera hashar eller andra strängar."""
+    if len(parts) == 1:
+        return f'"{parts[0]}"'
+    return '"' + hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def content_disposition(filename: str) -> str:
+    """Content-Disposition för nedladdning, med RFC 5987-kodning för å, ä och ö."""
+    quoted = quote(filename)
+    if quoted == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename*=utf-8''{quoted}"
+
+
+def representation_etag(etag: str, encoding: str) -> str:
+    """
+    ETag för representationen med en viss kodning.
+
+    Varje kodning är en egen representation och får en egen stark ETag, t.ex.
+    "abc-gzip" för "abc". Samma ETag används i 200- och 304-svaret.
+    """
+    if encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _base_etag(tag: str) -> str:
+    """
+    ETag utan W/-prefix och kodningssuffix.
+
+    Jämförelsen för If-None-Match är svag enligt RFC 9110, och en komprimerad
+    variant gäller för samma innehåll som den okomprimerade.
+    """
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ('-br"', '-gzip"'):
+        if tag.endswith(suffix):
+            return tag[: -len(suffix)] + '"'
+    return tag
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float]) -> bool:
+    """
+    Avgör om klientens kopia fortfarande gäller.
+
+    If-None-Match har företräde; If-Modified-Since används bara när den saknas.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [_base_etag(tag.strip()) for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP-datum har sekundupplösning
+        return int(last_modified) <= since
+    return False
+
+
+def choose_encoding(request: Request) -> str:
+    """Väljer br, gzip eller identity utifrån Accept-Encoding och q-värden."""
+    accepted: Dict[str, float] = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    def q_for(encoding: str) -> float:
+        return accepted.get(encoding, accepted.get("*", 0.0))
+
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=q_for)
+    return best if q_for(best) > 0 else "identity"
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0 ger samma bytes för samma innehåll
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def encoded_body(body: bytes, encoding: str, etag: str) -> bytes:
+    """Komprimerad variant av kroppen, cachad per ETag och kodning."""
+    if encoding == "identity":
+        return body
+    key = f"{etag}:{encoding}"
+    data = _variants.get(key)
+    if data is None:
+        data = compress(body, encoding)
+        _variants.set(key, data)
+    return data
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Tolkar ett enkelt `bytes=start-slut`-intervall.
+
+    Returnerar (start, slut) inklusive, eller None om intervallet inte går att
+    uppfylla. Flera intervall stöds inte och kastar ValueError, så att hela
+    filen skickas i stället.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("Intervallet stöds inte")
+    start_text, _, end_text = spec.strip().partition("-")
+    if not start_text:
+        # Sista N byte
+        length = int(end_text)
+        if length <= 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _validator_headers(
+    etag: str,
+    last_modified: Optional[float],
+    ranges: bool,
+    cache_control: str = REVALIDATE,
+) -> Dict[str, str]:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if ranges:
+        headers["Accept-Ranges"] = "bytes"
+    return headers
+
+
+def not_modified_response(
+    request: Request,
+    etag: str,
+    last_modified: Optional[float] = None,
+    ranges: bool = False,
+    cache_control: str = REVALIDATE,
+) -> Optional[Response]:
+    """Ett 304-svar om klientens kopia gäller, annars None. Sparar arbetet med kroppen."""
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    current = representation_etag(etag, choose_encoding(request))
+    return Response(status_code=304, headers=_validator_headers(current, last_modified, ranges, cache_control))
+
+
+def cached_response(
+    request: Request,
+    body: bytes,
+    media_type: str,
+    etag: str,
+    last_modified: Optional[float] = None,
+    ranges: bool = False,
+    headers: Optional[Dict[str, str]] = None,
+    cache_control: str = REVALIDATE,
+    variants: Optional[Dict[str, bytes]] = None,
+) -> Response:
+    """
+    Bygger ett svar med validerare, villkorlig 304, komprimering och Range.
+
+    `etag` ska vara en stark ETag för exakt `body`. Med `ranges=True` besvaras
+    Range-förfrågningar med 206 (eller 416) på den okomprimerade kroppen.
+    `variants` kan innehålla förkomprimerade kroppar per kodning.
+    """
+    # ETag:en följer den förhandlade kodningen och inte kroppens storlek, så att
+    # ett 304 från not_modified_response, som skickas innan kroppen finns, får samma validerare
+    encoding = choose_encoding(request)
+    response_headers = _validator_headers(representation_etag(etag, encoding), last_modified, ranges, cache_control)
+    response_headers.update(headers or {})
+
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=response_headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if ranges and range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = _parse_range(range_header, len(body))
+        except ValueError:
+            pass  # Okända eller flera intervall: skicka hela kroppen
+        else:
+            # Delar skickas alltid ur den okomprimerade representationen
+            response_headers["ETag"] = etag
+            if byte_range is None:
+                response_headers["Content-Range"] = f"bytes */{len(body)}"
+                return Response(status_code=416, headers=response_headers)
+            start, end = byte_range
+            response_headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            return Response(
+                content=body[start:end + 1],
+                status_code=206,
+                media_type=media_type,
+                headers=response_headers,
+            )
+
+    if len(body) < COMPRESS_MIN_BYTES:
+        encoding = "identity"
+    if encoding != "identity":
+        response_headers["Content-Encoding"] = encoding
+    if variants is not None and encoding in variants:
+        content = variants[encoding]
+    else:
+        content = encoded_body(body, encoding, etag)
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers=response_headers,
+    )
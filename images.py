@@ -0,0 +1,118 @@
+"""
+Förbehandling av kylskåpsbilder innan de skickas till vision-modellen.
+
+Bilden roteras enligt EXIF, skalas ner till en maximal kantlängd och kodas om
+till en kompakt JPEG eller WebP. Mindre bilder ger kortare uppladdning,
+lägre latens och färre bildtokens hos OpenAI.
+"""
+
+import io
+import os
+import asyncio
+import binascii
+from typing import NamedTuple, Optional, Union
+
+from PIL import Image, ImageOps
+
+from uploads import BufferReader
+
+# Längsta sida i pixlar efter nedskalning
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1536))
+# Format vid omkodning: JPEG eller WEBP
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 80))
+# "auto" väljer detaljnivå efter bildens storlek, annars "low" eller "high"
+VISION_DETAIL = os.getenv("VISION_DETAIL", "auto").lower()
+# Bilder vars längsta sida ryms i en low-detail-ruta skickas med detail=low
+LOW_DETAIL_MAX_EDGE = 512
+
+_FORMAT_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Byte som base64-kodas per steg; en multipel av 3 så att bitarna kan sättas ihop utan utfyllnad
+_BASE64_CHUNK_BYTES = 3 * 64 * 1024
+
+
+class PreparedImage(NamedTuple):
+    """En förbehandlad bild redo att skickas till vision-modellen."""
+    data: bytes
+    mime_type: str
+    detail: str
+    width: int
+    height: int
+
+
+def _choose_detail(width: int, height: int) -> str:
+    if VISION_DETAIL in ("low", "high"):
+        return VISION_DETAIL
+    return "low" if max(width, height) <= LOW_DETAIL_MAX_EDGE else "high"
+
+
+def preprocess_image(data: bytes, max_edge: Optional[int] = None) -> PreparedImage:
+    """
+    Roterar, skalar ner och kodar om en uppladdad bild.
+
+    Om omkodningen inte ger en mindre fil och bilden varken behövde roteras
+    eller skalas skickas originalet vidare med rätt MIME-typ.
+    Kastar ValueError om datat inte är en bild som Pillow kan läsa.
+    """
+    max_edge = max_edge or IMAGE_MAX_EDGE
+    output_format = IMAGE_FORMAT if IMAGE_FORMAT in _FORMAT_MIME else "JPEG"
+    try:
+        img = Image.open(BufferReader(data))
+        original_format = img.format
+        original_size = img.size
+        # Låt JPEG-avkodaren skala ner direkt, vilket är mycket snabbare än full avkodning
+        img.draft("RGB", (max_edge, max_edge))
+        # EXIF-taggen 0x0112 anger hur kameran var vriden
+        changed = img.getexif().get(0x0112, 1) != 1
+        img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        raise ValueError(f"Kunde inte läsa bilden: {str(e)}")
+
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        changed = True
+    changed = changed or img.size != original_size
+
+    # JPEG saknar alfakanal, så lägg genomskinliga bilder mot vit bakgrund
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=output_format, quality=IMAGE_QUALITY, optimize=True)
+    encoded = buffer.getvalue()
+    width, height = img.size
+
+    original_mime = Image.MIME.get(original_format or "")
+    if not changed and original_mime and len(data) <= len(encoded):
+        return PreparedImage(data, original_mime, _choose_detail(width, height), width, height)
+    return PreparedImage(encoded, _FORMAT_MIME[output_format], _choose_detail(width, height), width, height)
+
+
+async def prepare_image(data: bytes, max_edge: Optional[int] = None) -> PreparedImage:
+    """Kör preprocess_image i en tråd så att event-loopen inte blockeras."""
+    return await asyncio.to_thread(preprocess_image, data, max_edge)
+
+
+def encode_data_url(data: Union[bytes, bytearray, memoryview], mime_type: str) -> str:
+    """
+    Kodar bilddata till en data-URL för vision-anropet.
+
+    Prefixet och base64-texten skrivs i en enda förallokerad buffert, bit för
+    bit ur en vy av bilden, och avkodas till en sträng en gång.
+    """
+    view = memoryview(data).cast("B")
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    buffer = bytearray(len(prefix) + 4 * ((len(view) + 2) // 3))
+    buffer[:len(prefix)] = prefix
+    pos = len(prefix)
+    for start in range(0, len(view), _BASE64_CHUNK_BYTES):
+        encoded = binascii.b2a_base64(view[start:start + _BASE64_CHUNK_BYTES], newline=False)
+        buffer[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    return buffer.decode("ascii")
@@ -0,0 +1,286 @@
+"""
+Asynkrona jobb för receptgenerering.
+
+`POST /jobs` lägger genereringen i en kö och svarar direkt med ett jobb-id;
+ett fast antal arbetare plockar jobben och kör dem. Jobbens status och
+resultat sparas i en SQLite-databas och tas bort JOB_TTL_SECONDS efter att
+de blivit klara. Indata (uppladdade filer) hålls bara i minnet, så jobb som
+inte hunnit bli klara när servern stoppas markeras som misslyckade.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+
+# Antal jobb som körs samtidigt
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+# Antal jobb som får vänta i kön innan nya avvisas med 503
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 200))
+# Hur länge ett jobb finns kvar efter att det blivit klart
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", 3600))
+# Sökväg till databasen; tom sträng håller jobben enbart i minnet
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", ".jobs.sqlite3")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, expires REAL NOT NULL, job TEXT NOT NULL)"
+
+# Körs med (indata, rapportera steg) och returnerar jobbets resultat
+Runner = Callable[[dict, Callable[..., None]], Awaitable[dict]]
+
+
+def _error_info(e: Exception) -> dict:
+    if isinstance(e, HTTPException):
+        error = {"status": e.status_code, "detail": e.detail}
+        retry_after = (e.headers or {}).get("Retry-After")
+        if retry_after is not None:
+            error["retry_after"] = int(retry_after)
+        return error
+    return {"status": 500, "detail": str(e)}
+
+
+class JobStore:
+    """Jobbens status i SQLite med utgångstid. Blockerande; anropas via to_thread."""
+
+    def __init__(self, db_path: str = JOB_STORE_PATH):
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Öppnar databasen och avslutar jobb som avbröts av en omstart. Anropas med låset taget."""
+        if self._db is not None:
+            return self._db
+        try:
+            db = sqlite3.connect(self.db_path or ":memory:", check_same_thread=False)
+            db.execute(_SCHEMA)
+        except sqlite3.Error as e:
+            logger.warning("Kunde inte öppna jobblagret %s, använder minnet: %s", self.db_path, e)
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+            db.execute(_SCHEMA)
+
+        now = time.time()
+        interrupted = []
+        for job_id, job in db.execute("SELECT id, job FROM jobs WHERE expires > ?", (now,)):
+            job = json.loads(job)
+            if job["status"] not in FINISHED:
+                job.update(status=FAILED, updated=now, error={"status": 503, "detail": "Servern startades om innan jobbet blev klart"})
+                interrupted.append((now + JOB_TTL_SECONDS, json.dumps(job, ensure_ascii=False), job_id))
+        with db:
+            db.execute("DELETE FROM jobs WHERE expires <= ?", (now,))
+            db.executemany("UPDATE jobs SET expires = ?, job = ? WHERE id = ?", interrupted)
+        self._db = db
+        return db
+
+    def save(self, job: dict, expires: float) -> None:
+        with self._lock:
+            db = self._connect()
+            try:
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)",
+                        (job["id"], expires, json.dumps(job, ensure_ascii=False)),
+                    )
+            except sqlite3.Error as e:
+                logger.warning("Kunde inte spara jobb %s: %s", job["id"], e)
+
+    def load(self, job_id: str) -> Optional[dict]:
+        """Jobbet, eller None om det inte finns eller har gått ut."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT job FROM jobs WHERE id = ? AND expires > ?", (job_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def purge(self) -> int:
+        """Tar bort utgångna jobb och returnerar antalet."""
+        with self._lock:
+            db = self._connect()
+            with db:
+                return db.execute("DELETE FROM jobs WHERE expires <= ?", (time.time(),)).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class JobQueue:
+    """
+    Kö och arbetare för jobben.
+
+    Jobb som väntar eller körs hålls i minnet och sparas i lagret vid varje
+    statusbyte; steg som rapporteras under körningen syns bara i minnet.
+    """
+
+    def __init__(
+        self,
+        runner: Runner,
+        store: JobStore,
+        workers: int = JOB_WORKERS,
+        queue_size: int = JOB_QUEUE_SIZE,
+        ttl_seconds: float = JOB_TTL_SECONDS,
+    ):
+        self.runner = runner
+        self.store = store
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl_seconds = ttl_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._active: Dict[str, dict] = {}
+        self._inputs: Dict[str, dict] = {}
+        # Väntande händelser per jobb, en per lyssnare
+        self._events: Dict[str, Set[asyncio.Event]] = {}
+        self._purged = 0.0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        """Antal jobb som väntar eller körs."""
+        return len(self._active)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        await asyncio.to_thread(self.store.purge)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobb som inte blev klara kan inte köras om, eftersom indata bara fanns i minnet
+        for job in list(self._active.values()):
+            await self._finish(job, error={"status": 503, "detail": "Servern stängdes innan jobbet blev klart"})
+        await asyncio.to_thread(self.store.close)
+
+    async def submit(self, job_input: dict) -> dict:
+        """Lägger ett jobb i kön. Kastar HTTPException 503 om kön är full."""
+        if self._queue is None:
+            raise HTTPException(status_code=503, detail="Jobbkön är inte startad")
+        if self._queue.qsize() >= self.queue_size:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="För många jobb i kön, försök igen om en stund",
+                headers={"Retry-After": "30"},
+            )
+        now = time.time()
+        job = {"id": uuid.uuid4().hex, "status": QUEUED, "stage": None, "created": now, "updated": now}
+        self._active[job["id"]] = job
+        self._inputs[job["id"]] = job_input
+        self.submitted += 1
+        await self._save(job)
+        self._queue.put_nowait(job["id"])
+        await self._purge()
+        return dict(job)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self._active.get(job_id)
+        if job is not None:
+            return dict(job)
+        return await asyncio.to_thread(self.store.load, job_id)
+
+    def changed(self, job_id: str) -> Optional[asyncio.Event]:
+        """
+        Händelse som sätts nästa gång jobbet ändras, eller None om jobbet inte
+        väntar eller körs. Hämta den innan jobbet läses och lämna tillbaka den
+        med `forget`.
+        """
+        if job_id not in self._active:
+            return None
+        event = asyncio.Event()
+        self._events.setdefault(job_id, set()).add(event)
+        return event
+
+    def forget(self, job_id: str, event: Optional[asyncio.Event]) -> None:
+        """Tar bort en händelse från `changed` som ingen längre väntar på."""
+        events = self._events.get(job_id)
+        if events is None or event is None:
+            return
+        events.discard(event)
+        if not events:
+            del self._events[job_id]
+
+    def _notify(self, job: dict) -> None:
+        job["updated"] = time.time()
+        for event in self._events.pop(job["id"], ()):
+            event.set()
+
+    async def _save(self, job: dict) -> None:
+        expires = job["updated"] + self.ttl_seconds
+        if job["status"] not in FINISHED:
+            # Jobb som väntar eller körs sparas utan utgång tills de blir klara
+            expires = float("inf")
+        await asyncio.to_thread(self.store.save, dict(job), expires)
+
+    async def _purge(self) -> None:
+        # Rensa utgångna jobb högst en gång i minuten
+        if time.monotonic() - self._purged < 60:
+            return
+        self._purged = time.monotonic()
+        removed = await asyncio.to_thread(self.store.purge)
+        if removed:
+            logger.info("Tog bort %d utgångna jobb", removed)
+
+    async def _finish(self, job: dict, result: Optional[dict] = None, error: Optional[dict] = None) -> None:
+        job["status"] = FAILED if error is not None else DONE
+        job["stage"] = None
+        if error is not None:
+            job["error"] = error
+            self.failed += 1
+        else:
+            job["result"] = result
+            self.completed += 1
+        self._notify(job)
+        await self._save(job)
+        self._active.pop(job["id"], None)
+        self._inputs.pop(job["id"], None)
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self._active.get(job_id)
+            if job is None:
+                continue
+
+            def report(stage: str, **data: Any) -> None:
+                job["stage"] = stage
+                job.update(data)
+                self._notify(job)
+
+            job["status"] = RUNNING
+            self._notify(job)
+            await self._save(job)
+            self.running += 1
+            try:
+                result = await self.runner(self._inputs[job_id], report)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not isinstance(e, HTTPException):
+                    logger.exception("Oväntat fel i jobb %s: %s", job_id, e)
+                await self._finish(job, error=_error_info(e))
+            else:
+                await self._finish(job, result=result)
+            finally:
+                self.running -= 1
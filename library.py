@@ -0,0 +1,401 @@
+"""
+Index över receptbiblioteket (recipes_library).
+
+Indexet byggs en gång vid start och hålls aktuellt med ändringsdetektering:
+via inotify (paketet watchfiles) när det finns installerat, annars genom att
+mtime och storlek pollas med jämna mellanrum. API:et svarar sedan från den
+färdigsorterade listan i minnet i stället för att läsa katalogen per anrop.
+"""
+
+import os
+import json
+import logging
+import time
+import base64
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from watchfiles import awatch
+except ImportError:  # Fall tillbaka på pollning
+    awatch = None
+
+LIBRARY_DIR = os.getenv("RECIPES_LIBRARY_DIR", "recipes_library")
+LIBRARY_POLL_SECONDS = float(os.getenv("LIBRARY_POLL_SECONDS", 2))
+# Med inotify görs ändå en glesare kontroll, ifall händelser missats
+LIBRARY_RESCAN_SECONDS = float(os.getenv("LIBRARY_RESCAN_SECONDS", 60))
+
+logger = logging.getLogger(__name__)
+
+
+# Svensk alfabetisk ordning: å, ä och ö efter z (tecknen närmast efter "z"),
+# æ och ø som ä och ö samt ü som y
+_SWEDISH_LETTERS = str.maketrans({"å": "{", "ä": "|", "æ": "|", "ö": "}", "ø": "}", "ü": "y"})
+
+
+def swedish_sort_key(text: str) -> str:
+    """Sorteringsnyckel för A-Ö; övriga accenter ignoreras, så att é sorteras som e."""
+    text = unicodedata.normalize("NFC", text).casefold().translate(_SWEDISH_LETTERS)
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+# Fält som kan väljas med fields= och nycklar som listan kan sorteras på
+FIELDS = ("id", "filename", "title", "size", "date")
+SORT_KEYS = {
+    "date": lambda entry: entry["date"],
+    "title": lambda entry: swedish_sort_key(entry["title"]),
+    "size": lambda entry: entry["size"],
+}
+# Standardordning per sorteringsnyckel: nyast, A-Ö respektive störst först
+DEFAULT_DESCENDING = {"date": True, "title": False, "size": True}
+# Typ på värdet som SORT_KEYS ger, för att kontrollera cursorer
+_CURSOR_TYPES = {"date": (int, float), "title": (str,), "size": (int, float)}
+
+
+def _encode_cursor(sort: str, position: tuple) -> str:
+    raw = json.dumps([sort, *position], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, recipe_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("Ogiltig cursor")
+    if cursor_sort != sort:
+        raise ValueError("Cursorn hör till en annan sortering")
+    # Fel typ skulle ge TypeError i bisect; bool är en int men aldrig ett sorteringsvärde
+    if isinstance(value, bool) or not isinstance(value, _CURSOR_TYPES[sort]) or not isinstance(recipe_id, str):
+        raise ValueError("Ogiltig cursor")
+    return value, recipe_id
+
+
+def project(entries: Sequence[dict], fields: Optional[Sequence[str]]) -> List[dict]:
+    """Plockar ut de begärda fälten ur posterna."""
+    if not fields:
+        return list(entries)
+    return [{field: entry[field] for field in fields} for entry in entries]
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Tolkar en kommaseparerad fields-parameter. Kastar ValueError för okända fält."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ValueError(f"Okända fält: {', '.join(unknown)}")
+    return names
+
+
+def content_digest(data: bytes) -> str:
+    """Kort SHA-256 av filinnehåll, används som ETag."""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _read_file(path: Path) -> Tuple[str, str]:
+    """
+    Läser titel och innehållshash för en receptfil.
+
+    Titeln är första raden, eller görs av filnamnet. Hashen används som ETag.
+    """
+    title = ""
+    digest = ""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = content_digest(data)
+        # Markdown-rubriken (# Titel) ingår inte i titeln
+        title = data.split(b"\n", 1)[0].decode("utf-8-sig").lstrip("#").strip()
+    except (OSError, UnicodeDecodeError):
+        pass
+    return title or path.stem.replace("_", " ").title(), digest
+
+
+class LibraryIndex:
+    """
+    Håller metadata för alla .txt-filer i en biblioteksmapp.
+
+    Posterna har samma form som /api/library/recipes returnerar: id, filename,
+    title, size och date. Ändringar byggs i nya strukturer som sedan byts in
+    i ett svep, så läsare i event-loopen ser alltid ett konsistent index.
+    """
+
+    def __init__(self, directory: str = LIBRARY_DIR, poll_interval: float = LIBRARY_POLL_SECONDS):
+        self.directory = Path(directory)
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._entries: Dict[str, dict] = {}
+        self._stats: Dict[str, tuple] = {}
+        self._sorted: List[dict] = []
+        # Per sorteringsnyckel: poster i stigande ordning och deras (värde, id) för bisect
+        self._orders: Dict[str, List[dict]] = {key: [] for key in SORT_KEYS}
+        self._order_keys: Dict[str, List[tuple]] = {key: [] for key in SORT_KEYS}
+        self._json: Optional[bytes] = None
+        self._json_hash: Optional[str] = None
+        # Innehållshash per recept för ETag
+        self._hashes: Dict[str, str] = {}
+        # Senaste ändringen i biblioteket, för Last-Modified på listan
+        self.last_modified = 0.0
+        # Uppdateringar från bevakning och pollning körs i trådar och får inte överlappa
+        self._update_lock = threading.Lock()
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._stop_event: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def list(self) -> List[dict]:
+        """Alla recept sorterade efter senast ändrad, nyast först."""
+        return self._sorted
+
+    def get(self, recipe_id: str) -> Optional[dict]:
+        return self._entries.get(recipe_id)
+
+    def add_listener(self, listener: Callable[[List[str], List[str]], None]) -> None:
+        """
+        Registrerar en funktion som anropas med (ändrade id:n, borttagna id:n).
+
+        Anropet görs i samma arbetstråd som uppdateringen, så lyssnare kan
+        läsa filer utan att blockera event-loopen.
+        """
+        self._listeners.append(listener)
+
+    def path(self, recipe_id: str) -> Path:
+        return self.directory / f"{recipe_id}.txt"
+
+    def content_hash(self, recipe_id: str) -> Optional[str]:
+        """Hash av receptfilens innehåll när den senast indexerades."""
+        return self._hashes.get(recipe_id)
+
+    def page(
+        self,
+        sort: str = "date",
+        descending: Optional[bool] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Returnerar en sida av listan och en cursor till nästa sida (eller None).
+
+        Sidorna skärs ut ur färdigsorterade listor med bisect, så kostnaden
+        beror på sidans storlek och inte på bibliotekets storlek. Cursorn pekar
+        på sista postens sorteringsvärde och id och är stabil även om poster
+        läggs till eller tas bort mellan anropen.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Okänd sortering: {sort}")
+        if descending is None:
+            descending = DEFAULT_DESCENDING[sort]
+        entries = self._orders[sort]
+        keys = self._order_keys[sort]
+
+        if descending:
+            end = len(entries)
+            if cursor:
+                end = bisect_left(keys, _decode_cursor(cursor, sort))
+            start = 0 if limit is None else max(0, end - limit)
+            items = entries[start:end][::-1]
+            has_more = start > 0
+        else:
+            start = 0
+            if cursor:
+                start = bisect_right(keys, _decode_cursor(cursor, sort))
+            end = len(entries) if limit is None else min(len(entries), start + limit)
+            items = entries[start:end]
+            has_more = end < len(entries)
+
+        next_cursor = None
+        if has_more and items:
+            last = items[-1]
+            next_cursor = _encode_cursor(sort, (SORT_KEYS[sort](last), last["id"]))
+        return items, next_cursor
+
+    def list_json(self) -> bytes:
+        """Listan som färdigserialiserad JSON, byggd om bara när indexet ändrats."""
+        if self._json is None:
+            self._json = json.dumps(self._sorted, ensure_ascii=False).encode("utf-8")
+        return self._json
+
+    def list_hash(self) -> str:
+        """Hash av hela listan; ändras när någon post läggs till, ändras eller tas bort."""
+        if self._json_hash is None:
+            self._json_hash = hashlib.sha256(self.list_json()).hexdigest()[:32]
+        return self._json_hash
+
+    # ------------------------------------------------------------------
+    # Uppdatering
+    # ------------------------------------------------------------------
+
+    def scan(self) -> bool:
+        """
+        Går igenom hela mappen och uppdaterar poster vars mtime eller storlek ändrats.
+
+        Bara nya och ändrade filer öppnas. Returnerar True om något ändrades.
+        Blockerande; anropas från en tråd.
+        """
+        with self._update_lock:
+            return self._scan()
+
+    def _scan(self) -> bool:
+        current = {}
+        if self.directory.exists():
+            with os.scandir(self.directory) as it:
+                for dir_entry in it:
+                    if dir_entry.name.endswith(".txt") and dir_entry.is_file():
+                        st = dir_entry.stat()
+                        current[dir_entry.name[:-4]] = (st.st_mtime_ns, st.st_size, st.st_mtime)
+
+        changed = [recipe_id for recipe_id, stat in current.items() if self._stats.get(recipe_id) != stat]
+        removed = [recipe_id for recipe_id in self._stats if recipe_id not in current]
+        if not changed and not removed:
+            return False
+
+        entries = dict(self._entries)
+        stats = dict(self._stats)
+        hashes = dict(self._hashes)
+        for recipe_id in removed:
+            entries.pop(recipe_id, None)
+            stats.pop(recipe_id, None)
+            hashes.pop(recipe_id, None)
+        for recipe_id in changed:
+            stats[recipe_id] = current[recipe_id]
+            entries[recipe_id], hashes[recipe_id] = self._make_entry(recipe_id, current[recipe_id])
+        self._swap(entries, stats, hashes, changed, removed)
+        return True
+
+    def update_paths(self, paths: Iterable[str]) -> bool:
+        """Uppdaterar bara de angivna filerna (från inotify-händelser). Blockerande."""
+        with self._update_lock:
+            return self._update_paths(paths)
+
+    def _update_paths(self, paths: Iterable[str]) -> bool:
+        entries = dict(self._entries)
+        stats = dict(self._stats)
+        hashes = dict(self._hashes)
+        changed_ids = []
+        removed_ids = []
+        for raw_path in paths:
+            path = Path(raw_path)
+            if path.suffix != ".txt" or path.parent.resolve() != self.directory.resolve():
+                continue
+            recipe_id = path.stem
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                if recipe_id in entries:
+                    del entries[recipe_id]
+                    del stats[recipe_id]
+                    hashes.pop(recipe_id, None)
+                    removed_ids.append(recipe_id)
+                continue
+            stat = (st.st_mtime_ns, st.st_size, st.st_mtime)
+            if stats.get(recipe_id) != stat:
+                stats[recipe_id] = stat
+                entries[recipe_id], hashes[recipe_id] = self._make_entry(recipe_id, stat)
+                changed_ids.append(recipe_id)
+        if not changed_ids and not removed_ids:
+            return False
+        self._swap(entries, stats, hashes, changed_ids, removed_ids)
+        return True
+
+    def _make_entry(self, recipe_id: str, stat: tuple) -> Tuple[dict, str]:
+        path = self.path(recipe_id)
+        title, digest = _read_file(path)
+        entry = {
+            "id": recipe_id,
+            "filename": path.name,
+            "title": title,
+            "size": stat[1],
+            "date": stat[2],
+        }
+        return entry, digest
+
+    def _swap(
+        self,
+        entries: Dict[str, dict],
+        stats: Dict[str, tuple],
+        hashes: Dict[str, str],
+        changed: List[str],
+        removed: List[str],
+    ) -> None:
+        orders = {}
+        order_keys = {}
+        for sort, key_func in SORT_KEYS.items():
+            keyed = sorted(((key_func(entry), entry["id"]), entry) for entry in entries.values())
+            order_keys[sort] = [position for position, _ in keyed]
+            orders[sort] = [entry for _, entry in keyed]
+        self._entries = entries
+        self._stats = stats
+        self._hashes = hashes
+        # Sortera efter senast ändrad
+        self._sorted = orders["date"][::-1]
+        self._orders = orders
+        self._order_keys = order_keys
+        self._json = None
+        self._json_hash = None
+        # En borttagen fil syns inte i något mtime, så använd tidpunkten för ändringen
+        newest = max((entry["date"] for entry in entries.values()), default=0.0)
+        self.last_modified = max(newest, time.time() if removed else self.last_modified)
+        self.version += 1
+        for listener in self._listeners:
+            try:
+                listener(changed, removed)
+            except Exception as e:
+                logger.exception("Fel i lyssnare för receptbiblioteket: %s", e)
+
+    # ------------------------------------------------------------------
+    # Bevakning
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Bygger indexet och startar bevakningen av mappen."""
+        await asyncio.to_thread(self.scan)
+        logger.info("📚 Receptbibliotek indexerat: %d recept i %s", len(self), self.directory)
+        self._stop_event = asyncio.Event()
+        if awatch is not None and self.directory.exists():
+            self._tasks.append(asyncio.create_task(self._watch()))
+            self._tasks.append(asyncio.create_task(self._poll(LIBRARY_RESCAN_SECONDS)))
+        else:
+            self._tasks.append(asyncio.create_task(self._poll(self.poll_interval)))
+
+    async def stop(self) -> None:
+        if self._stop_event is not None:
+            self._stop_event.set()
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _watch(self) -> None:
+        try:
+            async for changes in awatch(self.directory, stop_event=self._stop_event, recursive=False, debounce=200):
+                await asyncio.to_thread(self.update_paths, [path for _, path in changes])
+        except Exception as e:
+            # Bevakningen gick inte att starta (t.ex. slut på inotify-resurser)
+            logger.warning("Filbevakning misslyckades, pollar i stället: %s", e)
+            await self._poll(self.poll_interval)
+
+    async def _poll(self, interval: float) -> None:
+        while not self._stop_event.is_set():
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.scan)
+            except OSError as e:
+                logger.warning("Fel vid genomsökning av receptbiblioteket: %s", e)
+
+
+# Delat index för API:et
+library_index = LibraryIndex()
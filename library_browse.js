@@ -5,15 +5,50 @@ document.addEventListener('DOMContentLoaded', () => {
     const recipeContent = document.getElementById('recipe-content');
     const downloadBtn = document.getElementById('download-recipe');
     const backToListBtn = document.getElementById('back-to-list');
+    const sortSelect = document.getElementById('library-sort');
+    const libraryControls = document.getElementById('library-controls');
+    const loadMoreBtn = document.getElementById('load-more');
+    const searchForm = document.getElementById('library-search-form');
+    const searchInput = document.getElementById('library-search');
+    
+    // Antal recept som hämtas per sida och fälten som korten behöver
+    const PAGE_SIZE = 50;
+    const LIST_FIELDS = 'id,filename,title,size,date';
+    let nextCursor = null;
     
     // Ladda biblioteksrecept vid sidladdning
     loadLibraryRecipes();
     
+    // Byt sortering och börja om från första sidan
+    if (sortSelect) {
+        sortSelect.addEventListener('change', () => loadLibraryRecipes());
+    }
+    
+    // Sök i biblioteket; en tom sökning visar hela listan igen
+    if (searchForm) {
+        searchForm.addEventListener('submit', (e) => {
+            e.preventDefault();
+            const query = searchInput.value.trim();
+            if (query) {
+                searchLibrary(query);
+            } else {
+                loadLibraryRecipes();
+            }
+        });
+    }
+    
+    // Hämta nästa sida
+    if (loadMoreBtn) {
+        loadMoreBtn.addEventListener('click', () => loadLibraryRecipes(nextCursor));
+    }
+    
     // Tillbaka till listan-knapp
     if (backToListBtn) {
         backToListBtn.addEventListener('click', () => {
             recipeDetails.classList.add('hidden');
             libraryList.classList.remove('hidden');
+            libraryControls.classList.remove('hidden');
+            loadMoreBtn.classList.toggle('hidden', !nextCursor);
         });
     }
     
@@ -35,18 +70,29 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
     
-    async function loadLibraryRecipes() {
+    async function loadLibraryRecipes(cursor = null) {
         try {
-            // Använd absolut URL till API-servern
-            const response = await fetch('/api/library/recipes');
+            const params = new URLSearchParams({
+                limit: PAGE_SIZE,
+                sort: sortSelect ? sortSelect.value : 'date',
+                fields: LIST_FIELDS
+            });
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            
+            const response = await fetch(`/api/library/recipes?${params}`);
             
             if (!response.ok) {
                 throw new Error(`Server svarade med statuskod: ${response.status}`);
             }
             
-            const recipes = await response.json();
+            const page = await response.json();
+            const recipes = page.items;
+            nextCursor = page.next_cursor;
+            loadMoreBtn.classList.toggle('hidden', !nextCursor);
             
-            if (recipes.length === 0) {
+            if (!cursor && recipes.length === 0) {
                 libraryList.innerHTML = `
                     <div class="recipe-empty">
                         <p>Inga recept hittades i biblioteket.</p>
@@ -61,8 +107,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 const size = `${Math.round(recipe.size / 1024 * 10) / 10} KB`;
                 
                 return `
-                    <div class="recipe-card library-recipe" data-id="${recipe.id}" data-filename="${recipe.filename}">
-                        <h3>${recipe.title}</h3>
+                    <div class="recipe-card library-recipe" data-id="${escapeHtml(recipe.id)}" data-filename="${escapeHtml(recipe.filename)}">
+                        <h3>${escapeHtml(recipe.title)}</h3>
                         <div class="recipe-meta">
                             <span>${date}</span>
                             <span>${size}</span>
@@ -71,16 +117,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 `;
             }).join('');
             
-            libraryList.innerHTML = recipesHTML;
-            
-            // Lägg till klickhändelser på recept-korten
-            document.querySelectorAll('.library-recipe').forEach(card => {
-                card.addEventListener('click', () => {
-                    const recipeId = card.getAttribute('data-id');
-                    const filename = card.getAttribute('data-filename');
-                    showRecipeDetails(recipeId, filename);
-                });
-            });
+            // Första sidan ersätter listan, följande sidor läggs till sist
+            if (cursor) {
+                libraryList.insertAdjacentHTML('beforeend', recipesHTML);
+            } else {
+                libraryList.innerHTML = recipesHTML;
+            }
             
         } catch (error) {
             console.error('Fel vid laddning av receptbibliotek:', error);
@@ -93,6 +135,57 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    async function searchLibrary(query) {
+        try {
+            const params = new URLSearchParams({ q: query, limit: PAGE_SIZE });
+            const response = await fetch(`/api/library/search?${params}`);
+            
+            if (!response.ok) {
+                throw new Error(`Server svarade med statuskod: ${response.status}`);
+            }
+            
+            const data = await response.json();
+            nextCursor = null;
+            loadMoreBtn.classList.add('hidden');
+            
+            if (data.results.length === 0) {
+                libraryList.innerHTML = `
+                    <div class="recipe-empty">
+                        <p>Inga recept matchade "${escapeHtml(query)}".</p>
+                    </div>
+                `;
+                return;
+            }
+            
+            libraryList.innerHTML = data.results.map(result => `
+                <div class="recipe-card library-recipe" data-id="${escapeHtml(result.id)}" data-filename="${escapeHtml(result.filename)}">
+                    <h3>${escapeHtml(result.title)}</h3>
+                    <div class="recipe-meta">
+                        <span>${escapeHtml(result.snippet)}</span>
+                    </div>
+                </div>
+            `).join('');
+            
+        } catch (error) {
+            console.error('Fel vid sökning i receptbiblioteket:', error);
+            libraryList.innerHTML = `
+                <div class="error">
+                    <p>Något gick fel vid sökningen. Vänligen försök igen.</p>
+                    <p class="error-details">${error.message}</p>
+                </div>
+            `;
+        }
+    }
+    
+    // Klickhändelser på recept-korten hanteras på listan, så att nya sidor fungerar direkt
+    libraryList.addEventListener('click', (event) => {
+        const card = event.target.closest('.library-recipe');
+        if (!card) return;
+        const recipeId = card.getAttribute('data-id');
+        const filename = card.getAttribute('data-filename');
+        showRecipeDetails(recipeId, filename);
+    });
+    
     async function showRecipeDetails(recipeId, filename) {
         try {
             // Använd absolut URL till API-servern
@@ -115,6 +208,8 @@ document.addEventListener('DOMContentLoaded', () => {
             recipeContent.textContent = recipeText;
             
             libraryList.classList.add('hidden');
+            libraryControls.classList.add('hidden');
+            loadMoreBtn.classList.add('hidden');
             recipeDetails.classList.remove('hidden');
             
         } catch (error) {
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Lasttest för Longevity Receptgeneratorn.
+
+Kör ett antal samtidiga klienter mot en körande server under en bestämd tid
+och blandar anrop mot /generate, /api/library/recipes och de statiska sidorna.
+Resultatet är en JSON-rapport med genomströmning, p50/p95/p99-latens och
+felfrekvens per scenario, som kan jämföras mot en tidigare körning.
+
+Kör mot mock_openai.py för att mäta utan kostnad:
+    python mock_openai.py &
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=sk-mock OPENAI_RPM=0 OPENAI_TPM=0 uvicorn api:app &
+    python loadtest.py --concurrency 20 --duration 30 --output fore.json
+    ... ändra något ...
+    python loadtest.py --concurrency 20 --duration 30 --output efter.json --compare fore.json
+
+Scenarier och vikter väljs med --mix, t.ex. "generate=1,library=3,static=6".
+"""
+
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import platform
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import httpx
+
+STATIC_PATHS = ("/", "/index.html", "/script.js", "/styles.css", "/recipes.html", "/library_browse.html")
+
+DEFAULT_INVENTORY = """Mjölk
+6 ägg
+Smör
+Gul lök
+3 morötter
+Broccoli
+Purjolök
+Yoghurt naturell
+Cheddarost
+Citron
+Linser
+Havregryn"""
+
+MEALS = ("frukost", "lunch", "middag")
+DIFFICULTIES = ("enkel", "medel", "svår")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Tolkar "generate=1,library=3" till vikter per scenario."""
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Okänt scenario: {name} (finns: {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("Minst ett scenario måste ha vikt över 0")
+    return mix
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil enligt närmaste rang i en sorterad lista."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class LoadTest:
+    """Klienterna, deras gemensamma slumpkälla och de insamlade resultaten."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.random = random.Random(args.seed)
+        self.inventory = DEFAULT_INVENTORY
+        if args.inventory:
+            with open(args.inventory, "r", encoding="utf-8") as f:
+                self.inventory = f.read()
+        self.recipe_ids: List[str] = []
+        # (scenario, latens i sekunder, status eller feltyp, lyckades)
+        self.results: List[tuple] = []
+        self.counter = 0
+
+    # Scenarier: varje funktion gör ett anrop och returnerar svaret
+
+    async def generate(self, client: httpx.AsyncClient) -> httpx.Response:
+        inventory = self.inventory
+        headers = {}
+        if self.args.unique:
+            # En egen rad per anrop ger en ny cachenyckel, så att modellen anropas varje gång
+            inventory += f"\nKrydda {uuid.uuid4().hex[:12]}"
+        elif self.args.no_cache:
+            headers["Cache-Control"] = "no-cache"
+        if self.args.stream:
+            headers["Accept"] = "text/event-stream"
+        data = {
+            "choice": "1",
+            "difficulty": self.random.choice(DIFFICULTIES),
+            "meal_type": self.random.choice(MEALS),
+            "num_people": str(self.random.randint(1, 4)),
+        }
+        if self.args.output_format == "json":
+            data["output"] = "json"
+        files = {"file": ("varor.txt", inventory.encode("utf-8"), "text/plain")}
+        response = await client.post("/generate", data=data, files=files, headers=headers)
+        if self.args.stream and response.status_code == 200 and "event: error" in response.text:
+            # Fel under strömningen kommer som en händelse efter status 200
+            response.status_code = 502
+        return response
+
+    async def library(self, client: httpx.AsyncClient) -> httpx.Response:
+        if self.recipe_ids and self.random.random() < 0.5:
+            return await client.get(f"/api/library/recipes/{self.random.choice(self.recipe_ids)}")
+        return await client.get("/api/library/recipes", params={"limit": 20})
+
+    async def static(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.get(self.random.choice(STATIC_PATHS))
+
+    async def prepare(self, client: httpx.AsyncClient) -> None:
+        """Hämtar receptens id:n så att library-scenariot även kan hämta enskilda recept."""
+        try:
+            response = await client.get("/api/library/recipes", params={"limit": 100, "fields": "id"})
+            response.raise_for_status()
+            self.recipe_ids = [recipe["id"] for recipe in response.json().get("items", [])]
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"⚠️  Kunde inte hämta biblioteket: {e}", file=sys.stderr)
+
+    async def worker(self, client: httpx.AsyncClient, deadline: float) -> None:
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        while time.monotonic() < deadline:
+            if self.args.requests and self.counter >= self.args.requests:
+                return
+            self.counter += 1
+            name = self.random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](self, client)
+                outcome = str(response.status_code)
+                ok = response.status_code < 400
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+                ok = False
+            self.results.append((name, time.perf_counter() - start, outcome, ok))
+
+    async def run(self) -> dict:
+        args = self.args
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            await self.prepare(client)
+            if args.warmup > 0:
+                await asyncio.gather(*(self.worker(client, time.monotonic() + args.warmup) for _ in range(args.concurrency)))
+                self.results.clear()
+                self.counter = 0
+            started = datetime.now(timezone.utc)
+            start = time.perf_counter()
+            deadline = time.monotonic() + args.duration
+            await asyncio.gather(*(self.worker(client, deadline) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+        return self.report(started, elapsed)
+
+    def report(self, started: datetime, elapsed: float) -> dict:
+        scenarios = {}
+        for name in self.mix:
+            rows = [row for row in self.results if row[0] == name]
+            if rows:
+                scenarios[name] = summarize(rows, elapsed)
+        return {
+            "config": {
+                "url": self.args.url,
+                "concurrency": self.args.concurrency,
+                "duration": self.args.duration,
+                "requests": self.args.requests,
+                "mix": self.mix,
+                "stream": self.args.stream,
+                "output": self.args.output_format,
+                "unique": self.args.unique,
+                "no_cache": self.args.no_cache,
+                "seed": self.args.seed,
+            },
+            "environment": {"python": platform.python_version(), "host": platform.node()},
+            "started": started.isoformat(timespec="seconds"),
+            "elapsed_s": round(elapsed, 3),
+            "total": summarize(self.results, elapsed),
+            "scenarios": scenarios,
+        }
+
+
+SCENARIOS = {
+    "generate": LoadTest.generate,
+    "library": LoadTest.library,
+    "static": LoadTest.static,
+}
+
+
+def summarize(rows: List[tuple], elapsed: float) -> dict:
+    """Genomströmning, latens i millisekunder och fel för en mängd anrop."""
+    latencies = sorted(row[1] * 1000 for row in rows)
+    errors = sum(1 for row in rows if not row[3])
+    return {
+        "requests": len(rows),
+        "errors": errors,
+        "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+        "throughput_rps": round(len(rows) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 1),
+            "p95": round(percentile(latencies, 0.95), 1),
+            "p99": round(percentile(latencies, 0.99), 1),
+            "mean": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            "max": round(latencies[-1], 1) if latencies else 0.0,
+        },
+        "status": dict(sorted(Counter(row[2] for row in rows).items())),
+    }
+
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return "-"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def compare(baseline: dict, report: dict) -> List[str]:
+    """Rader som jämför rapporten med en tidigare körning, per scenario och totalt."""
+    lines = [f"{'':10} {'rps':>18} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20} {'fel':>12}"]
+    names = ["total"] + [name for name in report["scenarios"] if name in baseline.get("scenarios", {})]
+    for name in names:
+        before = baseline["total"] if name == "total" else baseline["scenarios"][name]
+        after = report["total"] if name == "total" else report["scenarios"][name]
+        cells = [f"{after['throughput_rps']:>8} {_change(before['throughput_rps'], after['throughput_rps']):>9}"]
+        for key in ("p50", "p95", "p99"):
+            b, a = before["latency_ms"][key], after["latency_ms"][key]
+            cells.append(f"{a:>10} {_change(b, a):>9}")
+        cells.append(f"{after['error_rate']:>6} ({before['error_rate']})")
+        lines.append(f"{name:10} " + " ".join(cells))
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Lasttest för Longevity Receptgeneratorn")
+    parser.add_argument("--url", default="http://localhost:8000", help="serverns adress")
+    parser.add_argument("--concurrency", type=int, default=10, help="antal samtidiga klienter")
+    parser.add_argument("--duration", type=float, default=30, help="sekunder att köra")
+    parser.add_argument("--requests", type=int, default=0, help="sluta efter så många anrop (0 = bara tiden)")
+    parser.add_argument("--warmup", type=float, default=0, help="sekunder uppvärmning som inte räknas")
+    parser.add_argument("--mix", default="generate=1,library=3,static=6", help="scenarier och vikter")
+    parser.add_argument("--stream", action="store_true", help="hämta /generate som Server-Sent Events")
+    parser.add_argument("--output-format", choices=("text", "json"), default="text", help="receptformat (output=)")
+    parser.add_argument("--unique", action="store_true", help="ny varulista per anrop, så att cachen aldrig träffas")
+    parser.add_argument("--no-cache", action="store_true", help="skicka Cache-Control: no-cache till /generate")
+    parser.add_argument("--inventory", help="textfil med varulista (standard: en inbyggd lista)")
+    parser.add_argument("--timeout", type=float, default=120, help="tidsgräns per anrop i sekunder")
+    parser.add_argument("--seed", type=int, default=1, help="slumpfrö för scenarier och parametrar")
+    parser.add_argument("--output", help="skriv rapporten till filen")
+    parser.add_argument("--compare", help="jämför med en tidigare rapport")
+    args = parser.parse_args()
+
+    try:
+        test = LoadTest(args)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+
+    print(f"🚀 {args.concurrency} klienter mot {args.url} i {args.duration:g} s ({args.mix})", file=sys.stderr)
+    report = asyncio.run(test.run())
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(baseline, report)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Strukturerad loggning för servern.
+
+Loggposter skrivs som JSON-rader (eller läsbar text med LOG_FORMAT=text) av
+en bakgrundstråd. Från event-loopen läggs posten bara i en begränsad kö, så
+att en långsam loggmottagare aldrig stoppar förfrågningar; blir kön full
+kastas posten och räknas i stället. Varje post får förfrågans id
+(X-Request-ID) och hemligheter som API-nycklar maskeras innan de skrivs.
+
+Modulerna loggar med `logging.getLogger(__name__)`; `setup_logging` kopplar
+in kön och anropas en gång när API:et startar.
+"""
+
+import os
+import re
+import sys
+import json
+import uuid
+import queue
+import atexit
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+import metrics
+
+# Nivå för alla moduler, t.ex. DEBUG, INFO eller WARNING
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Nivå per modul, t.ex. "upstream=DEBUG,library=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# json (en rad per post) eller text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Antal poster som får vänta på att skrivas innan nya kastas
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+# Förfrågans id, satt av RequestIdMiddleware och ärvt av tasks som startas under förfrågan
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+DROPPED = metrics.counter("log_records_dropped_total", "Loggposter som kastats för att loggkön var full")
+
+# API-nycklar, Bearer-token och inbäddade bilder (data-URL:er) skrivs aldrig ut
+_SECRET_PATTERNS = [
+    (re.compile(r"sk-[A-Za-z0-9_\-]{8,}"), "sk-***"),
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._\-]+"), r"\1***"),
+    (re.compile(r"data:[\w/+.\-]+;base64,[A-Za-z0-9+/=]+"), "data:***"),
+]
+# Attribut som alla LogRecord har; övriga kommer från extra= och blir egna fält
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def redact(text: str) -> str:
+    """Maskerar kända hemligheter och värdet av OPENAI_API_KEY i texten."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key and len(api_key) >= 8:
+        text = text.replace(api_key, "***")
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """En JSON-rad per post med tid, nivå, logger, meddelande, request_id och extra fält."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_FIELDS:
+                entry[name] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return redact(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class TextFormatter(logging.Formatter):
+    """Läsbar rad för lokal utveckling."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Lägger poster i kön utan att blockera.
+
+    Meddelandet och ett eventuellt undantag görs om till text här, medan
+    tillståndet fortfarande är aktuellt; själva formateringen och skrivningen
+    sker i lyssnartråden.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """Skrivtråden; vid stopp väntas det in plats i kön så att inget som redan loggats försvinner."""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def _apply_levels() -> None:
+    logging.getLogger().setLevel(LOG_LEVEL)
+    for item in LOG_LEVELS.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+
+def setup_logging() -> None:
+    """Kopplar rotloggern till kön och startar skrivtråden. Gör inget om det redan är gjort."""
+    global _listener
+    if _listener is not None:
+        return
+    records: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    _listener = _QueueListener(records, output)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(records))
+    _apply_levels()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Skriver ut det som finns kvar i kön och stoppar skrivtråden."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """
+    ASGI-middleware som ger varje förfrågan ett id.
+
+    Ett inkommande X-Request-ID används om det finns, annars skapas ett nytt.
+    Id:t sätts i `request_id` för loggningen och skickas tillbaka i svaret.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers", [])).get(b"x-request-id", b"").decode("latin-1")
+        # Klientens id används bara om det är rimligt kort och utskrivbart
+        value = incoming if 0 < len(incoming) <= 128 and incoming.isprintable() else uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,197 @@
+"""
+Matchning av inventarielistor mot receptbibliotekets ingredienser.
+
+Varje recepts ingredienssektion tolkas till normaliserade ingrediensnycklar
+som läggs i ett inverterat index. En uppladdad varulista poängsätts sedan mot
+alla recept på en gång: täckning (hur stor del av receptets ingredienser som
+finns i listan) och överlapp (hur väl listan och receptet sammanfaller).
+Skafferivaror som salt och olja räknas inte.
+"""
+
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Set, Tuple
+
+from search import fold, split_sections, stem
+from vocabulary import vocabulary
+
+# Mängder, enheter och beskrivningar som inte säger vilken råvara det gäller
+_QUANTITY_RE = re.compile(r"^[\d\s/.,½¼¾-]+")
+UNITS = {
+    "g", "gram", "kg", "hg", "mg", "dl", "cl", "ml", "l", "liter", "msk", "tsk", "krm",
+    "st", "styck", "klyfta", "klyftor", "burk", "burkar", "paket", "forp",
+    "knippe", "kruka", "nypa", "nave", "navar", "skiva", "skivor",
+    "bit", "bitar", "huvud", "ca", "cirka",
+}
+_DESCRIPTORS = {
+    "farsk", "frysta", "fryst", "torkad", "torkade", "hackad", "hackade", "riven",
+    "rivna", "skivad", "skivade", "tarnad", "tarnade", "strimlad", "kokt", "kokta",
+    "stor", "stora", "liten", "sma", "mogen", "mogna", "ekologisk", "gron", "rod",
+    "gul", "vit", "svart", "eller", "och", "med", "till", "av", "i", "pa", "for",
+    "servering", "garnering", "smak", "efter", "enligt", "valfri", "valfritt",
+}
+# Skafferivaror som antas finnas hemma och inte påverkar täckningen
+PANTRY = {stem(fold(word)) for word in (
+    "salt", "peppar", "svartpeppar", "vitpeppar", "olja", "olivolja", "rapsolja",
+    "vatten", "socker", "smör", "vinäger",
+)}
+
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+_MIN_KEY = 4
+
+
+def core_terms(name: str) -> Set[str]:
+    """Stammarna i ett ingrediensnamn, utan enheter och beskrivande ord."""
+    return {
+        stem(word)
+        for word in _WORD_RE.findall(fold(name))
+        if word not in UNITS and word not in _DESCRIPTORS
+    }
+
+
+def ingredient_keys(name: str) -> Set[str]:
+    """
+    Nycklar för ett ingrediensnamn: ordets stam samt för- och efterled.
+
+    "vitlöksklyftor" ger bland annat "vitloksklyft", "vitlok" och "klyft",
+    så att både "vitlök" och "vitlöksklyftor" i en varulista matchar.
+    Råvaror i vocabulary.py får även sitt kanoniska id, t.ex. "=morot".
+    """
+    keys = {"=" + canonical for canonical in vocabulary.canonicalize(name)}
+    for term in core_terms(name):
+        keys.add(term)
+        for i in range(_MIN_KEY, len(term) - _MIN_KEY + 1):
+            keys.add(term[:i])
+            keys.add(term[i:])
+    return keys
+
+
+def parse_ingredient(line: str) -> str:
+    """Plockar ut råvarans namn ur en ingrediensrad, t.ex. '2 dl quinoa (torr)' -> 'quinoa'."""
+    text = line.strip().lstrip("-*•").strip()
+    text = re.sub(r"\(.*?\)", "", text)
+    text = _QUANTITY_RE.sub("", text)
+    text = text.split(",")[0]
+    words = [word for word in text.split() if fold(word).strip(".") not in UNITS]
+    return " ".join(words).strip()
+
+
+def inventory_items(text: str) -> List[str]:
+    """Råvarunamnen i en uppladdad varulista eller ett svar från bildanalysen."""
+    items = []
+    for line in text.splitlines():
+        name = parse_ingredient(line)
+        if name and not name.endswith(":"):
+            items.append(name)
+    return items
+
+
+class IngredientMatcher:
+    """
+    Inverterat index från ingrediensnyckel till (recept, ingrediens).
+
+    Registreras som lyssnare på LibraryIndex precis som sökindexet och läser
+    bara ändrade filer. Recept utan ingredienssektion ignoreras.
+    """
+
+    def __init__(self, path_for: Callable[[str], Path]):
+        self.path_for = path_for
+        self._postings: Dict[str, Set[Tuple[str, int]]] = {}
+        self._recipes: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._recipes)
+
+    def update(self, changed: List[str], removed: List[str]) -> None:
+        """Tolkar om ändrade recept och tar bort raderade. Blockerande."""
+        parsed = {}
+        for recipe_id in changed:
+            try:
+                with open(self.path_for(recipe_id), "r", encoding="utf-8") as f:
+                    parsed[recipe_id] = self._parse(f.read())
+            except (OSError, UnicodeDecodeError):
+                parsed[recipe_id] = None
+
+        with self._lock:
+            for recipe_id in list(removed) + list(parsed):
+                self._remove(recipe_id)
+            for recipe_id, recipe in parsed.items():
+                if recipe is None:
+                    continue
+                self._recipes[recipe_id] = recipe
+                for index, keys in enumerate(recipe["keys"]):
+                    for key in keys:
+                        self._postings.setdefault(key, set()).add((recipe_id, index))
+
+    @staticmethod
+    def _parse(text: str):
+        sections = split_sections(text)
+        names = []
+        keys = []
+        for line in sections["ingredients"].splitlines():
+            name = parse_ingredient(line)
+            if not name:
+                continue
+            # "Salt och peppar" och liknande räknas som skafferivaror
+            terms = core_terms(name)
+            if not terms or terms <= PANTRY:
+                continue
+            names.append(name)
+            keys.append(ingredient_keys(name))
+        if not names:
+            return None
+        return {"title": sections["title"], "ingredients": names, "keys": keys}
+
+    def _remove(self, recipe_id: str) -> None:
+        recipe = self._recipes.pop(recipe_id, None)
+        if recipe is None:
+            return
+        for index, keys in enumerate(recipe["keys"]):
+            for key in keys:
+                postings = self._postings.get(key)
+                if postings is not None:
+                    postings.discard((recipe_id, index))
+                    if not postings:
+                        del self._postings[key]
+
+    def match(self, inventory: str, limit: int = 5, min_coverage: float = 0.0) -> List[dict]:
+        """
+        Returnerar de recept som bäst täcks av varulistan, bäst först.
+
+        Varje träff har id, title, coverage (andel av receptets ingredienser
+        som finns i listan), overlap (Jaccard-likhet mellan listan och
+        receptet) samt matched och missing med ingrediensnamnen.
+        """
+        items = inventory_items(inventory)
+        upload_keys = set()
+        for item in items:
+            upload_keys |= core_terms(item)
+        upload_keys = {key for key in upload_keys if len(key) >= 3}
+        upload_keys |= {"=" + canonical for canonical in vocabulary.canonicalize(inventory)}
+
+        with self._lock:
+            covered: Dict[str, Set[int]] = {}
+            for key in upload_keys:
+                for recipe_id, index in self._postings.get(key, ()):
+                    covered.setdefault(recipe_id, set()).add(index)
+
+            results = []
+            for recipe_id, indexes in covered.items():
+                recipe = self._recipes[recipe_id]
+                total = len(recipe["ingredients"])
+                coverage = len(indexes) / total
+                if coverage < min_coverage:
+                    continue
+                union = total + max(len(items), len(indexes)) - len(indexes)
+                results.append({
+                    "id": recipe_id,
+                    "title": recipe["title"],
+                    "coverage": round(coverage, 3),
+                    "overlap": round(len(indexes) / union, 3),
+                    "matched": [recipe["ingredients"][i] for i in sorted(indexes)],
+                    "missing": [name for i, name in enumerate(recipe["ingredients"]) if i not in indexes],
+                })
+        results.sort(key=lambda r: (r["coverage"], r["overlap"]), reverse=True)
+        return results[:limit]
@@ -0,0 +1,238 @@
+"""
+Mätvärden i Prometheus textformat för GET /metrics.
+
+Räknare och histogram uppdateras med några få operationer utan lås, eftersom
+de bara används från event-loopen. Räknare som redan finns i andra moduler
+(cacher, sammanslagning, begränsare, kretsbrytare, säkrade anrop och jobbkön)
+läses först när /metrics hämtas, via insamlare som registreras med
+`add_collector`, så att den heta vägen inte påverkas alls.
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+# Starlette lägger själv till charset=utf-8 för text/-typer
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Gränser i sekunder, från snabba steg som promptbygget till långa modellanrop
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+class Family(NamedTuple):
+    """
+    Ett mätvärde med typ, beskrivning och värden.
+
+    Varje värde är (suffix, etiketter, värde); suffixet är tomt utom för
+    histogrammens _bucket, _sum och _count.
+    """
+    name: str
+    kind: str
+    help: str
+    samples: List[Tuple[str, Dict[str, str], float]]
+
+
+def family(name: str, kind: str, help: str, values: Iterable[Tuple[Dict[str, str], float]]) -> Family:
+    """Skapar en räknare eller mätare av (etiketter, värde), t.ex. i en insamlare."""
+    return Family(name, kind, help, [("", labels, value) for labels, value in values])
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Räknare som bara ökar, med värden per etikettvärden."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # Utan etiketter finns värdet från början, så att det syns som 0
+        self._values: Dict[tuple, float] = {} if self.labels else {(): 0}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def families(self) -> List[Family]:
+        values = [(dict(zip(self.labels, key)), value) for key, value in self._values.items()]
+        return [family(self.name, self.kind, self.help, values)]
+
+
+class Gauge(Counter):
+    """Värde som kan öka och minska, t.ex. antal pågående förfrågningar."""
+
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values: str, value: float) -> None:
+        self._values[label_values] = value
+
+
+class Histogram:
+    """Histogram med fasta gränser; en observation kostar en binärsökning."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Per etikettvärden: [antal per hink (sista är +Inf), summa]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        entry = self._values.get(label_values)
+        if entry is None:
+            entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """Mäter tiden för blocket, även när det avbryts av ett fel."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def families(self) -> List[Family]:
+        samples = []
+        for key, (counts, total) in self._values.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(("_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return [Family(self.name, "histogram", self.help, samples)]
+
+
+_metrics: List = []
+_collectors: List[Callable[[], Iterable[Family]]] = []
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    metric = Counter(name, help, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+    metric = Gauge(name, help, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, help, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def add_collector(collect: Callable[[], Iterable[Family]]) -> None:
+    """Registrerar en funktion som ger mätvärden när /metrics hämtas."""
+    _collectors.append(collect)
+
+
+def render() -> str:
+    """Alla mätvärden i Prometheus textformat."""
+    families: List[Family] = []
+    for metric in _metrics:
+        families.extend(metric.families())
+    for collect in _collectors:
+        families.extend(collect())
+
+    lines = []
+    for item in families:
+        lines.append(f"# HELP {item.name} {item.help}")
+        lines.append(f"# TYPE {item.name} {item.kind}")
+        for suffix, labels, value in item.samples:
+            lines.append(f"{item.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Gemensamma mätvärden för förfrågningar och modellanrop
+STAGE_SECONDS = histogram(
+    "recipe_stage_seconds",
+    "Tid per steg i genereringen (upload_read, image_prepare, image_encode, vision, prompt_build, recipe)",
+    ("stage",),
+)
+HTTP_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "Tid för hela förfrågan, inklusive serialisering och strömning av svaret",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "Pågående HTTP-förfrågningar")
+OPENAI_TOKENS = counter("openai_tokens_total", "Tokens enligt OpenAI:s usage per modell och typ", ("model", "kind"))
+OPENAI_ERRORS = counter("openai_errors_total", "Fel från OpenAI per modell och feltyp", ("model", "type"))
+
+
+def stage(name: str):
+    """Mäter tiden för ett steg, t.ex. `with metrics.stage("vision"): ...`."""
+    return STAGE_SECONDS.time(name)
+
+
+def record_usage(model: str, usage) -> None:
+    """Räknar tokens från ett svars usage (CompletionUsage), om OpenAI skickade med det."""
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(model, "prompt", amount=usage.prompt_tokens or 0)
+    OPENAI_TOKENS.inc(model, "completion", amount=usage.completion_tokens or 0)
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware som mäter varje HTTP-förfrågan.
+
+    Routen är sökvägsmallen (t.ex. /jobs/{job_id}) så att antalet tidsserier
+    hålls nere; förfrågningar som inte matchar någon route räknas som "unmatched".
+    Tiden mäts tills hela svaret skickats, även för strömmande svar.
+    """
+
+    def __init__(self, app, exclude: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = tuple(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Routern lägger den matchade routen i samma scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - start, scope["method"], route, str(status))
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Lokal ersättare för OpenAI:s chat-API, för lasttester utan kostnad och utan
+OpenAI:s hastighetsgränser.
+
+Servern svarar på POST /v1/chat/completions med färdiga svar: en varulista
+när frågan innehåller en bild, ett JSON-recept när response_format ber om
+json_schema och annars ett textrecept. Svaren kan strömmas och har usage.
+Fördröjning och fel styrs med flaggor eller miljövariabler.
+
+Användning:
+    python mock_openai.py [--port 8100] [--latency lognormal:2,0.5] [--error-rate 0.02]
+
+Peka sedan API:et mot servern:
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=sk-mock OPENAI_RPM=0 OPENAI_TPM=0 uvicorn api:app
+
+Fördelningar för --latency och --token-delay (sekunder):
+    fixed:0.5             alltid 0,5 s
+    uniform:0.2,1.5       jämnt fördelad mellan 0,2 och 1,5 s
+    lognormal:2,0.5       lognormal med median 2 s och sigma 0,5 (som riktiga modellanrop)
+    normal:1,0.2          normalfördelad, aldrig under 0
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import AsyncIterator, Callable, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Tid till första token (eller hela svaret utan strömning) och tid mellan bitarna
+MOCK_LATENCY = os.getenv("MOCK_LATENCY", "lognormal:1.5,0.5")
+MOCK_TOKEN_DELAY = os.getenv("MOCK_TOKEN_DELAY", "fixed:0.02")
+# Andel anrop som får 429 respektive 500, som aldrig svarar och som bryts mitt i strömmen
+MOCK_RATE_LIMIT_RATE = float(os.getenv("MOCK_RATE_LIMIT_RATE", 0))
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", 0))
+MOCK_TIMEOUT_RATE = float(os.getenv("MOCK_TIMEOUT_RATE", 0))
+MOCK_STREAM_ERROR_RATE = float(os.getenv("MOCK_STREAM_ERROR_RATE", 0))
+# Hur länge ett anrop som "aldrig svarar" hänger, längre än API:ets läsgräns
+MOCK_HANG_SECONDS = float(os.getenv("MOCK_HANG_SECONDS", 300))
+# Ungefärligt antal tecken per strömmad bit
+CHUNK_CHARS = 12
+
+VISION_ANSWER = """Jag kan se följande i kylskåpet:
+- Mjölk
+- 6 ägg
+- Smör
+- Gul lök
+- 3 morötter
+- Broccoli
+- Purjolök
+- Yoghurt naturell
+- Cheddarost
+- Citron
+- Tomatpuré
+- Senap"""
+
+RECIPE_ANSWER = """1) Förslag på rätt:
+Grönsaksfrittata med broccoli och purjolök - en italiensk äggrätt som är rik på protein, fibrer och antioxidanter.
+
+2) Gör såhär:
+Fräs purjolök, morot och broccoli i smör. Vispa ägg med mjölk, salt och peppar och häll över grönsakerna. Strö över riven ost och låt stelna på svag värme, gratinera sedan kort i ugnen.
+
+3) Ingredienser du har:
+- 6 ägg
+- 1 dl mjölk
+- 1 purjolök
+- 2 morötter
+- 1 broccoli
+- 1 dl riven cheddarost
+- 1 msk smör
+
+4) Har du?:
+- Salt
+- Svartpeppar
+- Färska örter
+
+5) Longevity-fördelar:
+Broccoli och purjolök ger fibrer och sulforafan, äggen ger protein av hög kvalitet och grönsakerna bidrar med antioxidanter som skyddar cellerna."""
+
+RECIPE_JSON_ANSWER = {
+    "name": "Grönsaksfrittata med broccoli och purjolök",
+    "origin": "Italien",
+    "description": "En proteinrik äggrätt full av grönsaker, fibrer och antioxidanter.",
+    "steps": [
+        "Fräs purjolök, morot och broccoli i smör.",
+        "Vispa ägg med mjölk, salt och peppar och häll över grönsakerna.",
+        "Strö över osten och låt stelna på svag värme.",
+    ],
+    "ingredients": [
+        {"name": "ägg", "amount": "6 st"},
+        {"name": "mjölk", "amount": "1 dl"},
+        {"name": "purjolök", "amount": "1 st"},
+        {"name": "broccoli", "amount": "1 st"},
+        {"name": "cheddarost", "amount": "1 dl"},
+    ],
+    "extras": ["salt", "svartpeppar"],
+    "benefits": "Broccoli ger sulforafan och fibrer, äggen protein av hög kvalitet.",
+}
+
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """Tolkar t.ex. "lognormal:2,0.5" till en funktion som drar en fördröjning i sekunder."""
+    kind, _, args = spec.partition(":")
+    try:
+        values = [float(value) for value in args.split(",")] if args else []
+    except ValueError:
+        raise ValueError(f"Ogiltig fördelning: {spec}")
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    raise ValueError(f"Ogiltig fördelning: {spec}")
+
+
+def _tokens(text: str) -> int:
+    return len(text) // 3 + 1
+
+
+def _prompt_text(messages: List[dict]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+
+def _has_image(messages: List[dict]) -> bool:
+    return any(
+        isinstance(message.get("content"), list)
+        and any(part.get("type") == "image_url" for part in message["content"])
+        for message in messages
+    )
+
+
+def _error(status: int, message: str, kind: str) -> JSONResponse:
+    headers = {"retry-after": "1"} if status == 429 else None
+    return JSONResponse({"error": {"message": message, "type": kind, "code": None}}, status_code=status, headers=headers)
+
+
+def create_app(
+    latency: str = MOCK_LATENCY,
+    token_delay: str = MOCK_TOKEN_DELAY,
+    rate_limit_rate: float = MOCK_RATE_LIMIT_RATE,
+    error_rate: float = MOCK_ERROR_RATE,
+    timeout_rate: float = MOCK_TIMEOUT_RATE,
+    stream_error_rate: float = MOCK_STREAM_ERROR_RATE,
+) -> FastAPI:
+    """Skapar mockservern med de givna fördröjningarna och felfrekvenserna."""
+    first_delay = parse_distribution(latency)
+    chunk_delay = parse_distribution(token_delay)
+    app = FastAPI(title="Mock OpenAI")
+    app.state.calls = {"total": 0, "vision": 0, "recipe": 0, "json": 0, "errors": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "mock")
+        calls = app.state.calls
+        calls["total"] += 1
+
+        # Felinjicering före svaret, i samma form som OpenAI:s fel
+        roll = random.random()
+        if roll < rate_limit_rate:
+            calls["errors"] += 1
+            return _error(429, "Rate limit reached (mock)", "rate_limit_error")
+        if roll < rate_limit_rate + error_rate:
+            calls["errors"] += 1
+            return _error(500, "The server had an error (mock)", "server_error")
+        if roll < rate_limit_rate + error_rate + timeout_rate:
+            calls["errors"] += 1
+            await asyncio.sleep(MOCK_HANG_SECONDS)
+
+        response_format = body.get("response_format") or {}
+        if _has_image(messages):
+            calls["vision"] += 1
+            answer = VISION_ANSWER
+        elif response_format.get("type") == "json_schema":
+            calls["json"] += 1
+            answer = json.dumps(RECIPE_JSON_ANSWER, ensure_ascii=False)
+        else:
+            calls["recipe"] += 1
+            answer = RECIPE_ANSWER
+        usage = {
+            "prompt_tokens": _tokens(_prompt_text(messages)),
+            "completion_tokens": _tokens(answer),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_delay())
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        broken = random.random() < stream_error_rate
+
+        def chunk(delta: dict, finish_reason=None, chunk_usage=None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                "usage": chunk_usage,
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            await asyncio.sleep(first_delay())
+            yield chunk({"role": "assistant", "content": ""})
+            pieces = [answer[i:i + CHUNK_CHARS] for i in range(0, len(answer), CHUNK_CHARS)]
+            for index, piece in enumerate(pieces):
+                if broken and index == len(pieces) // 2:
+                    calls["errors"] += 1
+                    # Avbryt svaret som ett nätverksfel mitt i strömmen
+                    raise ConnectionResetError("Mockad avbruten ström")
+                yield chunk({"content": piece})
+                await asyncio.sleep(chunk_delay())
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk({}, chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": name, "object": "model"} for name in ("gpt-4o", "gpt-4-turbo", "gpt-4o-mini")]}
+
+    @app.get("/mock/stats")
+    async def stats():
+        """Antal anrop per typ sedan start, för att jämföra med lasttestets resultat."""
+        return app.state.calls
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Lokal ersättare för OpenAI:s chat-API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_PORT", 8100)))
+    parser.add_argument("--latency", default=MOCK_LATENCY, help="tid till första token, t.ex. lognormal:2,0.5")
+    parser.add_argument("--token-delay", default=MOCK_TOKEN_DELAY, help="tid mellan strömmade bitar, t.ex. fixed:0.02")
+    parser.add_argument("--rate-limit-rate", type=float, default=MOCK_RATE_LIMIT_RATE, help="andel anrop som får 429")
+    parser.add_argument("--error-rate", type=float, default=MOCK_ERROR_RATE, help="andel anrop som får 500")
+    parser.add_argument("--timeout-rate", type=float, default=MOCK_TIMEOUT_RATE, help="andel anrop som aldrig svarar")
+    parser.add_argument("--stream-error-rate", type=float, default=MOCK_STREAM_ERROR_RATE, help="andel strömmar som bryts")
+    args = parser.parse_args()
+
+    try:
+        app = create_app(
+            latency=args.latency,
+            token_delay=args.token_delay,
+            rate_limit_rate=args.rate_limit_rate,
+            error_rate=args.error_rate,
+            timeout_rate=args.timeout_rate,
+            stream_error_rate=args.stream_error_rate,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    import uvicorn
+    print(f"🧪 Mock OpenAI på http://{args.host}:{args.port}/v1 (latens {args.latency})")
+    print(f"   Starta API:et med OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Receptprompten, gemensam för API:et, all_in_one.py och testskripten.
+
+Varulistan normaliseras innan den läggs in i prompten: rader trimmas, tomma
+rader och rubriker tas bort och rader med samma råvarunamn och enhet slås
+ihop, med mängderna summerade. Böjningsformer av en råvara i vocabulary.py
+räknas som samma namn. Blir listan ändå längre än
+INVENTORY_TOKEN_BUDGET tokens skickas bara råvarornas namn, och räcker inte
+det kortas listan. Tokens räknas med tiktoken om paketet finns, annars
+uppskattas de.
+"""
+
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from matching import core_terms
+from recipe_store import split_quantity
+from search import fold
+from vocabulary import vocabulary
+
+try:
+    import tiktoken
+except ImportError:  # Uppskattning utan tiktoken
+    tiktoken = None
+
+# Högsta antal tokens för varulistan i receptprompten
+INVENTORY_TOKEN_BUDGET = int(os.getenv("PROMPT_INVENTORY_TOKEN_BUDGET", 1500))
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+_PROMPT_HEAD = """
+Nedan finns en lista över tillgängliga varor. Skriv ett recept med fokus på "Longevity" (långt liv) som är:
+- Svårighetsgrad: {difficulty}
+- Måltid: {meal_type}
+- Antal personer: {num_people}
+- Föredraget kök/stilriktning: {cuisine_pref}
+- Kostpreferenser: {dietary_pref}
+
+Receptet ska innehålla ingredienser som är kända för att främja ett långt och hälsosamt liv, som till exempel:
+- Baljväxter (bönor, linser)
+- Fullkorn
+- Nötter och frön
+- Bär och färska frukter
+- Gröna bladgrönsaker
+- Fisk rik på omega-3 (om inte vegetariskt/veganskt)
+- Fermenterade livsmedel
+- Olivolja och andra hälsosamma fetter
+"""
+
+_PROMPT_TAIL = """
+Lista över tillgängliga varor:
+{varulista}
+"""
+
+RECIPE_PROMPT = _PROMPT_HEAD + """
+Struktur för svaret:
+1) Förslag på rätt:
+   - En kort kommentar om vad rätten heter, vilket land/ursprung den har, och varför den är bra för ett långt liv.
+
+2) Gör såhär:
+   - En mycket kortfattad beskrivning av hur man tillagar rätten.
+
+3) Ingredienser du har:
+   - Ange vilka av de tillgängliga varorna som används och hur mycket.
+
+4) Har du?:
+   - Lista eventuella småingredienser (salt, peppar, tomatpuré etc.) som inte är avgörande för rätten.
+
+5) Longevity-fördelar:
+   - En kort förklaring om hur ingredienserna i rätten bidrar till ett långt och hälsosamt liv.
+
+Ditt svar ska vara på svenska.
+""" + _PROMPT_TAIL
+
+# För output=json; fälten och deras typer styrs av schemat i recipe_schema.py
+RECIPE_JSON_PROMPT = _PROMPT_HEAD + """
+Svara med ett JSON-objekt med rättens namn (name), ursprung (origin), en kort
+kommentar om varför rätten är bra för ett långt liv (description), kortfattade
+steg (steps), de tillgängliga varor som används med mängd (ingredients),
+småingredienser som salt och peppar (extras) och longevity-fördelarna
+(benefits). Håll texterna korta. All text ska vara på svenska.
+""" + _PROMPT_TAIL
+
+
+def count_tokens(text: str) -> int:
+    """Antal tokens i texten; utan tiktoken ungefär tre tecken per token på svenska."""
+    global _encoding
+    if tiktoken is None:
+        return len(text) // 3 + 1
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text))
+
+
+def _format_quantity(quantity: float) -> str:
+    text = f"{quantity:.2f}".rstrip("0").rstrip(".")
+    return text.replace(".", ",")
+
+
+def _name_key(name: str) -> str:
+    """
+    Nyckel för att jämföra rader: råvarans id om hela namnet är en form av en
+    enda råvara i vocabulary.py ("morötter" och "Morot" -> "=morot"), annars
+    hela namnet vikt till gemener, med beskrivningar, parenteser och text
+    efter kommatecken.
+    """
+    canonical = vocabulary.surface_form(name)
+    if canonical is not None:
+        return "=" + canonical
+    return " ".join(fold(name).split())
+
+
+def normalize_inventory(varulista: str) -> List[Tuple[str, str]]:
+    """
+    Varulistans råvaror som (rad, namn), i den ordning de först förekommer.
+
+    Rader med samma namn och enhet slås ihop och deras mängder summeras.
+    Böjningsformer av samma råvara räknas som samma namn ("3 morötter" och
+    "2 morot" blir "5 morötter"), men i övrigt jämförs namnet i sin helhet, så
+    "röd paprika" och "gul paprika", "kycklingfilé" och "kycklinglår" eller
+    "lax" och "lax (rökt)" hålls isär. En rad utan mängd vars namn redan finns
+    i listan är en dubblett och tas bort; alla andra rader behålls.
+    """
+    items: List[dict] = []
+    by_key: Dict[Tuple[str, Optional[str]], dict] = {}
+    names = set()
+    for line in varulista.splitlines():
+        text = line.strip().lstrip("-*•").strip()
+        if not text or text.endswith(":"):
+            continue
+        quantity, unit, name = split_quantity(text)
+        if not core_terms(name):
+            continue
+        name_key = _name_key(name)
+        key = (name_key, unit.lower() if unit else None)
+        entry = {"text": text, "name": name, "quantity": quantity, "unit": unit}
+
+        if quantity is None:
+            # "Ägg" efter "6 ägg" säger inget nytt
+            if name_key not in names:
+                items.append(entry)
+                by_key[key] = entry
+                names.add(name_key)
+            continue
+        bare = by_key.get((name_key, None))
+        if bare is not None and bare["quantity"] is None:
+            # En tidigare rad utan mängd ersätts av raden med mängd, på samma plats
+            del by_key[(name_key, None)]
+            bare.update(entry)
+            by_key[key] = bare
+            continue
+        item = by_key.get(key)
+        if item is not None:
+            item["quantity"] += quantity
+            item["merged"] = True
+            continue
+        items.append(entry)
+        by_key[key] = entry
+        names.add(name_key)
+
+    result = []
+    for item in items:
+        if item.get("merged"):
+            parts = [_format_quantity(item["quantity"]), item["unit"], item["name"]]
+            line = " ".join(part for part in parts if part)
+        else:
+            line = item["text"]
+        result.append((line, item["name"]))
+    return result
+
+
+def prepare_inventory(varulista: str, max_tokens: int = INVENTORY_TOKEN_BUDGET) -> str:
+    """
+    Varulistan som den läggs in i prompten, inom `max_tokens` tokens.
+
+    I första hand skickas de normaliserade raderna, i andra hand bara
+    råvarornas namn och till sist så många namn som ryms.
+    """
+    items = normalize_inventory(varulista)
+    if not items:
+        # Inget som liknar en varulista, t.ex. ett fritt formulerat svar från bildanalysen
+        items = [(line.strip(), line.strip()) for line in varulista.splitlines() if line.strip()]
+
+    lines = "\n".join(line for line, _ in items)
+    if count_tokens(lines) <= max_tokens:
+        return lines
+
+    names = ", ".join(name for _, name in items)
+    if count_tokens(names) <= max_tokens:
+        logger.info("Varulistan förkortades till råvarornas namn: %d varor", len(items))
+        return names
+
+    kept = []
+    used = 0
+    for _, name in items:
+        cost = count_tokens(name) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(name)
+        used += cost
+    logger.info("Varulistan kortades: %d av %d varor ryms i %d tokens", len(kept), len(items), max_tokens)
+    return ", ".join(kept) + f" (och {len(items) - len(kept)} varor till)"
+
+
+def build_recipe_prompt(
+    varulista: str,
+    difficulty: str,
+    meal_type: str,
+    num_people: str,
+    cuisine_pref: Optional[str] = "",
+    dietary_pref: Optional[str] = "",
+    output: Optional[str] = "text",
+    max_inventory_tokens: int = INVENTORY_TOKEN_BUDGET,
+) -> str:
+    """
+    Skapar receptprompten med användarinmatning och en normaliserad varulista.
+
+    Med output="json" ber prompten om ett JSON-objekt i stället för fri text.
+    """
+    template = RECIPE_JSON_PROMPT if output == "json" else RECIPE_PROMPT
+    return template.format(
+        difficulty=difficulty,
+        meal_type=meal_type,
+        num_people=num_people,
+        cuisine_pref=cuisine_pref or "",
+        dietary_pref=dietary_pref or "",
+        varulista=prepare_inventory(varulista, max_inventory_tokens),
+    )
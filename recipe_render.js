@@ -0,0 +1,25 @@
+// Rendering som delas av sidorna; laddas före sidornas egna skript
+
+// Skydda text från modellen innan den läggs in som HTML
+function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, char => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[char]);
+}
+
+// Rendera ett strukturerat recept (se recipe_schema.py) direkt från fälten
+function renderStructuredRecipe(recipe) {
+    const section = (title, body) =>
+        `<div class="recipe-section"><h3 class="section-title">${title}</h3><div class="section-content">${body}</div></div>`;
+    const list = (tag, items) => `<${tag}>${items.map(item => `<li>${escapeHtml(item)}</li>`).join('')}</${tag}>`;
+    
+    const ingredients = recipe.ingredients.map(item => item.amount ? `${item.amount} ${item.name}` : item.name);
+    const origin = recipe.origin ? ` (${escapeHtml(recipe.origin)})` : '';
+    return [
+        section(`${escapeHtml(recipe.name)}${origin}`, escapeHtml(recipe.description)),
+        section('Ingredienser du har', list('ul', ingredients)),
+        section('Gör såhär', list('ol', recipe.steps)),
+        recipe.extras.length ? section('Har du?', list('ul', recipe.extras)) : '',
+        section('Longevity-fördelar', escapeHtml(recipe.benefits))
+    ].join('');
+}
@@ -0,0 +1,96 @@
+"""
+Strukturerade recept som JSON (output=json).
+
+Modellen ombeds svara enligt RECIPE_SCHEMA i stället för med fri text i fem
+delar. Svaret valideras här innan det cachas eller skickas vidare, så att
+frontend kan lita på fälten.
+"""
+
+from typing import Any, List
+
+# JSON Schema för OpenAI:s strikta structured outputs: alla fält krävs och
+# inga andra fält tillåts
+RECIPE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string", "description": "Rättens namn"},
+        "origin": {"type": "string", "description": "Land eller kök som rätten kommer från"},
+        "description": {"type": "string", "description": "Kort kommentar om rätten och varför den är bra för ett långt liv"},
+        "steps": {"type": "array", "items": {"type": "string"}, "description": "Kortfattade steg för tillagningen"},
+        "ingredients": {
+            "type": "array",
+            "description": "Tillgängliga varor som används",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "amount": {"type": "string", "description": "Mängd, t.ex. '2 dl' eller '1 st'"},
+                },
+                "required": ["name", "amount"],
+                "additionalProperties": False,
+            },
+        },
+        "extras": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Småingredienser som inte är avgörande, t.ex. salt och peppar",
+        },
+        "benefits": {"type": "string", "description": "Hur ingredienserna bidrar till ett långt och hälsosamt liv"},
+    },
+    "required": ["name", "origin", "description", "steps", "ingredients", "extras", "benefits"],
+    "additionalProperties": False,
+}
+
+OUTPUT_FORMATS = ("text", "json")
+
+
+def _text(value: Any, field: str) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"{field} måste vara en icke-tom sträng")
+    return value.strip()
+
+
+def _texts(value: Any, field: str, allow_empty: bool = False) -> List[str]:
+    if not isinstance(value, list):
+        raise ValueError(f"{field} måste vara en lista")
+    items = [_text(item, field) for item in value]
+    if not items and not allow_empty:
+        raise ValueError(f"{field} får inte vara tom")
+    return items
+
+
+def validate_recipe(data: Any) -> dict:
+    """
+    Kontrollerar ett recept mot RECIPE_SCHEMA och returnerar det med trimmade strängar.
+
+    Kastar ValueError om ett fält saknas eller har fel typ.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Receptet måste vara ett objekt")
+    missing = [field for field in RECIPE_SCHEMA["required"] if field not in data]
+    if missing:
+        raise ValueError(f"Receptet saknar {', '.join(missing)}")
+
+    ingredients = data["ingredients"]
+    if not isinstance(ingredients, list) or not ingredients:
+        raise ValueError("ingredients måste vara en icke-tom lista")
+    for ingredient in ingredients:
+        if not isinstance(ingredient, dict):
+            raise ValueError("Varje ingrediens måste vara ett objekt")
+
+    return {
+        "name": _text(data["name"], "name"),
+        "origin": _text(data["origin"], "origin"),
+        "description": _text(data["description"], "description"),
+        "steps": _texts(data["steps"], "steps"),
+        "ingredients": [
+            {
+                "name": _text(ingredient.get("name"), "ingredients.name"),
+                "amount": ingredient.get("amount").strip() if isinstance(ingredient.get("amount"), str) else "",
+            }
+            for ingredient in ingredients
+        ],
+        "extras": _texts(data["extras"], "extras", allow_empty=True),
+        "benefits": _text(data["benefits"], "benefits"),
+    }
+
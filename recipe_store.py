@@ -0,0 +1,288 @@
+"""
+Strukturerade recept och ett förkompilerat lager för receptbiblioteket.
+
+Varje receptfil tolkas till en post med titel, beskrivning, portioner,
+ingredienser (med mängd och enhet), steg och tips. Posterna sparas i en
+SQLite-databas tillsammans med filens mtime och storlek, så att bara nya och
+ändrade filer behöver tolkas om, även efter en omstart. API:et läser posterna
+ur minnet.
+"""
+
+import os
+import re
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from matching import UNITS, parse_ingredient
+from search import fold
+from vocabulary import vocabulary
+
+# Sökväg till databasen; tom sträng håller lagret enbart i minnet
+RECIPE_STORE_PATH = os.getenv("RECIPE_STORE_PATH", ".recipe_store.sqlite3")
+
+# Höjs när tolkningen ändras, så att sparade poster byggs om
+PARSER_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS recipes ("
+    "id TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, record TEXT NOT NULL)"
+)
+
+_HEADING_KINDS = (
+    ("ingrediens", "ingredients"),
+    ("tillagning", "steps"),
+    ("instruktion", "steps"),
+    ("gör så här", "steps"),
+    ("gor sa har", "steps"),
+    ("tips", "tips"),
+    ("hälso", "tips"),
+    ("longevity", "tips"),
+    ("näring", "tips"),
+)
+_PORTIONS_RE = re.compile(r"(\d+)\s*(?:portioner|portion|port\b|personer|pers\b)", re.IGNORECASE)
+_STEP_RE = re.compile(r"^\d+[.)]\s*")
+_QUANTITY_RE = re.compile(r"^(\d+\s*/\s*\d+|\d+(?:[.,]\d+)?|[½¼¾])(?:\s*-\s*\d+(?:[.,]\d+)?)?\s*")
+_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75}
+
+
+def _heading_kind(line: str) -> Optional[str]:
+    """Avgör om raden är en rubrik och i så fall vilken sektion den inleder."""
+    if line.startswith("#"):
+        text = line.lstrip("#").strip().lower()
+    elif line.endswith(":") and not line.startswith(("-", "*")):
+        text = line[:-1].strip().lower()
+        # Löptext som slutar med kolon räknas bara som rubrik om den börjar som en
+        if not any(text.startswith(keyword) for keyword, _ in _HEADING_KINDS):
+            return None
+    else:
+        return None
+    for keyword, kind in _HEADING_KINDS:
+        if keyword in text:
+            return kind
+    return "other"
+
+
+def _parse_quantity(text: str) -> Tuple[Optional[float], str]:
+    """Plockar ut en inledande mängd, t.ex. '1/2', '1,5' eller '2-3' (ger 2)."""
+    match = _QUANTITY_RE.match(text)
+    if not match:
+        return None, text
+    raw = match.group(1).replace(" ", "")
+    if raw in _FRACTIONS:
+        quantity = _FRACTIONS[raw]
+    elif "/" in raw:
+        numerator, denominator = raw.split("/")
+        quantity = int(numerator) / int(denominator) if int(denominator) else None
+    else:
+        quantity = float(raw.replace(",", "."))
+    return quantity, text[match.end():]
+
+
+def split_quantity(text: str) -> Tuple[Optional[float], Optional[str], str]:
+    """
+    Delar en ingrediensrad i (mängd, enhet, resten av raden).
+
+    Resten behåller beskrivningar, parenteser och text efter kommatecken,
+    t.ex. '2 st röd paprika, strimlad' -> (2.0, 'st', 'röd paprika, strimlad').
+    """
+    quantity, rest = _parse_quantity(text)
+    unit = None
+    words = rest.split()
+    if quantity is not None and words and fold(words[0]).strip(".") in UNITS:
+        unit = words[0].strip(".")
+        words = words[1:]
+    return quantity, unit, " ".join(words)
+
+
+def parse_ingredient_line(line: str) -> dict:
+    """
+    Tolkar en ingrediensrad, t.ex. '600g kycklingfilé' eller '1 msk olivolja'.
+
+    `canonical` är råvarans id i vocabulary.py ("kyckling"), eller None.
+    """
+    text = line.strip().lstrip("-*•").strip()
+    quantity, unit, _ = split_quantity(text)
+    name = parse_ingredient(text)
+    return {
+        "text": text,
+        "quantity": quantity,
+        "unit": unit,
+        "name": name,
+        "canonical": vocabulary.canonical(name or text),
+    }
+
+
+def parse_recipe(text: str) -> dict:
+    """
+    Tolkar en receptfil till en strukturerad post.
+
+    Klarar både markdown-rubriker (`## Ingredienser (4 portioner)`) och
+    rubriker som slutar med kolon (`Ingredienser:`). Text före första rubriken
+    blir beskrivning, och rubriker som inte känns igen räknas som tips.
+    """
+    lines = text.splitlines()
+    title = lines[0].lstrip("#").strip() if lines else ""
+    description: List[str] = []
+    ingredients: List[dict] = []
+    steps: List[str] = []
+    tips: List[str] = []
+    portions = None
+    current = "description"
+
+    for line in lines[1:]:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        kind = _heading_kind(stripped)
+        if kind is not None:
+            current = kind
+            if kind == "ingredients" and portions is None:
+                match = _PORTIONS_RE.search(stripped)
+                portions = int(match.group(1)) if match else None
+            continue
+        if current == "description":
+            description.append(stripped)
+        elif current == "ingredients":
+            ingredients.append(parse_ingredient_line(stripped))
+        elif current == "steps":
+            steps.append(_STEP_RE.sub("", stripped.lstrip("-*•").strip()))
+        else:
+            tips.append(stripped.lstrip("-*•").strip())
+
+    if portions is None:
+        match = _PORTIONS_RE.search(" ".join(description))
+        portions = int(match.group(1)) if match else None
+
+    return {
+        "title": title,
+        "description": " ".join(description),
+        "portions": portions,
+        "ingredients": ingredients,
+        "steps": steps,
+        "tips": tips,
+    }
+
+
+def record_lines(record: dict) -> List[str]:
+    """Postens textrader i filens ordning, utan rubriker, t.ex. för sökutdrag."""
+    lines = [record["description"]] if record["description"] else []
+    lines.extend(ingredient["text"] for ingredient in record["ingredients"])
+    lines.extend(record["steps"])
+    lines.extend(record["tips"])
+    return lines
+
+
+class RecipeStore:
+    """
+    Tolkade recept, sparade i SQLite och speglade i minnet.
+
+    `update` registreras som lyssnare på LibraryIndex. Filer vars mtime och
+    storlek stämmer med den sparade posten tolkas inte om, så en omstart
+    läser bara de filer som ändrats sedan förra körningen.
+    """
+
+    def __init__(self, path_for: Callable[[str], Path], db_path: str = RECIPE_STORE_PATH):
+        self.path_for = path_for
+        self.db_path = db_path
+        self._records: Dict[str, dict] = {}
+        self._stats: Dict[str, Tuple[int, int]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, recipe_id: str) -> Optional[dict]:
+        return self._records.get(recipe_id)
+
+    def lines(self, recipe_id: str) -> List[str]:
+        record = self._records.get(recipe_id)
+        return record_lines(record) if record is not None else []
+
+    def _connect(self) -> sqlite3.Connection:
+        """Öppnar databasen och läser in sparade poster. Anropas med låset taget."""
+        if self._db is not None:
+            return self._db
+        try:
+            db = sqlite3.connect(self.db_path or ":memory:", check_same_thread=False)
+            if db.execute("PRAGMA user_version").fetchone()[0] != PARSER_VERSION:
+                db.execute("DROP TABLE IF EXISTS recipes")
+                db.execute(f"PRAGMA user_version = {PARSER_VERSION}")
+            db.execute(_SCHEMA)
+            db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Kunde inte öppna receptlagret %s, använder minnet: %s", self.db_path, e)
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+            db.execute(_SCHEMA)
+
+        records = {}
+        stats = {}
+        gone = []
+        for recipe_id, mtime_ns, size, record in db.execute("SELECT id, mtime_ns, size, record FROM recipes"):
+            # Filer som tagits bort medan servern var nere
+            if not self.path_for(recipe_id).exists():
+                gone.append((recipe_id,))
+                continue
+            records[recipe_id] = json.loads(record)
+            stats[recipe_id] = (mtime_ns, size)
+        if gone:
+            with db:
+                db.executemany("DELETE FROM recipes WHERE id = ?", gone)
+        self._records = records
+        self._stats = stats
+        self._db = db
+        return db
+
+    def update(self, changed: List[str], removed: List[str]) -> None:
+        """Tolkar om ändrade recept och tar bort raderade. Blockerande."""
+        with self._lock:
+            db = self._connect()
+            records = dict(self._records)
+            stats = dict(self._stats)
+            upserts = []
+            deletes = [recipe_id for recipe_id in removed if recipe_id in records]
+
+            for recipe_id in changed:
+                path = self.path_for(recipe_id)
+                try:
+                    st = path.stat()
+                    stat = (st.st_mtime_ns, st.st_size)
+                    if stats.get(recipe_id) == stat:
+                        continue
+                    with open(path, "r", encoding="utf-8") as f:
+                        record = parse_recipe(f.read())
+                except (OSError, UnicodeDecodeError):
+                    if recipe_id in records:
+                        deletes.append(recipe_id)
+                    continue
+                record["id"] = recipe_id
+                records[recipe_id] = record
+                stats[recipe_id] = stat
+                upserts.append((recipe_id, stat[0], stat[1], json.dumps(record, ensure_ascii=False)))
+
+            for recipe_id in deletes:
+                records.pop(recipe_id, None)
+                stats.pop(recipe_id, None)
+            if not upserts and not deletes:
+                return
+
+            try:
+                with db:
+                    db.executemany("DELETE FROM recipes WHERE id = ?", [(recipe_id,) for recipe_id in deletes])
+                    db.executemany("INSERT OR REPLACE INTO recipes VALUES (?, ?, ?, ?)", upserts)
+            except sqlite3.Error as e:
+                logger.warning("Kunde inte spara receptlagret: %s", e)
+            self._records = records
+            self._stats = stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
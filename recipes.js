@@ -27,11 +27,14 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
             
-            // Skapa text-fil med receptet
-            const fileName = `${currentRecipe.title.replace(/[^a-zA-Z0-9åäöÅÄÖ]/g, '_')}.txt`;
+            // Skapa en fil med receptet; strukturerade recept laddas ner som JSON
+            const structured = currentRecipe.format === 'json';
+            const fileName = `${currentRecipe.title.replace(/[^a-zA-Z0-9åäöÅÄÖ]/g, '_')}.${structured ? 'json' : 'txt'}`;
             const fileContent = currentRecipe.content;
             
-            const blob = new Blob([fileContent], { type: 'text/plain;charset=utf-8' });
+            const blob = new Blob([fileContent], {
+                type: structured ? 'application/json;charset=utf-8' : 'text/plain;charset=utf-8'
+            });
             const link = document.createElement('a');
             link.href = URL.createObjectURL(blob);
             link.download = fileName;
@@ -97,7 +100,9 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Visa receptdetaljer
         recipeTitle.textContent = recipe.title;
-        recipeContent.innerHTML = formatRecipe(recipe.content);
+        recipeContent.innerHTML = recipe.format === 'json'
+            ? renderStructuredRecipe(JSON.parse(recipe.content))
+            : formatRecipe(recipe.content);
         
         recipesList.classList.add('hidden');
         recipeDetails.classList.remove('hidden');
@@ -0,0 +1,108 @@
+"""
+Återförsök och kretsbrytare för anrop mot OpenAI.
+
+Tillfälliga fel (tidsgränser, nätverksfel och 5xx) försöks om ett begränsat
+antal gånger med exponentiell backoff och slumpmässig spridning, så att många
+förfrågningar inte försöker om i takt. Blir felen för många i rad öppnas
+kretsbrytaren för modellen och nya anrop avvisas direkt med 503 under en
+nedkylningsperiod, i stället för att vänta in tidsgränser mot en trasig tjänst.
+Därefter släpps ett enda provanrop igenom; lyckas det stängs brytaren igen.
+"""
+
+import os
+import math
+import logging
+import time
+import random
+from typing import Dict
+
+from fastapi import HTTPException
+
+# Antal återförsök efter det första anropet och gränser för väntetiden mellan dem
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", 8))
+# Antal fel i rad som öppnar brytaren och hur länge den är öppen
+BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", 5))
+BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", 30))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Väntetid före återförsök nummer `attempt` (0, 1, ...): full jitter upp till en växande gräns."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Kretsbrytare för en modell. Används från event-loopen."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self) -> None:
+        """Släpper igenom anropet eller kastar HTTPException 503 om brytaren är öppen."""
+        if self.state == CLOSED:
+            return
+        remaining = self.opened_at + self.cooldown - time.monotonic()
+        if self.state == OPEN and remaining <= 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            # Ett provanrop åt gången avgör om tjänsten är tillbaka
+            self._probing = True
+            return
+        self.rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail="OpenAI svarar inte just nu, försök igen om en stund",
+            headers={"Retry-After": str(max(1, math.ceil(remaining)))},
+        )
+
+    def success(self) -> None:
+        if self.state != CLOSED:
+            logger.info("Kretsbrytaren för %s stängs igen", self.name)
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning("Kretsbrytaren för %s öppnas efter %d fel i rad", self.name, self.failures)
+                self.opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """Provanropet avbröts utan resultat; nästa anrop får prova i stället."""
+        self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(model: str) -> CircuitBreaker:
+    """Delad kretsbrytare för modellen."""
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers[model] = CircuitBreaker(model)
+    return breaker
+
+
+def breakers() -> Dict[str, CircuitBreaker]:
+    """Alla kretsbrytare som skapats hittills, per modell."""
+    return dict(_breakers)
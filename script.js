@@ -5,13 +5,26 @@ document.addEventListener('DOMContentLoaded', () => {
     const recipeContent = document.getElementById('recipe-content');
     const saveRecipeBtn = document.getElementById('save-recipe');
     
+    const loadingText = loadingIndicator.querySelector('p');
+    
     // Använd relativ sökväg för API-anrop oavsett miljö
-    const API_URL = '/generate';
+    const STREAM_URL = '/generate/stream';
+    
+    // Statustexter för stegen som servern rapporterar under strömningen
+    const STAGE_MESSAGES = {
+        received: 'Förfrågan mottagen...',
+        analysing_image: 'Analyserar bilden...',
+        image_analysed: 'Bilden analyserad, skapar recept...',
+        library_match: 'Hittade ett passande recept i biblioteket...',
+        coalesced: 'Ett likadant recept skapas redan, väntar på det...',
+        recipe_generating: 'Genererar recept...'
+    };
     
     form.addEventListener('submit', async (e) => {
         e.preventDefault();
         
         // Visa laddningsindikator
+        loadingText.textContent = 'Genererar recept...';
         loadingIndicator.classList.remove('hidden');
         recipeResult.classList.add('hidden');
         
@@ -19,25 +32,35 @@ document.addEventListener('DOMContentLoaded', () => {
         const formData = new FormData(form);
         
         try {
-            // Skicka till API 
-            const response = await fetch(API_URL, {
+            // Skicka till API och ta emot receptet som en ström
+            const response = await fetch(STREAM_URL, {
                 method: 'POST',
                 body: formData,
+                headers: { 'Accept': 'text/event-stream' }
             });
             
             if (!response.ok) {
                 throw new Error(`Server svarade med statuskod: ${response.status}`);
             }
             
-            const data = await response.json();
+            let recipe;
+            if (response.body && response.body.getReader) {
+                recipe = await readRecipeStream(response);
+            } else {
+                // Fallback för miljöer utan strömmande svar (t.ex. mock_api.js)
+                const data = await response.json();
+                recipe = data.recipe;
+            }
             
-            // Visa receptet
-            if (data.recipe) {
-                recipeContent.innerHTML = formatRecipe(data.recipe);
+            // Visa receptet; strukturerade recept (output=json) renderas direkt från fälten
+            if (recipe) {
+                const structured = typeof recipe === 'object';
+                recipeContent.innerHTML = structured ? renderStructuredRecipe(recipe) : formatRecipe(recipe);
                 recipeResult.classList.remove('hidden');
                 
                 // Spara receptet i sessionStorage för att kunna använda "Spara"-knappen
-                sessionStorage.setItem('currentRecipe', data.recipe);
+                sessionStorage.setItem('currentRecipe', structured ? JSON.stringify(recipe) : recipe);
+                sessionStorage.setItem('currentRecipeFormat', structured ? 'json' : 'text');
                 sessionStorage.setItem('recipeMeta', JSON.stringify({
                     difficulty: formData.get('difficulty'),
                     mealType: formData.get('meal_type'),
@@ -63,6 +86,53 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
     
+    // Läs Server-Sent Events från /generate/stream och rendera receptet allteftersom det skrivs
+    async function readRecipeStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        let recipe = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Händelser avgränsas av en tom rad
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let dataText = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataText += line.slice(5).trim();
+                    }
+                });
+                // Kommentarer (keep-alive) saknar data
+                if (!dataText) continue;
+                const data = JSON.parse(dataText);
+                
+                if (eventName === 'stage') {
+                    loadingText.textContent = STAGE_MESSAGES[data.stage] || loadingText.textContent;
+                } else if (eventName === 'token') {
+                    recipe += data.text;
+                    recipeContent.innerHTML = formatRecipe(recipe);
+                    recipeResult.classList.remove('hidden');
+                } else if (eventName === 'done') {
+                    return data.recipe;
+                } else if (eventName === 'error') {
+                    throw new Error(data.detail || `Server svarade med statuskod: ${data.status}`);
+                }
+            }
+        }
+        return recipe;
+    }
+    
     // Hantera ändring av filtyp baserat på val
     const choiceSelect = document.getElementById('choice');
     const fileInput = document.getElementById('ingredients-file');
@@ -80,6 +150,7 @@ document.addEventListener('DOMContentLoaded', () => {
     if (saveRecipeBtn) {
         saveRecipeBtn.addEventListener('click', () => {
             const recipe = sessionStorage.getItem('currentRecipe');
+            const format = sessionStorage.getItem('currentRecipeFormat') || 'text';
             const meta = JSON.parse(sessionStorage.getItem('recipeMeta') || '{}');
             
             if (!recipe) {
@@ -87,15 +158,21 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
             
-            // Hämta första rubriken som receptnamn
-            const titleMatch = recipe.match(/1\) Förslag på rätt:([\s\S]*?)(?=\n2\)|\n\n|$)/);
-            const title = titleMatch ? titleMatch[1].trim() : 'Namnlöst recept';
+            // Strukturerade recept har ett eget namn, annars används första rubriken
+            let title;
+            if (format === 'json') {
+                title = JSON.parse(recipe).name || 'Namnlöst recept';
+            } else {
+                const titleMatch = recipe.match(/1\) Förslag på rätt:([\s\S]*?)(?=\n2\)|\n\n|$)/);
+                title = titleMatch ? titleMatch[1].trim() : 'Namnlöst recept';
+            }
             
             // Skapa recept-objekt
             const recipeObj = {
                 id: Date.now().toString(),
                 title: title,
                 content: recipe,
+                format: format,
                 date: new Date().toISOString(),
                 meta: meta
             };
@@ -130,4 +207,4 @@ function formatRecipe(recipeText) {
             </div>
         `;
     }).join('');
-} 
\ No newline at end of file
+} 
@@ -0,0 +1,233 @@
+"""
+Fulltextsökning i receptbiblioteket.
+
+Ett inverterat index över titel, ingredienser och instruktioner byggs och
+uppdateras inkrementellt när filer i biblioteket ändras. Tokeniseringen är
+anpassad för svenska: gemener, å/ä/ö viks till a/a/o, vanliga plural- och
+bestämdhetsändelser tas bort och sammansatta ord indexeras även på sina
+efterled, så att "buljong" hittar "grönsaksbuljong".
+"""
+
+import math
+import re
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+_FOLD = str.maketrans({"å": "a", "ä": "a", "ö": "o", "é": "e", "è": "e", "ü": "u"})
+
+# Ändelser som tas bort, längsta först
+_SUFFIXES = (
+    "ornas", "ernas", "arnas",
+    "orna", "erna", "arna", "heten",
+    "ens", "ets", "het",
+    "or", "ar", "er", "en", "et", "na",
+    "a", "e",
+)
+_MIN_STEM = 3
+
+# Efterled i sammansatta ord indexeras för ord med minst så här många tecken
+_COMPOUND_MIN_WORD = 8
+_COMPOUND_MIN_PART = 4
+_COMPOUND_WEIGHT = 0.5
+
+_STOPWORDS = {
+    "och", "med", "i", "pa", "en", "ett", "att", "som", "for", "till", "av",
+    "den", "det", "ar", "om", "eller", "fran", "per", "ca", "st", "msk",
+    "tsk", "dl", "g", "kg", "l", "ml", "krm",
+}
+
+# Vikt per fält vid rankning
+FIELD_WEIGHTS = {"title": 3.0, "ingredients": 2.0, "instructions": 1.0}
+
+# Sökord som är prefix till längre ord i indexet ger en lägre poäng
+_PREFIX_WEIGHT = 0.6
+_PREFIX_MAX_EXPANSIONS = 50
+
+SNIPPET_LENGTH = 160
+
+
+def fold(text: str) -> str:
+    """Gemener och å/ä/ö till a/a/o."""
+    return text.lower().translate(_FOLD)
+
+
+def stem(word: str) -> str:
+    """Tar bort en vanlig svensk plural- eller bestämdhetsändelse."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Delar upp text i normaliserade och stammade sökord."""
+    return [stem(word) for word in _WORD_RE.findall(fold(text)) if word not in _STOPWORDS]
+
+
+def _compound_parts(term: str) -> List[str]:
+    """Möjliga efterled i ett sammansatt ord, t.ex. buljong i gronsaksbuljong."""
+    if len(term) < _COMPOUND_MIN_WORD:
+        return []
+    return [term[i:] for i in range(_COMPOUND_MIN_PART, len(term) - _COMPOUND_MIN_PART + 1)]
+
+
+def split_sections(text: str) -> Dict[str, str]:
+    """
+    Delar en receptfil i titel, ingredienser och instruktioner.
+
+    Klarar både markdown-rubriker (`## Ingredienser (4 portioner)`) och
+    rubriker som slutar med kolon (`Ingredienser:`). Text utan kända
+    rubriker räknas som instruktioner.
+    """
+    lines = text.splitlines()
+    title = lines[0].lstrip("#").strip() if lines else ""
+    sections = {"title": title, "ingredients": [], "instructions": []}
+    current = "instructions"
+    for line in lines[1:]:
+        stripped = line.strip()
+        if stripped.startswith("#"):
+            current = "ingredients" if "ingrediens" in stripped.lower() else "instructions"
+            continue
+        if stripped.endswith(":") and not stripped.startswith("-"):
+            # Löptext som "Receptet innehåller flera ingredienser:" är ingen ingrediensrubrik
+            current = "ingredients" if stripped.lower().startswith("ingrediens") else "instructions"
+            continue
+        sections[current].append(stripped)
+    return {
+        "title": title,
+        "ingredients": "\n".join(sections["ingredients"]),
+        "instructions": "\n".join(sections["instructions"]),
+    }
+
+
+def snippet(lines: List[str], query: str) -> str:
+    """Första raden som innehåller ett av sökorden, annars första raden."""
+    terms = tokenize(query)
+    fallback = ""
+    for line in lines:
+        stripped = line.strip().lstrip("#-").strip()
+        if not stripped:
+            continue
+        fallback = fallback or stripped
+        line_terms = tokenize(stripped)
+        if any(lt.startswith(t) or t in lt for t in terms for lt in line_terms):
+            return stripped[:SNIPPET_LENGTH]
+    return fallback[:SNIPPET_LENGTH]
+
+
+class SearchIndex:
+    """
+    Inverterat index över recepten i ett LibraryIndex.
+
+    `update` registreras som lyssnare på biblioteksindexet och läser bara
+    ändrade filer. Index och sökningar skyddas av ett lås eftersom
+    uppdateringar sker i arbetstrådar medan sökningar görs från event-loopen.
+    """
+
+    def __init__(self, path_for: Callable[[str], Path]):
+        self.path_for = path_for
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._titles: Dict[str, str] = {}
+        self._vocabulary: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def update(self, changed: List[str], removed: List[str]) -> None:
+        """Indexerar om ändrade recept och tar bort raderade. Blockerande."""
+        documents = {}
+        for recipe_id in changed:
+            try:
+                with open(self.path_for(recipe_id), "r", encoding="utf-8") as f:
+                    documents[recipe_id] = f.read()
+            except (OSError, UnicodeDecodeError):
+                removed = list(removed) + [recipe_id]
+        analysed = {recipe_id: self._analyse(text) for recipe_id, text in documents.items()}
+
+        with self._lock:
+            for recipe_id in list(removed) + list(analysed):
+                self._remove(recipe_id)
+            for recipe_id, (title, weights) in analysed.items():
+                self._titles[recipe_id] = title
+                self._doc_terms[recipe_id] = list(weights)
+                for term, weight in weights.items():
+                    self._postings.setdefault(term, {})[recipe_id] = weight
+            # Sorterad ordlista för prefixsökning, byggd här i arbetstråden
+            self._vocabulary = sorted(self._postings)
+
+    def _remove(self, recipe_id: str) -> None:
+        for term in self._doc_terms.pop(recipe_id, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(recipe_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._titles.pop(recipe_id, None)
+
+    @staticmethod
+    def _analyse(text: str) -> Tuple[str, Dict[str, float]]:
+        sections = split_sections(text)
+        weights: Dict[str, float] = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            counts: Dict[str, int] = {}
+            for term in tokenize(sections[field]):
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                score = field_weight * (1 + math.log(count))
+                weights[term] = weights.get(term, 0.0) + score
+                for part in _compound_parts(term):
+                    weights[part] = max(weights.get(part, 0.0), score * _COMPOUND_WEIGHT)
+        return sections["title"], weights
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Sökordet självt plus längre ord i indexet som börjar med det."""
+        matches = [(term, 1.0)] if term in self._postings else []
+        if len(term) >= _MIN_STEM:
+            start = bisect_left(self._vocabulary, term)
+            for candidate in self._vocabulary[start:start + _PREFIX_MAX_EXPANSIONS]:
+                if not candidate.startswith(term):
+                    break
+                if candidate != term:
+                    matches.append((candidate, _PREFIX_WEIGHT))
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> Tuple[List[dict], int]:
+        """
+        Returnerar (träffar, totalt antal träffar) rankade efter relevans.
+
+        Varje träff har id, title och score. Recept som matchar alla sökord
+        rankas före recept som bara matchar några av dem.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+        with self._lock:
+            total_docs = max(len(self._doc_terms), 1)
+            scores: Dict[str, float] = {}
+            matched: Dict[str, int] = {}
+            for term in terms:
+                term_scores: Dict[str, float] = {}
+                for candidate, expansion_weight in self._expand(term):
+                    postings = self._postings[candidate]
+                    idf = math.log(1 + total_docs / len(postings))
+                    for recipe_id, weight in postings.items():
+                        score = idf * weight * expansion_weight
+                        if score > term_scores.get(recipe_id, 0.0):
+                            term_scores[recipe_id] = score
+                for recipe_id, score in term_scores.items():
+                    scores[recipe_id] = scores.get(recipe_id, 0.0) + score
+                    matched[recipe_id] = matched.get(recipe_id, 0) + 1
+            ranked = sorted(
+                ((score * matched[recipe_id] / len(terms), recipe_id) for recipe_id, score in scores.items()),
+                reverse=True,
+            )
+            results = [
+                {"id": recipe_id, "title": self._titles.get(recipe_id, recipe_id), "score": round(score, 4)}
+                for score, recipe_id in ranked[:limit]
+            ]
+        return results, len(ranked)
@@ -0,0 +1,79 @@
+"""
+Sammanslagning av samtidiga identiska anrop (single-flight).
+
+Det första anropet för en nyckel startar arbetet som en egen task; anrop med
+samma nyckel som kommer medan det pågår väntar på samma resultat i stället
+för att göra ett eget anrop mot OpenAI. Arbetet avbryts bara om alla som
+väntar på det har kopplat ner.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """Ett pågående arbete och antalet anrop som väntar på det."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+    async def result(self) -> Any:
+        """Väntar på resultatet. Avbryter arbetet om den sista som väntar avbryts."""
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        except asyncio.CancelledError:
+            if self.waiters == 1 and not self.task.done():
+                self.task.cancel()
+            raise
+        finally:
+            self.waiters -= 1
+
+
+class SingleFlight:
+    """Håller pågående arbeten per nyckel, t.ex. bildens hash eller receptets cachenyckel."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._flights
+
+    def join(self, key: str) -> Optional[Flight]:
+        """Det pågående arbetet för nyckeln, eller None."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.joined += 1
+            logger.info("Slår ihop med pågående %s", self.name)
+        return flight
+
+    def start(self, key: str, func: Callable[[], Awaitable[Any]]) -> Flight:
+        """Startar arbetet för nyckeln. Det tas bort när det är klart."""
+        flight = Flight(asyncio.ensure_future(func()))
+        self._flights[key] = flight
+        self.started += 1
+
+        def done(task: asyncio.Task) -> None:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            # Hämta ett eventuellt fel så att asyncio inte varnar när ingen väntar
+            if not task.cancelled():
+                task.exception()
+
+        flight.task.add_done_callback(done)
+        return flight
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Kör `func` om inget arbete pågår för nyckeln, annars väntar på det."""
+        flight = self.join(key) or self.start(key, func)
+        return await flight.result()
@@ -0,0 +1,196 @@
+"""
+Statiska filer (HTML, CSS och JavaScript) som serveras ur minnet.
+
+Filerna läses in och förkomprimeras en gång vid start. CSS och JavaScript
+får fingeravtrycksadresser (`/assets/styles.<hash>.css`) som cachas som
+`immutable` i ett år, och HTML-sidorna skrivs om så att de pekar på dem.
+Sidorna själva valideras med ETag vid varje besök. I utvecklingsläge
+(STATIC_DEV=1) läses filerna om när deras mtime ändras.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request, Response
+
+from http_cache import COMPRESS_MIN_BYTES, brotli, cached_response, compress, make_etag
+
+# Läs om ändrade filer vid varje förfrågan, för utveckling
+STATIC_DEV = os.getenv("STATIC_DEV", "0").lower() in ("1", "true", "yes")
+STATIC_DIR = os.getenv("STATIC_DIR", ".")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+logger = logging.getLogger(__name__)
+
+# Starlette lägger själv till charset=utf-8 för text/*
+_MEDIA_TYPES = {
+    ".html": "text/html",
+    ".css": "text/css",
+    ".js": "application/javascript; charset=utf-8",
+}
+
+# Filer som frontend består av; annat i projektmappen serveras inte
+ASSET_FILES = (
+    "index.html",
+    "recipes.html",
+    "library_browse.html",
+    "preview.html",
+    "api_bridge.html",
+    "styles.css",
+    "script.js",
+    "recipe_render.js",
+    "recipes.js",
+    "library_browse.js",
+    "mock_api.js",
+)
+
+
+class Asset:
+    """En inläst fil med förkomprimerade varianter och fingeravtryck."""
+
+    def __init__(self, name: str, data: bytes, mtime_ns: int):
+        self.name = name
+        self.data = data
+        self.mtime_ns = mtime_ns
+        self.media_type = _MEDIA_TYPES.get(Path(name).suffix, "application/octet-stream")
+        self.digest = hashlib.sha256(data).hexdigest()[:16]
+        self.etag = make_etag(self.digest)
+        stem, suffix = os.path.splitext(name)
+        self.fingerprinted = f"{stem}.{self.digest[:10]}{suffix}"
+        self.variants: Dict[str, bytes] = {}
+        if len(data) >= COMPRESS_MIN_BYTES:
+            self.variants["gzip"] = compress(data, "gzip")
+            if brotli is not None:
+                self.variants["br"] = compress(data, "br")
+
+    @property
+    def url(self) -> str:
+        return f"/assets/{self.fingerprinted}"
+
+
+class AssetStore:
+    """
+    Håller alla statiska filer i minnet.
+
+    HTML-sidorna byggs efter CSS och JavaScript, så att deras referenser
+    (`href="styles.css"`) kan bytas mot fingeravtrycksadresserna.
+    """
+
+    def __init__(self, directory: str = STATIC_DIR, names: Iterable[str] = ASSET_FILES, dev: bool = STATIC_DEV):
+        self.directory = Path(directory)
+        self.names = tuple(names)
+        self.dev = dev
+        self._assets: Dict[str, Asset] = {}
+        self._by_fingerprint: Dict[str, Asset] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._preload: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self) -> None:
+        """Läser in och komprimerar alla filer. Blockerande."""
+        raw: Dict[str, bytes] = {}
+        mtimes: Dict[str, int] = {}
+        for name in self.names:
+            path = self.directory / name
+            try:
+                mtimes[name] = path.stat().st_mtime_ns
+                raw[name] = path.read_bytes()
+            except OSError as e:
+                logger.warning("Kunde inte läsa statisk fil %s: %s", name, e)
+
+        assets = {
+            name: Asset(name, data, mtimes[name])
+            for name, data in raw.items()
+            if not name.endswith(".html")
+        }
+        preload = {}
+        for name, data in raw.items():
+            if name.endswith(".html"):
+                html, links = self._rewrite(data.decode("utf-8"), assets)
+                assets[name] = Asset(name, html.encode("utf-8"), mtimes[name])
+                preload[name] = ", ".join(links)
+
+        with self._lock:
+            self._assets = assets
+            self._by_fingerprint = {asset.fingerprinted: asset for asset in assets.values()}
+            self._mtimes = mtimes
+            self._preload = preload
+            self._loaded = True
+
+    @staticmethod
+    def _rewrite(html: str, assets: Dict[str, Asset]):
+        """Byter lokala href/src mot fingeravtrycksadresser och samlar preload-länkar."""
+        links = []
+
+        def replace(match):
+            attribute, name = match.group(1), match.group(2)
+            asset = assets.get(name.lstrip("/"))
+            if asset is None:
+                return match.group(0)
+            kind = "style" if name.endswith(".css") else "script"
+            links.append(f"<{asset.url}>; rel=preload; as={kind}")
+            return f'{attribute}="{asset.url}"'
+
+        html = re.sub(r'\b(href|src)="(/?[\w.-]+\.(?:css|js))"', replace, html)
+        return html, links
+
+    def _changed(self) -> bool:
+        for name in self.names:
+            try:
+                mtime = (self.directory / name).stat().st_mtime_ns
+            except OSError:
+                mtime = None
+            if self._mtimes.get(name) != mtime:
+                return True
+        return False
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded or (self.dev and self._changed()):
+            self.load()
+
+    def get(self, name: str) -> Optional[Asset]:
+        self._ensure_loaded()
+        return self._assets.get(name)
+
+    def response(self, request: Request, name: str) -> Response:
+        """Svar för en fil under sitt vanliga namn; valideras med ETag vid varje besök."""
+        asset = self.get(name)
+        if asset is None:
+            return Response(status_code=404)
+        headers = {}
+        if self._preload.get(name):
+            headers["Link"] = self._preload[name]
+        return cached_response(
+            request,
+            asset.data,
+            asset.media_type,
+            asset.etag,
+            headers=headers,
+            variants=asset.variants,
+        )
+
+    def fingerprinted_response(self, request: Request, filename: str) -> Response:
+        """Svar för en fingeravtrycksadress; innehållet ändras aldrig under samma namn."""
+        self._ensure_loaded()
+        asset = self._by_fingerprint.get(filename)
+        if asset is None:
+            return Response(status_code=404)
+        return cached_response(
+            request,
+            asset.data,
+            asset.media_type,
+            asset.etag,
+            cache_control=IMMUTABLE,
+            variants=asset.variants,
+        )
+
+
+# Delad samling för API:et
+static_assets = AssetStore()
@@ -15,14 +15,16 @@ Exempel:
 
 import os
 import sys
-import base64
-import requests
 from dotenv import load_dotenv
-import json
 
 # Ladda miljövariabler
 load_dotenv()
 
+# Samma OpenAI-klient med tidsgränser, återförsök och kretsbrytare som API:et
+import upstream
+from images import encode_data_url
+from prompts import build_recipe_prompt
+
 # Kontrollera om OpenAI API-nyckeln är satt
 if not os.getenv("OPENAI_API_KEY"):
     print("\n⚠️  OPENAI_API_KEY saknas! Skapa en .env-fil med din API-nyckel.")
@@ -39,57 +41,10 @@ def test_with_text_file(filename):
         print(f"\n📝 Läser ingredienser från filen: {filename}")
         print(f"Ingredienser: {ingredients[:100]}...\n")
         
-        # Anropa OpenAI-API:et direkt
-        import openai
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        
-        prompt = f"""
-Nedan finns en lista över tillgängliga varor. Skriv ett recept med fokus på "Longevity" (långt liv) som är:
-- Svårighetsgrad: medel
-- Måltid: middag
-- Antal personer: 2
-- Föredraget kök/stilriktning: 
-- Kostpreferenser: 
-
-Receptet ska innehålla ingredienser som är kända för att främja ett långt och hälsosamt liv, som till exempel:
-- Baljväxter (bönor, linser)
-- Fullkorn
-- Nötter och frön
-- Bär och färska frukter
-- Gröna bladgrönsaker
-- Fisk rik på omega-3 (om inte vegetariskt/veganskt)
-- Fermenterade livsmedel
-- Olivolja och andra hälsosamma fetter
-
-Struktur för svaret:
-1) Förslag på rätt:
-   - En kort kommentar om vad rätten heter, vilket land/ursprung den har, och varför den är bra för ett långt liv.
-
-2) Gör såhär:
-   - En mycket kortfattad beskrivning av hur man tillagar rätten.
-
-3) Ingredienser du har:
-   - Ange vilka av de tillgängliga varorna som används och hur mycket.
-
-4) Har du?:
-   - Lista eventuella småingredienser (salt, peppar, tomatpuré etc.) som inte är avgörande för rätten.
-
-5) Longevity-fördelar:
-   - En kort förklaring om hur ingredienserna i rätten bidrar till ett långt och hälsosamt liv.
-
-Ditt svar ska vara på svenska.
-
-Lista över tillgängliga varor:
-{ingredients}
-"""
+        prompt = build_recipe_prompt(ingredients, "medel", "middag", "2")
         
         print("🔄 Genererar recept, vänta...")
-        response = openai.ChatCompletion.create(
-            model="gpt-4-turbo",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        recipe = response["choices"][0]["message"]["content"]
+        recipe = upstream.run_blocking(upstream.generate_recipe_text, prompt)
         
         print("\n✅ Recept genererat!\n")
         print("-" * 80)
@@ -107,87 +62,19 @@ def test_with_image(filename):
         
         print(f"\n🖼️  Analyserar bild från filen: {filename}")
         
-        # Konvertera bilddata till base64
-        base64_image = base64.b64encode(image_data).decode('utf-8')
-        
-        # Anropa OpenAI-API:et direkt
-        import openai
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+        # Konvertera bilddata till en base64-kodad data-URL
+        image_url = encode_data_url(image_data, "image/jpeg")
         
         print("🔍 Analyserar bilden, vänta...")
-        image_analysis = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text", 
-                            "text": "Detta är en bild av mitt kylskåp. Lista alla ingredienser och råvaror du kan identifiera i bilden. Var specifik och detaljerad. Lista råvarorna på svenska."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ]
-        )
-        
-        ingredients = image_analysis["choices"][0]["message"]["content"]
+        ingredients = upstream.run_blocking(upstream.analyze_fridge_image, image_url)
         
         print(f"\n🧪 Identifierade ingredienser: {ingredients[:100]}...\n")
         
         # Generera recept baserat på identifierade ingredienser
-        prompt = f"""
-Nedan finns en lista över tillgängliga varor. Skriv ett recept med fokus på "Longevity" (långt liv) som är:
-- Svårighetsgrad: medel
-- Måltid: middag
-- Antal personer: 2
-- Föredraget kök/stilriktning: 
-- Kostpreferenser: 
-
-Receptet ska innehålla ingredienser som är kända för att främja ett långt och hälsosamt liv, som till exempel:
-- Baljväxter (bönor, linser)
-- Fullkorn
-- Nötter och frön
-- Bär och färska frukter
-- Gröna bladgrönsaker
-- Fisk rik på omega-3 (om inte vegetariskt/veganskt)
-- Fermenterade livsmedel
-- Olivolja och andra hälsosamma fetter
-
-Struktur för svaret:
-1) Förslag på rätt:
-   - En kort kommentar om vad rätten heter, vilket land/ursprung den har, och varför den är bra för ett långt liv.
-
-2) Gör såhär:
-   - En mycket kortfattad beskrivning av hur man tillagar rätten.
-
-3) Ingredienser du har:
-   - Ange vilka av de tillgängliga varorna som används och hur mycket.
-
-4) Har du?:
-   - Lista eventuella småingredienser (salt, peppar, tomatpuré etc.) som inte är avgörande för rätten.
-
-5) Longevity-fördelar:
-   - En kort förklaring om hur ingredienserna i rätten bidrar till ett långt och hälsosamt liv.
-
-Ditt svar ska vara på svenska.
-
-Lista över tillgängliga varor:
-{ingredients}
-"""
+        prompt = build_recipe_prompt(ingredients, "medel", "middag", "2")
         
         print("🔄 Genererar recept, vänta...")
-        response = openai.ChatCompletion.create(
-            model="gpt-4-turbo",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        recipe = response["choices"][0]["message"]["content"]
+        recipe = upstream.run_blocking(upstream.generate_recipe_text, prompt)
         
         print("\n✅ Recept genererat!\n")
         print("-" * 80)
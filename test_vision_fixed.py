@@ -1,13 +1,11 @@
-from openai import OpenAI
-import base64
-import os
 from dotenv import load_dotenv
 
 # Ladda miljövariabler
 load_dotenv()
 
-# Konfigurera OpenAI-klienten
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Samma OpenAI-klient med tidsgränser, återförsök och kretsbrytare som API:et
+import upstream
+from images import encode_data_url
 
 # Sökväg till testbild
 image_path = "kyl.jpg"  # Lägg din testbild i samma mapp som skriptet
@@ -15,20 +13,21 @@ image_path = "kyl.jpg"  # Lägg din testbild i samma mapp som skriptet
 # Läs in och koda bilden
 def encode_image(file_path):
     with open(file_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode("utf-8")
+        return encode_data_url(img_file.read(), "image/jpeg")
 
 try:
-    base64_image = encode_image(image_path)
-    print(f"✅ Bild läst och kodad. Längd: {len(base64_image)} tecken")
+    image_url = encode_image(image_path)
+    print(f"✅ Bild läst och kodad. Längd: {len(image_url)} tecken")
 except Exception as e:
     print(f"❌ Kunde inte läsa bilden: {e}")
     exit(1)
 
 # Anropa API med bild
 try:
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+    answer = upstream.run_blocking(
+        upstream.complete,
+        upstream.VISION_MODEL,
+        [
             {
                 "role": "user",
                 "content": [
@@ -39,15 +38,16 @@ try:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
+                            "url": image_url
                         }
                     }
                 ]
             }
         ],
-        max_tokens=300
+        estimated_tokens=1500,
+        max_tokens=300,
     )
     print("✅ API-anrop lyckades!")
-    print(f"Svar: {response.choices[0].message.content}")
+    print(f"Svar: {answer}")
 except Exception as e:
-    print(f"❌ API-anrop misslyckades: {e}") 
\ No newline at end of file
+    print(f"❌ API-anrop misslyckades: {e}")
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modulerna ligger direkt i projektroten
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,47 @@
+"""Normaliseringen av varulistan i receptprompten (prompts.py)."""
+
+import pytest
+
+from prompts import prepare_inventory
+
+
+@pytest.mark.parametrize("varulista, expected", [
+    # Text efter kommatecken hör till raden
+    ("Mjölk, ost, ägg\nMjölk, bröd", "Mjölk, ost, ägg\nMjölk, bröd"),
+    # Beskrivningar som färg och tillagning skiljer varorna åt
+    ("- Röd paprika\n- Grön paprika", "Röd paprika\nGrön paprika"),
+    ("2 röd paprika\n1 gul paprika", "2 röd paprika\n1 gul paprika"),
+    ("Lax\nLax (rökt)", "Lax\nLax (rökt)"),
+    ("500 g kycklingfilé\n300 g kycklinglår", "500 g kycklingfilé\n300 g kycklinglår"),
+])
+def test_different_items_are_kept(varulista, expected):
+    assert prepare_inventory(varulista) == expected
+
+
+@pytest.mark.parametrize("varulista, expected", [
+    ("2 ägg\n3 Ägg", "5 ägg"),
+    ("200 g lax\n1 kg lax\n100 g lax", "300 g lax\n1 kg lax"),
+    # En rad utan mängd efter samma vara är en dubblett
+    ("6 ägg\nÄgg", "6 ägg"),
+    # och ersätts av en senare rad med mängd, på sin plats
+    ("Ägg\nMjölk\n6 ägg", "6 ägg\nMjölk"),
+])
+def test_same_items_are_merged(varulista, expected):
+    assert prepare_inventory(varulista) == expected
+
+
+def test_headings_and_blank_lines_are_removed():
+    assert prepare_inventory("Kylskåp:\n\n* Äpple\n  \n- Smör") == "Äpple\nSmör"
+
+
+@pytest.mark.parametrize("varulista, expected", [
+    # Böjningsformer av samma råvara i vocabulary.py
+    ("3 morötter\n2 morot", "5 morötter"),
+    ("2 st morötter\nMorot", "2 st morötter"),
+    ("Laxar\n2 lax", "2 lax"),
+    # men inte sorter som råkar vara synonymer till samma råvara
+    ("200 g kyckling\n300 g kycklinglår", "200 g kyckling\n300 g kycklinglår"),
+    ("2 paprikor\n1 röd paprika", "2 paprikor\n1 röd paprika"),
+])
+def test_inflected_forms_are_merged(varulista, expected):
+    assert prepare_inventory(varulista) == expected
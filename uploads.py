@@ -0,0 +1,163 @@
+"""
+Begränsad hantering av uppladdade filer.
+
+Förfrågningar med för stor kropp avvisas med 413 redan innan de buffras,
+och uppladdningar läses i bitar från Starlettes spoolade temporärfil med en
+storleksgräns per filtyp. Filen hålls sedan i en enda buffert som skickas
+vidare utan att kopieras.
+"""
+
+import io
+import os
+from typing import Iterable, Optional, Union
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+import metrics
+
+# Max storlek per filtyp, styrs av formulärfältet choice
+MAX_TEXT_UPLOAD_BYTES = int(os.getenv("MAX_TEXT_UPLOAD_BYTES", 1024 * 1024))
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", 15 * 1024 * 1024))
+UPLOAD_LIMITS = {
+    "1": MAX_TEXT_UPLOAD_BYTES,
+    "2": MAX_IMAGE_UPLOAD_BYTES,
+}
+
+# Utrymme för övriga formulärfält och multipart-gränser utöver själva filen
+FORM_OVERHEAD_BYTES = 64 * 1024
+MAX_REQUEST_BYTES = max(UPLOAD_LIMITS.values()) + FORM_OVERHEAD_BYTES
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+def _format_bytes(n: int) -> str:
+    if n >= 1024 * 1024:
+        return f"{n / (1024 * 1024):.1f} MB"
+    if n >= 1024:
+        return f"{n // 1024} KB"
+    return f"{n} byte"
+
+
+def _too_large(limit: int, what: str = "Filen") -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{what} är för stor (max {_format_bytes(limit)})",
+    )
+
+
+async def read_upload(file: UploadFile, limit: int) -> bytearray:
+    """
+    Läser en uppladdad fil i bitar och avbryter med 413 om den överskrider `limit`.
+
+    Starlette har redan spoolat filen till minne eller disk; den läses här i
+    block till en buffert som aldrig växer över gränsen. Bufferten returneras
+    som den är; öppna den med `BufferReader` i stället för io.BytesIO, som
+    kopierar en bytearray.
+    """
+    if file.size is not None and file.size > limit:
+        raise _too_large(limit)
+    buffer = bytearray()
+    with metrics.stage("upload_read"):
+        while True:
+            chunk = await file.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            if len(buffer) + len(chunk) > limit:
+                raise _too_large(limit)
+            buffer += chunk
+    return buffer
+
+
+class BufferReader(io.RawIOBase):
+    """Läsbart och sökbart filobjekt direkt över en buffert, utan kopia."""
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        super().__init__()
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError("Negativ position")
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        # Släpp vyn så att bufferten inte längre är låst
+        self._view.release()
+        super().close()
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI-middleware som begränsar storleken på POST-kroppar för vissa sökvägar.
+
+    Är Content-Length för stor svarar den direkt med 413 utan att läsa kroppen.
+    Saknas Content-Length (chunked) räknas mottagna byte och formulärtolkningen
+    avbryts med 413 så snart gränsen passeras.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES, paths: Iterable[str] = ("/generate",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = self._content_length(scope)
+        if content_length is not None and content_length > self.max_bytes:
+            error = _too_large(self.max_bytes, "Förfrågan")
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI släpper igenom HTTPException från formulärtolkningen
+                    raise _too_large(self.max_bytes, "Förfrågan")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _content_length(scope) -> Optional[int]:
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
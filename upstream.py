@@ -0,0 +1,309 @@
+"""
+Delad asynkron OpenAI-klient för Longevity Receptgenerator.
+
+Alla anrop mot OpenAI går genom en gemensam AsyncOpenAI-klient med en poolad
+HTTP-anslutning, så att ett långsamt modellanrop inte blockerar event-loopen
+och servern kan ha många genereringar igång samtidigt. Anslutningen har
+uttryckliga tidsgränser, tillfälliga fel försöks om med backoff och en
+kretsbrytare per modell avvisar anrop direkt när OpenAI inte svarar
+(se resilience.py). API:et, all_in_one.py och testskripten använder alla
+den här modulen.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+import httpx
+from fastapi import HTTPException
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, RateLimitError
+
+from admission import estimate_tokens, limiter_for
+from resilience import MAX_RETRIES, backoff_delay, breaker_for
+from hedging import recipe_hedger
+from recipe_schema import RECIPE_SCHEMA, validate_recipe
+import metrics
+
+# Modeller som används i de olika stegen
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4o")
+RECIPE_MODEL = os.getenv("RECIPE_MODEL", "gpt-4-turbo")
+# Modell för säkrande anrop när receptmodellen dröjer (hedging.py), t.ex. gpt-4o-mini
+HEDGE_MODEL = os.getenv("HEDGE_MODEL", "") or RECIPE_MODEL
+# Modell för strukturerade recept (output=json); måste stödja response_format med json_schema
+RECIPE_JSON_MODEL = os.getenv("RECIPE_JSON_MODEL", "gpt-4o")
+
+# Storlek på anslutningspoolen mot OpenAI
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 30))
+
+# Tidsgränser i sekunder; läsgränsen gäller tiden mellan två mottagna bitar,
+# så en strömmande generering kan pågå längre än så
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", 60))
+WRITE_TIMEOUT = float(os.getenv("OPENAI_WRITE_TIMEOUT", 30))
+POOL_TIMEOUT = float(os.getenv("OPENAI_POOL_TIMEOUT", 10))
+
+# Fel som kan bero på en tillfällig störning och därför försöks om
+_RETRYABLE = (APIConnectionError, InternalServerError)
+
+# Uppskattade svarstokens per anrop, för tillträdeskontrollen
+VISION_MAX_TOKENS = 500
+RECIPE_COMPLETION_ESTIMATE = 1500
+# Ett strukturerat recept saknar rubriker och utfyllnad och är därför kortare
+RECIPE_JSON_MAX_TOKENS = int(os.getenv("RECIPE_JSON_MAX_TOKENS", 900))
+# Ungefärligt antal tokens för en bild med detail=low respektive high
+_IMAGE_TOKENS = {"low": 85, "high": 1105, "auto": 1105}
+
+VISION_PROMPT = (
+    "Detta är en bild av mitt kylskåp. Lista alla ingredienser och råvaror du kan "
+    "identifiera i bilden. Var specifik och detaljerad. Lista råvarorna på svenska."
+)
+
+_client: Optional[AsyncOpenAI] = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_client() -> AsyncOpenAI:
+    """Returnerar den delade klienten och skapar den vid första anropet."""
+    global _client
+    if _client is None:
+        timeout = httpx.Timeout(
+            connect=CONNECT_TIMEOUT,
+            read=READ_TIMEOUT,
+            write=WRITE_TIMEOUT,
+            pool=POOL_TIMEOUT,
+        )
+        http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+        # Återförsöken sköts av _request, inte av klientbiblioteket
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            timeout=timeout,
+            max_retries=0,
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Stänger klienten och dess anslutningspool (anropas vid nedstängning)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def run_blocking(func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+    """Kör ett anrop från synkron kod, t.ex. testskripten, och stänger klienten efteråt."""
+    async def run() -> Any:
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            await close_client()
+    return asyncio.run(run())
+
+
+def _retry_after(error: RateLimitError) -> Optional[float]:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _upstream_error(error: Exception) -> HTTPException:
+    """Översätter ett fel som inte gick att försöka bort till ett svar för klienten."""
+    if isinstance(error, (APITimeoutError, httpx.TimeoutException)):
+        return HTTPException(status_code=504, detail="OpenAI svarade inte i tid, försök igen")
+    return HTTPException(status_code=502, detail="Fel vid anrop till OpenAI, försök igen om en stund")
+
+
+@asynccontextmanager
+async def _request(model: str, estimated_tokens: int, create: Callable[[], Awaitable[Any]]) -> AsyncIterator[Any]:
+    """
+    Gör anropet `create` med tillträdeskontroll, återförsök och kretsbrytare.
+
+    Platsen i begränsaren hålls medan blocket körs, t.ex. under en hel ström.
+    Väntan mellan återförsöken sker utan plats, så att andra anrop kan köras.
+    """
+    limiter = limiter_for(model)
+    breaker = breaker_for(model)
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            async with limiter.slot(estimated_tokens):
+                try:
+                    response = await create()
+                except RateLimitError as e:
+                    metrics.OPENAI_ERRORS.inc(model, type(e).__name__)
+                    raise limiter.rate_limited(_retry_after(e))
+                except _RETRYABLE as e:
+                    metrics.OPENAI_ERRORS.inc(model, type(e).__name__)
+                    breaker.failure()
+                    error = e
+                else:
+                    breaker.success()
+                    yield response
+                    return
+        finally:
+            # Avbrutna eller avvisade provanrop ska inte låsa brytaren
+            breaker.release()
+
+        if attempt >= MAX_RETRIES:
+            logger.error("Anrop till %s misslyckades efter %d försök: %s", model, attempt + 1, error)
+            raise _upstream_error(error)
+        delay = backoff_delay(attempt)
+        attempt += 1
+        logger.warning("Tillfälligt fel från %s (%s), försöker igen om %.1f s", model, type(error).__name__, delay)
+        await asyncio.sleep(delay)
+
+
+async def complete(model: str, messages: List[dict], estimated_tokens: int, **kwargs: Any) -> str:
+    """Ett chat-anrop genom samma begränsning, återförsök och kretsbrytare som API:et."""
+    async with _request(
+        model,
+        estimated_tokens,
+        lambda: get_client().chat.completions.create(model=model, messages=messages, **kwargs),
+    ) as response:
+        metrics.record_usage(model, response.usage)
+        return response.choices[0].message.content
+
+
+async def analyze_fridge_image(image_url: str, detail: str = "auto", prompt: str = VISION_PROMPT) -> str:
+    """Låter vision-modellen lista råvarorna i en kylskåpsbild (data-URL eller länk)."""
+    estimated = estimate_tokens(prompt, VISION_MAX_TOKENS) + _IMAGE_TOKENS.get(detail, _IMAGE_TOKENS["auto"])
+    return await complete(
+        VISION_MODEL,
+        [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": image_url, "detail": detail},
+                    },
+                ],
+            }
+        ],
+        estimated,
+        max_tokens=VISION_MAX_TOKENS,
+    )
+
+
+async def generate_recipe_text(prompt: str) -> str:
+    """
+    Skickar receptprompten till receptmodellen och returnerar svaret.
+
+    Med HEDGE_ENABLED strömmas svaret internt, så att ett säkrande anrop mot
+    HEDGE_MODEL kan startas om första token dröjer; det svar som blir klart
+    först används.
+    """
+    if recipe_hedger.enabled:
+        return await recipe_hedger.first_finished(
+            lambda first: _collect(RECIPE_MODEL, prompt, first),
+            lambda first: _collect(HEDGE_MODEL, prompt, first),
+        )
+    return await complete(
+        RECIPE_MODEL,
+        [{"role": "user", "content": prompt}],
+        estimate_tokens(prompt, RECIPE_COMPLETION_ESTIMATE),
+    )
+
+
+async def generate_recipe_json(prompt: str) -> dict:
+    """
+    Skickar receptprompten till RECIPE_JSON_MODEL och returnerar receptet som
+    ett objekt enligt RECIPE_SCHEMA.
+
+    Modellen tvingas svara enligt schemat; ett svar som ändå inte går att tolka,
+    t.ex. för att det kapats vid max_tokens, ger 502.
+    """
+    content = await complete(
+        RECIPE_JSON_MODEL,
+        [{"role": "user", "content": prompt}],
+        estimate_tokens(prompt, RECIPE_JSON_MAX_TOKENS),
+        max_tokens=RECIPE_JSON_MAX_TOKENS,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "recipe", "schema": RECIPE_SCHEMA, "strict": True},
+        },
+    )
+    try:
+        return validate_recipe(json.loads(content or ""))
+    except ValueError as e:
+        logger.warning("Ogiltigt strukturerat recept från %s: %s", RECIPE_JSON_MODEL, e)
+        raise HTTPException(status_code=502, detail="Modellen svarade inte med ett giltigt recept, försök igen")
+
+
+async def stream_recipe_text(prompt: str) -> AsyncIterator[str]:
+    """
+    Strömmar receptmodellens svar som textbitar allteftersom de genereras.
+
+    Med HEDGE_ENABLED används den av receptmodellen och HEDGE_MODEL som
+    skickar sin första token först.
+    """
+    if recipe_hedger.enabled:
+        stream = recipe_hedger.first_token(
+            _stream_model(RECIPE_MODEL, prompt),
+            lambda: _stream_model(HEDGE_MODEL, prompt),
+        )
+    else:
+        stream = _stream_model(RECIPE_MODEL, prompt)
+    try:
+        async for delta in stream:
+            yield delta
+    finally:
+        await stream.aclose()
+
+
+async def _collect(model: str, prompt: str, first: asyncio.Event) -> str:
+    """Strömmar ett helt svar från modellen och sätter `first` vid första token."""
+    parts = []
+    async for delta in _stream_model(model, prompt):
+        first.set()
+        parts.append(delta)
+    return "".join(parts)
+
+
+async def _stream_model(model: str, prompt: str) -> AsyncIterator[str]:
+    """
+    Strömmar en modells svar på prompten.
+
+    Bara öppnandet av strömmen försöks om; ett fel mitt i strömmen går till
+    anroparen, eftersom de bitar som redan skickats inte kan tas tillbaka.
+    """
+    create = lambda: get_client().chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        # Sista biten innehåller då tokenförbrukningen
+        stream_options={"include_usage": True},
+    )
+    # Platsen hålls tills strömmen är slut, så att taket för samtidiga anrop gäller även här
+    async with _request(model, estimate_tokens(prompt, RECIPE_COMPLETION_ESTIMATE), create) as stream:
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    metrics.record_usage(model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except (httpx.HTTPError, *_RETRYABLE) as e:
+            metrics.OPENAI_ERRORS.inc(model, type(e).__name__)
+            breaker_for(model).failure()
+            logger.warning("Strömmen från %s avbröts: %s", model, e)
+            raise _upstream_error(e)
+        finally:
+            # Stäng HTTP-svaret om konsumenten avbryter strömmen i förtid
+            await stream.response.aclose()
@@ -0,0 +1,322 @@
+"""
+Kanoniskt ordförråd för svenska råvaror.
+
+Varje råvara har ett id (grundformen i singular, t.ex. "morot") och ett antal
+former och synonymer. Plural- och bestämda former ("morötter", "moroten",
+"morötterna") genereras ur formerna med vanliga svenska ändelser. Alla former
+kompileras en gång till en Aho-Corasick-automat, så att en varulista, ett
+svar från bildanalysen eller en ingrediensrad kan översättas till en
+sorterad mängd id:n i en enda genomläsning av texten.
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from search import fold
+
+# Id -> former och synonymer utöver id:t självt. Oregelbundna pluraler och
+# vanliga sammansättningar anges uttryckligen; regelbundna ändelser läggs till
+# automatiskt.
+INGREDIENTS: Dict[str, Sequence[str]] = {
+    # Grönsaker och rotfrukter
+    "morot": ("morötter", "morotter"),
+    "potatis": ("potatisar", "färskpotatis", "mandelpotatis"),
+    "sötpotatis": ("sötpotatisar",),
+    "lök": ("gul lök", "gullök", "lökar"),
+    "rödlök": ("röd lök", "rödlökar"),
+    "schalottenlök": ("schalottenlökar", "schalotten"),
+    "purjolök": ("purjo", "purjolökar"),
+    "salladslök": ("salladslökar", "vårlök"),
+    "vitlök": ("vitlöksklyfta", "vitlöksklyftor", "vitlöksklyftan", "vitlöksklyftorna", "vitlökar"),
+    "tomat": ("tomater", "körsbärstomat", "körsbärstomater", "cocktailtomat", "cocktailtomater",
+              "plommontomat", "plommontomater"),
+    "krossade tomater": ("krossad tomat", "tomatkross"),
+    "tomatpuré": ("tomatpure",),
+    "gurka": ("gurkor", "slanggurka"),
+    "paprika": ("paprikor", "röd paprika", "gul paprika", "grön paprika"),
+    "chili": ("chilifrukt", "chilifrukter", "chilipeppar"),
+    "zucchini": ("zucchinis", "squash"),
+    "aubergine": ("auberginer",),
+    "broccoli": ("broccolin",),
+    "blomkål": ("blomkålshuvud",),
+    "vitkål": ("kål", "kålhuvud"),
+    "rödkål": (),
+    "grönkål": (),
+    "brysselkål": (),
+    "spenat": ("babyspenat", "bladspenat"),
+    "sallad": ("isbergssallad", "romansallad", "sallat", "salladshuvud"),
+    "ruccola": ("rucola", "rucolasallad"),
+    "selleri": ("blekselleri", "stjälkselleri", "rotselleri", "selleristjälk", "selleristjälkar"),
+    "palsternacka": ("palsternackor",),
+    "rödbeta": ("rödbetor",),
+    "kålrot": ("kålrötter",),
+    "fänkål": (),
+    "sparris": ("sparrisar",),
+    "majs": ("majskolv", "majskolvar", "sockermajs"),
+    "ärtor": ("ärta", "gröna ärtor", "ärter", "sockerärtor"),
+    "haricots verts": ("haricot verts", "gröna bönor"),
+    "svamp": ("svampar", "champinjon", "champinjoner", "skogschampinjoner", "kantarell", "kantareller"),
+    "avokado": ("avokador", "avocado"),
+    "ingefära": ("ingefärsrot",),
+    "pumpa": ("pumpor", "butternutpumpa"),
+    "rädisa": ("rädisor",),
+    "oliv": ("oliver", "kalamataoliver"),
+    # Frukt och bär
+    "äpple": ("äpplen", "äpplet"),
+    "päron": (),
+    "banan": ("bananer",),
+    "citron": ("citroner", "citronsaft", "citronskal"),
+    "lime": ("limefrukt", "limefrukter", "limesaft"),
+    "apelsin": ("apelsiner",),
+    "blåbär": (),
+    "hallon": (),
+    "jordgubbe": ("jordgubbar",),
+    "lingon": (),
+    "vindruva": ("vindruvor", "druvor"),
+    "mango": ("mangos", "mangor"),
+    "granatäpple": ("granatäpplen", "granatäppelkärnor"),
+    "russin": (),
+    "dadel": ("dadlar",),
+    # Baljväxter, spannmål och fröer
+    "linser": ("lins", "röda linser", "gröna linser", "belugalinser"),
+    "kikärtor": ("kikärta", "kikärter"),
+    "bönor": ("böna", "vita bönor", "svarta bönor", "kidneybönor", "bruna bönor"),
+    "edamame": ("edamamebönor", "sojabönor"),
+    "quinoa": (),
+    "havregryn": ("havre",),
+    "ris": ("jasminris", "basmatiris", "fullkornsris", "råris", "risotto ris", "arborioris"),
+    "pasta": ("spaghetti", "penne", "fusilli", "makaroner", "fullkornspasta", "tagliatelle"),
+    "nudlar": ("nudel", "risnudlar", "äggnudlar"),
+    "bulgur": (),
+    "couscous": (),
+    "korngryn": ("matkorn",),
+    "bröd": ("fullkornsbröd", "rågbröd", "surdegsbröd", "knäckebröd"),
+    "tortilla": ("tortillas", "tortillabröd"),
+    "vetemjöl": ("mjöl",),
+    "chiafrön": ("chiafrö", "chia"),
+    "linfrön": ("linfrö",),
+    "solrosfrön": ("solrosfrö", "solroskärnor"),
+    "pumpafrön": ("pumpakärnor",),
+    "sesamfrön": ("sesamfrö", "sesam"),
+    "mandel": ("mandlar", "mandelspån"),
+    "valnöt": ("valnötter",),
+    "cashewnöt": ("cashewnötter", "cashew"),
+    "hasselnöt": ("hasselnötter",),
+    "pinjenöt": ("pinjenötter", "pinjekärnor"),
+    "jordnöt": ("jordnötter",),
+    "jordnötssmör": (),
+    "tahini": ("sesampasta",),
+    # Mejeri och ägg
+    "ägg": ("hönsägg",),
+    "mjölk": ("standardmjölk", "mellanmjölk", "lättmjölk"),
+    "havremjölk": ("havredryck",),
+    "mandelmjölk": ("mandeldryck",),
+    "sojamjölk": ("sojadryck",),
+    "grädde": ("vispgrädde", "matlagningsgrädde"),
+    "crème fraiche": ("creme fraiche", "crème fraîche"),
+    "gräddfil": (),
+    "yoghurt": ("grekisk yoghurt", "turkisk yoghurt", "naturell yoghurt", "yogurt"),
+    "kvarg": ("kesella",),
+    "keso": ("cottage cheese",),
+    "ost": ("hårdost", "prästost", "herrgårdsost", "riven ost", "ostar"),
+    "parmesan": ("parmesanost", "parmigiano"),
+    "fetaost": ("feta", "fetaostar"),
+    "mozzarella": ("mozzarellaost",),
+    "halloumi": (),
+    "smör": ("bregott",),
+    # Fisk, kött och protein
+    "lax": ("laxfilé", "laxfiléer", "laxar"),
+    "torsk": ("torskfilé", "torskfiléer", "torskrygg"),
+    "makrill": ("makrillfilé",),
+    "sill": ("inlagd sill", "sillfilé"),
+    "tonfisk": ("tonfisk i vatten", "tonfisk i olja"),
+    "räkor": ("räka", "handskalade räkor"),
+    "musslor": ("mussla", "blåmusslor"),
+    "kyckling": ("kycklingfilé", "kycklingfiléer", "kycklingbröst", "kycklinglår", "kycklingklubbor"),
+    "nötfärs": ("köttfärs", "blandfärs", "färs"),
+    "nötkött": ("högrev", "entrecote", "oxfilé"),
+    "fläskkött": ("fläskfilé", "fläskkotlett", "fläskkotletter"),
+    "bacon": (),
+    "skinka": ("rökt skinka", "kokt skinka"),
+    "korv": ("korvar", "falukorv", "prinskorv"),
+    "tofu": (),
+    "tempeh": (),
+    "sojafärs": ("vegofärs",),
+    # Kryddor, örter och skafferi
+    "basilika": ("basilikablad",),
+    "persilja": ("bladpersilja",),
+    "koriander": ("korianderblad",),
+    "dill": (),
+    "gräslök": (),
+    "mynta": ("myntablad",),
+    "rosmarin": (),
+    "timjan": (),
+    "oregano": (),
+    "gurkmeja": (),
+    "spiskummin": ("kummin",),
+    "kanel": (),
+    "kardemumma": (),
+    "paprikapulver": ("rökt paprikapulver",),
+    "chiliflakes": ("chiliflingor",),
+    "vanilj": ("vaniljpulver", "vaniljsocker", "vaniljstång"),
+    "buljong": ("buljongtärning", "buljongtärningar", "grönsaksbuljong", "kycklingbuljong",
+                "hönsbuljong", "fond", "grönsaksfond"),
+    "kokosmjölk": ("kokosgrädde",),
+    "sojasås": ("soja", "tamari"),
+    "senap": ("dijonsenap",),
+    "honung": (),
+    "sylt": (),
+    "olivolja": ("extra virgin olivolja",),
+    "rapsolja": (),
+    "olja": ("matolja", "sesamolja", "kokosolja"),
+    "vinäger": ("balsamvinäger", "äppelcidervinäger", "vitvinsvinäger", "ättika"),
+    "salt": ("havssalt", "flingsalt"),
+    "peppar": ("svartpeppar", "vitpeppar", "nymalen svartpeppar"),
+    "socker": ("strösocker", "farinsocker", "rörsocker"),
+    "surkål": ("kimchi",),
+    "kapris": (),
+    "pesto": (),
+}
+
+# Ändelser för plural- och bestämda former, som läggs till varje form
+_ENDINGS = ("", "n", "en", "t", "et", "r", "ar", "er", "or", "na", "arna", "erna", "orna", "rna")
+_MIN_FORM = 3
+# Ändelser som gör en synonym till en böjningsform av id:t ("morötter", "laxar")
+# i stället för en egen sort ("kycklinglår", "röd paprika")
+_INFLECTIONS = set(_ENDINGS) | {"s", "ter", "terna"}
+# Vid stamväxling ("mandel" - "mandlar", "ärtor" - "ärta") räknas även dessa
+_STEM_INFLECTIONS = _INFLECTIONS | {"a", "lar"}
+
+
+def _forms(name: str) -> Iterable[str]:
+    base = fold(name)
+    for ending in _ENDINGS:
+        yield base + ending
+
+
+def _is_inflection(name: str, canonical: str) -> bool:
+    """Om namnet är en böjnings- eller stavningsform av id:t och inte en egen sort."""
+    form, base = fold(name).replace(" ", ""), fold(canonical).replace(" ", "")
+    shared = len(os.path.commonprefix([form, base]))
+    if shared < _MIN_FORM or shared < len(base) - 2:
+        return False
+    rest = form[shared:]
+    return rest in (_INFLECTIONS if shared == len(base) else _STEM_INFLECTIONS)
+
+
+class Vocabulary:
+    """
+    Aho-Corasick-automat över alla former i ordförrådet.
+
+    Texten viks till gemener utan å/ä/ö innan den läses, och en träff räknas
+    bara om den börjar och slutar vid en ordgräns. Överlappande träffar löses
+    genom att den längsta vinner ("röda linser" före "linser").
+    """
+
+    def __init__(self, ingredients: Dict[str, Sequence[str]] = INGREDIENTS):
+        self.ids = sorted(ingredients)
+        # Tillståndsmaskin: övergångar, fail-länkar och träffar (längd, id) per tillstånd
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str]]] = [[]]
+        forms: Dict[str, str] = {}
+        owners: Dict[str, Set[str]] = {}
+        inflected: Dict[str, str] = {}
+        for canonical, synonyms in ingredients.items():
+            for name in (canonical, *synonyms):
+                for form in _forms(name):
+                    # En uttrycklig form för en annan råvara går före en genererad
+                    if len(form) >= _MIN_FORM and (form not in forms or form == fold(name)):
+                        forms[form] = canonical
+                    owners.setdefault(form, set()).add(canonical)
+                    if name == canonical or _is_inflection(name, canonical):
+                        inflected[form] = canonical
+        # Hela namn som bara kan vara en råvara, för att slå ihop rader i varulistor
+        self._surface = {form: canonical for form, canonical in inflected.items() if len(owners[form]) == 1}
+        for form, canonical in forms.items():
+            self._add(form, canonical)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _add(self, form: str, canonical: str) -> None:
+        state = 0
+        for char in form:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state] = [(len(form), canonical)]
+
+    def _build(self) -> None:
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Träffar i texten som (start, slut, id), i textens ordning utan överlapp."""
+        folded = fold(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        state = 0
+        for end, char in enumerate(folded, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, canonical in out[state]:
+                start = end - length
+                if (start == 0 or not folded[start - 1].isalpha()) and (
+                    end == len(folded) or not folded[end].isalpha()
+                ):
+                    matches.append((start, end, canonical))
+
+        # Längsta träffen vinner vid överlapp
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        result = []
+        last_end = 0
+        for match in matches:
+            if match[0] >= last_end:
+                result.append(match)
+                last_end = match[1]
+        return result
+
+    def canonicalize(self, text: str) -> List[str]:
+        """Sorterade id:n för alla råvaror som nämns i texten."""
+        return sorted({canonical for _, _, canonical in self.find(text)})
+
+    def surface_form(self, name: str) -> Optional[str]:
+        """
+        Id om hela namnet är en form av exakt en råvara, t.ex. "Morötter" -> "morot".
+
+        Egna sorter bland synonymerna ("kycklinglår", "röd paprika") och namn
+        med fler ord ("morötter (i lådan)") ger None.
+        """
+        return self._surface.get(" ".join(fold(name).split()))
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Id för ett enskilt ingrediensnamn; vid flera träffar den längsta."""
+        matches = self.find(name)
+        if not matches:
+            return None
+        return max(matches, key=lambda match: match[1] - match[0])[2]
+
+
+# Kompileras en gång vid import
+vocabulary = Vocabulary()
+
+
+def canonical_ingredients(text: str) -> List[str]:
+    """Sorterade kanoniska id:n för råvarorna i en varulista eller ett svar från bildanalysen."""
+    return vocabulary.canonicalize(text)